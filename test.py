@@ -1,32 +1,51 @@
 import streamlit as st
-from openai import OpenAI
+from openai import OpenAI, AsyncOpenAI
 import fitz  # PyMuPDF
-from docx import Document
 from PIL import Image
 import io
+import os
 import base64
 import json
 import requests
+import httpx
 from threading import Event, Thread
+import queue
+from concurrent.futures import ThreadPoolExecutor
 import time
 import re
+import asyncio
+import string
+from types import MappingProxyType
 from typing import List, Dict, Any
 import hashlib
+import gzip
+import zipfile
+from xml.sax.saxutils import escape as xml_escape
+import sqlite3
+from contextlib import closing
+from functools import partial
 from datetime import datetime
 
 # --- Streamlit Cloud Content Protection System ---
-def save_content_safely(content_type, content, grade_level=None):
-    """Save content with multiple backup strategies for Streamlit Cloud"""
+def save_content_safely(content_type, content, grade_level=None, persist_to_browser=True):
+    """Save content with multiple backup strategies for Streamlit Cloud (persist_to_browser=False skips localStorage)"""
     if not content:
         return
     
     try:
-        timestamp = datetime.now().isoformat()
-        content_hash = hashlib.md5(content.encode()).hexdigest()[:8]
+        content_hash = hashlib.blake2b(content.encode(), digest_size=16).hexdigest()
         
         # Strategy 1: Primary session state
         st.session_state[content_type] = content
         
+        # Identical content already fully saved (browser copy included): the backups are current, and
+        # saving again would only resend the whole content to the browser
+        saved_hashes = st.session_state.setdefault("saved_hashes", {})
+        if saved_hashes.get(content_type) == content_hash:
+            return
+        
+        timestamp = datetime.now().isoformat()
+        
         # Strategy 2: Multiple backup session states
         backup_data = {
             'content': content,
@@ -39,8 +58,14 @@ def save_content_safely(content_type, content, grade_level=None):
         st.session_state[f"{content_type}_backup_2"] = backup_data.copy()
         st.session_state[f"{content_type}_backup_3"] = backup_data.copy()
         
-        # Strategy 3: Browser localStorage (works on Streamlit Cloud)
-        save_to_browser_storage(content_type, content, timestamp)
+        # Strategy 3: Browser localStorage (works on Streamlit Cloud). Each write ships the whole
+        # content to the browser in a new iframe, so intermediate streaming saves skip it
+        if persist_to_browser:
+            save_to_browser_storage(content_type, content, timestamp)
+            saved_hashes[content_type] = content_hash
+        else:
+            # The backups now hold other content, so the next full save must not be skipped
+            saved_hashes.pop(content_type, None)
         
         # Strategy 4: Compressed backup for large content
         if len(content) > 10000:
@@ -128,14 +153,28 @@ def verify_and_recover_all_content():
     
     return recovered_any
 
-def auto_save_during_streaming(content_type, partial_content, interval=1000):
-    """Auto-save content during streaming at regular intervals"""
-    if not partial_content:
+def auto_save_during_streaming(content_type, content_parts, content_length, save_state):
+    """Auto-save streamed chunks every STREAM_SAVE_INTERVAL seconds or STREAM_SAVE_CHARS new characters"""
+    if not content_length:
         return
-        
-    # Save every ~1000 characters to prevent loss
-    if len(partial_content) % interval < 50:
-        save_content_safely(content_type, partial_content)
+    
+    now = time.monotonic()
+    last_time = save_state.setdefault("time", now)
+    if now - last_time >= STREAM_SAVE_INTERVAL or content_length - save_state.get("length", 0) >= STREAM_SAVE_CHARS:
+        # Chunks are only joined when a save is due; the final save after streaming writes localStorage
+        save_content_safely(content_type, "".join(content_parts), persist_to_browser=False)
+        save_state["time"] = now
+        save_state["length"] = content_length
+
+def content_preview(content_type, limit=500):
+    """Returns the start of stored content for previews, rebuilt only when the stored content changes"""
+    content = st.session_state.get(content_type) or ""
+    preview = st.session_state.get(f"{content_type}_preview")
+    # The preview keeps a reference to its source string, so an identity check detects any new assignment
+    if preview is None or preview[0] is not content:
+        preview = (content, content[:limit] + "..." if len(content) > limit else content)
+        st.session_state[f"{content_type}_preview"] = preview
+    return preview[1]
 
 def display_content_status():
     """Display content status in sidebar for monitoring"""
@@ -205,24 +244,82 @@ except KeyError:
     """)
     st.stop()
 
-# Initialize OpenAI Client with OpenRouter
-try:
-    client = OpenAI(
+# Connection pool settings shared by the sync and async OpenRouter clients
+OPENROUTER_HTTP_LIMITS = httpx.Limits(max_keepalive_connections=32, max_connections=64)
+OPENROUTER_HTTP_TIMEOUT = httpx.Timeout(600.0, connect=10.0)
+
+@st.cache_resource(show_spinner=False)
+def get_openrouter_client(api_key):
+    """Creates the OpenRouter client once per process so its connection pool survives reruns"""
+    openrouter_client = OpenAI(
         base_url="https://openrouter.ai/api/v1",
-        api_key=OPENROUTER_API_KEY,
+        api_key=api_key,
+        http_client=httpx.Client(limits=OPENROUTER_HTTP_LIMITS, timeout=OPENROUTER_HTTP_TIMEOUT),
     )
     # Test the client
-    models = client.models.list()
+    openrouter_client.models.list()
+    return openrouter_client
+
+# Initialize OpenAI Client with OpenRouter
+try:
+    client = get_openrouter_client(OPENROUTER_API_KEY)
 except Exception as e:
     st.error(f"Error configuring OpenRouter client: {e}")
     st.stop()
 
 # Model to use
 MODEL_NAME = "google/gemini-3-pro-preview"
+# Maximum concurrent OpenRouter requests when generating several content types at once
+MAX_CONCURRENT_GENERATIONS = 4
+# Maximum concurrent chunk analyses in the chunked approach (lower it if OpenRouter rate-limits)
+CHUNK_ANALYSIS_CONCURRENCY = int(os.getenv("OPENROUTER_CONCURRENCY", os.getenv("PDF_CHUNK_CONCURRENCY", "8")))
+# Attempts per chunk analysis before the chunk is reported as failed
+CHUNK_ANALYSIS_ATTEMPTS = 2
+# Global enhancement splits content at headings into parts of about this many characters, enhanced concurrently
+GLOBAL_ENHANCE_PART_CHARS = 6000
+# Token budget for the chunk analyses carried into the final integration prompt
+INTEGRATION_ANALYSES_TOKENS = 48000
+# Attribution headers sent with every OpenRouter request
+OPENROUTER_EXTRA_HEADERS = MappingProxyType({
+    "HTTP-Referer": YOUR_SITE_URL,
+    "X-Title": YOUR_SITE_NAME,
+})
+# Full header set for raw HTTP calls to the OpenRouter chat completions endpoint
+OPENROUTER_REQUEST_HEADERS = MappingProxyType({
+    "Authorization": f"Bearer {OPENROUTER_API_KEY}",
+    **OPENROUTER_EXTRA_HEADERS,
+    "Content-Type": "application/json"
+})
+# Set OPENROUTER_GZIP_REQUESTS=1 to gzip streaming request bodies (only if the endpoint accepts Content-Encoding: gzip)
+OPENROUTER_GZIP_REQUESTS = os.getenv("OPENROUTER_GZIP_REQUESTS") == "1"
+# Block size for base64-encoding PDFs (a multiple of 3 so blocks concatenate without padding)
+PDF_BASE64_BLOCK = 48 * 1024
+# Plain-text extraction flags: keep whitespace and clip to the page, skip ligature preservation
+PDF_TEXT_FLAGS = fitz.TEXT_PRESERVE_WHITESPACE | fitz.TEXT_MEDIABOX_CLIP
+# Persistent store for generated content, keyed by prompt, PDF hash, model and PDF method
+LLM_CACHE_PATH = ".llm_cache.sqlite3"
+LLM_CACHE_TTL_SECONDS = 30 * 86400
+# Most responses kept; each write deletes expired rows and then the oldest beyond this count
+LLM_CACHE_MAX_ENTRIES = 2000
+# OpenRouter file-parser plugin for direct PDF uploads ("mistral-ocr" is the OCR engine alternative)
+PDF_TEXT_PLUGINS = ({"id": "file-parser", "pdf": {"engine": "pdf-text"}},)
+# Streaming throttles: auto-save at most every 2 s or 4 KB of new text, re-render at most every 200 ms
+STREAM_SAVE_INTERVAL = 2.0
+STREAM_SAVE_CHARS = 4096
+STREAM_RENDER_INTERVAL = 0.2
+# EeeBee chat token budget: context window used per request, reply size and a safety margin
+CHAT_CONTEXT_TOKENS = int(os.getenv("CHAT_CONTEXT_TOKENS", "32768"))
+CHAT_MAX_TOKENS = 8192
+CHAT_PROMPT_BUDGET = CHAT_CONTEXT_TOKENS - CHAT_MAX_TOKENS - 2048
+# Chat messages kept in the session (older turns are dropped; the prompt only ever fits the newest ones)
+CHAT_HISTORY_MESSAGES = 40
+# Set CHAT_TOKEN_DEBUG=1 to show the estimated prompt size under each chat reply
+CHAT_TOKEN_DEBUG = os.getenv("CHAT_TOKEN_DEBUG") == "1"
 # --- Helper Functions ---
 
+@st.cache_data(show_spinner=False, ttl=3600)
 def load_model_chapter_progression(file_path="Model Chapter Progression and Elements.txt"):
-    """Loads the model chapter progression text."""
+    """Loads the model chapter progression text (cached, so reruns don't re-read the file)."""
     try:
         with open(file_path, "r", encoding="utf-8") as f:
             return f.read()
@@ -230,45 +327,134 @@ def load_model_chapter_progression(file_path="Model Chapter Progression and Elem
         st.error(f"Error: The file {file_path} was not found. Please make sure it's in the same directory as app.py.")
         return None
 
+# (bytes object, key) of the last PDF hashed; a run passes the same uploaded bytes to every per-PDF cache
+_pdf_key_memo = (None, None)
+
+def pdf_content_key(pdf_bytes):
+    """Returns a short content hash used to key per-PDF caches."""
+    global _pdf_key_memo
+    memo_bytes, memo_key = _pdf_key_memo
+    # The memo holds a reference to its bytes, so the identity check cannot match a different PDF
+    if memo_bytes is pdf_bytes:
+        return memo_key
+    key = hashlib.blake2b(pdf_bytes, digest_size=16).hexdigest()
+    _pdf_key_memo = (pdf_bytes, key)
+    return key
+
+def uploaded_file_bytes(uploaded_file, state_key="_uploaded_pdf"):
+    """Returns an uploaded file's bytes, read once per upload (file_id) instead of on every rerun."""
+    cached = st.session_state.get(state_key)
+    if cached is None or cached[0] != uploaded_file.file_id:
+        cached = (uploaded_file.file_id, uploaded_file.getvalue())
+        st.session_state[state_key] = cached
+    return cached[1]
+
+def encode_json_body(payload):
+    """Serializes a request payload compactly as UTF-8 (no separator spaces or \\u escapes for non-ASCII text)."""
+    return json.dumps(payload, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+def _extract_page_texts(pdf_bytes):
+    """Extracts the text of every page with PyMuPDF only (safe to run outside the script thread)"""
+    doc = fitz.open(stream=pdf_bytes, filetype="pdf")
+    try:
+        return tuple(doc[page_num].get_text("text", flags=PDF_TEXT_FLAGS) for page_num in range(len(doc)))
+    finally:
+        doc.close()
+
+@st.cache_resource(show_spinner=False, max_entries=32)
+def _cached_page_texts(pdf_key, _pdf_bytes):
+    """Extracts the text of every page once per unique PDF, reusing a finished background prefetch"""
+    current = st.session_state.get('pdf_prefetch')
+    if current is not None and current[0] == pdf_key:
+        try:
+            return current[1].result()
+        except Exception:
+            pass  # Extract again below so the error surfaces in the caller
+    return _extract_page_texts(_pdf_bytes)
+
+@st.cache_resource(show_spinner=False, max_entries=32)
+def _cached_pdf_text(pdf_key, _pdf_bytes):
+    """Joins the page texts with page markers once per unique PDF; every text-based prompt reuses this string"""
+    return "".join(
+        f"\n\n--- Page {page_num + 1} ---\n{page_text}"
+        for page_num, page_text in enumerate(_cached_page_texts(pdf_key, _pdf_bytes))
+    )
+
+@st.cache_resource(show_spinner=False, max_entries=32)
+def _cached_page_content(pdf_key, _pdf_bytes):
+    """Returns every page's text (from the text cache) and images as base64 data URLs, each extracted once per PDF (shared, treat as read-only)"""
+    # Page text comes from the text cache, so a PDF's text is extracted only once whichever path asks first
+    page_texts = _cached_page_texts(pdf_key, _pdf_bytes)
+    doc = fitz.open(stream=_pdf_bytes, filetype="pdf")
+    try:
+        # First pass: collect each page's image xrefs
+        page_xrefs = [[img[0] for img in doc[page_num].get_images(full=True)] for page_num in range(len(doc))]
+        
+        # Second pass: logos and page furniture reuse one xref across pages; decode and encode each only once.
+        # Images are also identified by content hash so byte-identical copies under different xrefs share one data URL
+        xref_images = {}
+        data_urls = {}
+        for xref in {xref for xrefs in page_xrefs for xref in xrefs}:
+            try:
+                base_image = doc.extract_image(xref)
+                image_bytes = base_image["image"]
+                image_id = hashlib.blake2b(image_bytes, digest_size=8).hexdigest()
+                if image_id not in data_urls:
+                    # Convert to base64
+                    base64_image = base64.b64encode(image_bytes).decode('utf-8')
+                    ext = base_image["ext"]
+                    data_urls[image_id] = f"data:image/{ext};base64,{base64_image}"
+                xref_images[xref] = image_id
+            except Exception:
+                pass
+        
+        # Map the decoded images back onto their pages
+        page_images = tuple(
+            [
+                {
+                    "page": page_num + 1,
+                    "base64": data_urls[xref_images[xref]],
+                    "description": f"Image from page {page_num + 1}",
+                    "image_id": xref_images[xref]
+                }
+                for xref in xrefs if xref in xref_images
+            ]
+            for page_num, xrefs in enumerate(page_xrefs)
+        )
+        return page_texts, page_images
+    finally:
+        doc.close()
+
 def extract_text_from_pdf(pdf_file_bytes):
     """Extracts text from PDF bytes."""
-    text = ""
     try:
-        doc = fitz.open(stream=pdf_file_bytes, filetype="pdf")
-        for page_num in range(len(doc)):
-            page = doc.load_page(page_num)
-            text += f"\n\n--- Page {page_num + 1} ---\n"
-            text += page.get_text()
-        doc.close()
+        return _cached_pdf_text(pdf_content_key(pdf_file_bytes), pdf_file_bytes)
     except Exception as e:
         st.error(f"Could not extract text from PDF: {e}")
-    return text
+        return ""
 
 def extract_images_from_pdf(pdf_file_bytes):
     """Extracts images from PDF and returns them as base64 encoded strings."""
     images = []
     try:
-        doc = fitz.open(stream=pdf_file_bytes, filetype="pdf")
-        for page_num in range(len(doc)):
-            page = doc.load_page(page_num)
-            image_list = page.get_images(full=True)
-            for img_index, img in enumerate(image_list):
-                xref = img[0]
-                base_image = doc.extract_image(xref)
-                image_bytes = base_image["image"]
-                # Convert to base64
-                base64_image = base64.b64encode(image_bytes).decode('utf-8')
-                ext = base_image["ext"]
-                images.append({
-                    "page": page_num + 1,
-                    "base64": f"data:image/{ext};base64,{base64_image}",
-                    "description": f"Image from page {page_num + 1}"
-                })
-        doc.close()
+        for page_images in _cached_page_content(pdf_content_key(pdf_file_bytes), pdf_file_bytes)[1]:
+            images.extend(page_images)
     except Exception as e:
         st.warning(f"Could not extract images from PDF: {e}")
     return images
 
+def extract_text_and_images(pdf_file_bytes):
+    """Extracts text and images from PDF bytes, each cached once per PDF; returns (text, images)."""
+    images = []
+    try:
+        pdf_key = pdf_content_key(pdf_file_bytes)
+        for page_images in _cached_page_content(pdf_key, pdf_file_bytes)[1]:
+            images.extend(page_images)
+        return _cached_pdf_text(pdf_key, pdf_file_bytes), images
+    except Exception as e:
+        st.error(f"Could not extract content from PDF: {e}")
+        return "", images
+
 def create_messages_with_pdf_content(prompt, pdf_text, pdf_images=None):
     """Creates messages array for OpenAI API with PDF content."""
     messages = []
@@ -285,7 +471,18 @@ def create_messages_with_pdf_content(prompt, pdf_text, pdf_images=None):
     
     # Add all images if available
     if pdf_images:  # No limit on number of images
+        sent_image_ids = set()
         for img in pdf_images:  # Include all images
+            image_id = img.get("image_id")
+            if "base64" not in img or image_id in sent_image_ids:
+                # Repeated image: mention it instead of sending the same data again
+                content_parts.append({
+                    "type": "text",
+                    "text": f"[Image on page {img['page']} repeats an image already provided]"
+                })
+                continue
+            if image_id:
+                sent_image_ids.add(image_id)
             content_parts.append({
                 "type": "image_url",
                 "image_url": {
@@ -301,12 +498,24 @@ def create_messages_with_pdf_content(prompt, pdf_text, pdf_images=None):
     
     return messages
 
+def dedupe_images(images, seen_image_ids):
+    """Replaces images already sent in this run with lightweight references (updates seen_image_ids)"""
+    deduped = []
+    for img in images:
+        image_id = img.get("image_id")
+        if image_id and image_id in seen_image_ids:
+            deduped.append({"page": img["page"], "ref": image_id})
+        else:
+            if image_id:
+                seen_image_ids.add(image_id)
+            deduped.append(img)
+    return deduped
+
 # Mistral OCR Functions
-def process_pdf_with_mistral_ocr(pdf_bytes, pdf_filename):
+def process_pdf_with_mistral_ocr(pdf_bytes, pdf_filename, show_status=True):
     """Process PDF using Mistral OCR API for advanced text extraction with structure preservation."""
     try:
         import requests
-        import base64
         import os
         
         # Get Mistral API key from Streamlit secrets
@@ -318,7 +527,7 @@ def process_pdf_with_mistral_ocr(pdf_bytes, pdf_filename):
             return None, None
         
         # Encode PDF to base64
-        base64_pdf = base64.b64encode(pdf_bytes).decode('utf-8')
+        base64_pdf = encode_pdf_to_base64(pdf_bytes)
         
         # Prepare the request
         url = "https://api.mistral.ai/v1/ocr"
@@ -336,10 +545,11 @@ def process_pdf_with_mistral_ocr(pdf_bytes, pdf_filename):
             "include_image_base64": True
         }
         
-        st.info("🔬 Processing PDF with Mistral OCR...")
+        if show_status:
+            st.info("🔬 Processing PDF with Mistral OCR...")
         
         # Make the API request
-        response = requests.post(url, headers=headers, json=data, timeout=300)
+        response = requests.post(url, headers=headers, data=encode_json_body(data), timeout=300)
         
         if response.status_code == 200:
             ocr_result = response.json()
@@ -349,7 +559,8 @@ def process_pdf_with_mistral_ocr(pdf_bytes, pdf_filename):
             extracted_images = []
             
             pages_processed = len(ocr_result.get('pages', []))
-            st.success(f"✅ Successfully processed {pages_processed} pages with Mistral OCR")
+            if show_status:
+                st.success(f"✅ Successfully processed {pages_processed} pages with Mistral OCR")
             
             for page_data in ocr_result.get('pages', []):
                 page_num = page_data.get('index', 1)
@@ -392,6 +603,52 @@ def process_pdf_with_mistral_ocr(pdf_bytes, pdf_filename):
         st.error(f"❌ **Mistral OCR Error:** {str(e)}")
         return None, None
 
+@st.cache_data(show_spinner=False, max_entries=16)
+def _cached_mistral_ocr(pdf_key, _pdf_bytes, _pdf_filename):
+    """Runs Mistral OCR once per PDF content hash; failures raise so they are not cached"""
+    # st.cache_data replays elements drawn inside it on every hit, so progress is shown by the caller instead
+    pdf_text, pdf_images = process_pdf_with_mistral_ocr(_pdf_bytes, _pdf_filename, show_status=False)
+    if pdf_text is None:
+        raise RuntimeError("Mistral OCR failed")
+    return pdf_text, pdf_images
+
+def process_pdf_with_mistral_ocr_cached(pdf_bytes, pdf_filename):
+    """Returns Mistral OCR output for a PDF, reusing the result for identical PDF content."""
+    try:
+        # A spinner is transient, so a cache hit leaves no stale "processing" message behind
+        with st.spinner("🔬 Processing PDF with Mistral OCR..."):
+            return _cached_mistral_ocr(pdf_content_key(pdf_bytes), pdf_bytes, pdf_filename)
+    except RuntimeError:
+        return None, None
+
+@st.cache_resource(show_spinner=False)
+def _pdf_prefetch_pool():
+    """Worker threads that extract uploaded PDF text ahead of generation (shared across reruns)"""
+    return ThreadPoolExecutor(max_workers=4)
+
+def start_pdf_prefetch(pdf_bytes, pdf_method):
+    """Starts the local page-text extraction of an uploaded PDF in the background, once per PDF"""
+    # Only the text method reads the extracted text up front; OCR is billed and runs only after a generate click
+    if pdf_method != "Text Extraction (Original)":
+        return
+    pdf_key = pdf_content_key(pdf_bytes)
+    current = st.session_state.get('pdf_prefetch')
+    if current is None or current[0] != pdf_key:
+        # The worker makes no Streamlit calls; _cached_page_texts picks up its result on the script thread
+        future = _pdf_prefetch_pool().submit(_extract_page_texts, pdf_bytes)
+        st.session_state.pdf_prefetch = (pdf_key, future)
+
+def wait_for_pdf_prefetch():
+    """Blocks until a running background PDF text extraction finishes so its result is reused"""
+    current = st.session_state.get('pdf_prefetch')
+    if current is None or current[1].done():
+        return
+    with st.spinner("Finishing PDF extraction..."):
+        try:
+            current[1].result()
+        except Exception:
+            pass  # Extraction is repeated (and its errors reported) by the generation call
+
 def create_messages_with_mistral_ocr_content(prompt, ocr_text, ocr_images=None):
     """Creates messages array for OpenAI API with Mistral OCR content."""
     messages = []
@@ -428,14 +685,11 @@ def analyze_with_llm(pdf_file_bytes, pdf_filename, model_progression_text, grade
     """Analyzes the uploaded PDF chapter using OpenRouter API."""
     st.info("Extracting content from PDF...")
     
-    # Extract text from PDF
-    pdf_text = extract_text_from_pdf(pdf_file_bytes)
+    # Extract text and images from PDF in one pass
+    pdf_text, pdf_images = extract_text_and_images(pdf_file_bytes)
     if not pdf_text:
         return "Error: Could not extract text from PDF.", "Error"
     
-    # Extract images (optional - you can disable this if token usage is too high)
-    pdf_images = extract_images_from_pdf(pdf_file_bytes)
-    
     prompt_content = f"""You are an expert in educational content development, specifically for CBSE curriculum.
 Your task is to analyze the provided PDF document, which is a book chapter intended for **{grade_level} (CBSE)**.
 This is the user's OWN CONTENT being used for EDUCATIONAL PURPOSES ONLY.
@@ -533,10 +787,7 @@ Provide the complete, rewritten chapter text in Markdown format, incorporating a
         
         # Make API call
         completion = client.chat.completions.create(
-            extra_headers={
-                "HTTP-Referer": YOUR_SITE_URL,
-                "X-Title": YOUR_SITE_NAME,
-            },
+            extra_headers=OPENROUTER_EXTRA_HEADERS,
             model=MODEL_NAME,
             messages=messages,
             max_tokens=65536,  # Adjust based on your needs and model limits
@@ -556,44 +807,34 @@ def analyze_with_chunked_approach(pdf_file_bytes, pdf_filename, model_progressio
     st.info("Using chunked approach to analyze PDF...")
     
     try:
-        # Extract full text
-        doc = fitz.open(stream=pdf_file_bytes, filetype="pdf")
-        total_pages = len(doc)
+        # Per-page text and images (cached by content hash, images deduplicated by xref)
+        pdf_key = pdf_content_key(pdf_file_bytes)
+        page_texts, page_images = _cached_page_content(pdf_key, pdf_file_bytes)
+        total_pages = len(page_texts)
         
         # Determine chunk size
         pages_per_chunk = 5
         
         # Process chunks
         analysis_results = []
+        seen_image_ids = set()
         
         for start_page in range(0, total_pages, pages_per_chunk):
             end_page = min(start_page + pages_per_chunk - 1, total_pages - 1)
             st.info(f"Analyzing pages {start_page+1}-{end_page+1} of {total_pages}...")
             
             # Extract text for this chunk
-            chunk_text = ""
+            chunk_parts = []
             chunk_images = []
             
             for page_num in range(start_page, end_page + 1):
-                page = doc.load_page(page_num)
-                chunk_text += f"\n\n--- Page {page_num + 1} ---\n"
-                chunk_text += page.get_text()
+                chunk_parts.append(f"\n\n--- Page {page_num + 1} ---\n")
+                chunk_parts.append(page_texts[page_num])
                 
-                # Extract images from this page
-                image_list = page.get_images(full=True)
-                for img in image_list:  # Include all images from page
-                    try:
-                        xref = img[0]
-                        base_image = doc.extract_image(xref)
-                        image_bytes = base_image["image"]
-                        base64_image = base64.b64encode(image_bytes).decode('utf-8')
-                        ext = base_image["ext"]
-                        chunk_images.append({
-                            "page": page_num + 1,
-                            "base64": f"data:image/{ext};base64,{base64_image}",
-                        })
-                    except:
-                        pass
+                # Images from this page (only the first chunk containing an image sends its data)
+                chunk_images.extend(dedupe_images(page_images[page_num], seen_image_ids))
+            
+            chunk_text = "".join(chunk_parts)
             
             # Analyze this chunk
             chunk_prompt = f"""You are an expert in educational content development for CBSE curriculum.
@@ -630,10 +871,7 @@ Please provide ONLY the improved version of this specific chunk in Markdown form
                 messages = create_messages_with_pdf_content(chunk_prompt, chunk_text, chunk_images)
                 
                 completion = client.chat.completions.create(
-                    extra_headers={
-                        "HTTP-Referer": YOUR_SITE_URL,
-                        "X-Title": YOUR_SITE_NAME,
-                    },
+                    extra_headers=OPENROUTER_EXTRA_HEADERS,
                     model=MODEL_NAME,
                     messages=messages,
                     max_tokens=60000,
@@ -647,8 +885,6 @@ Please provide ONLY the improved version of this specific chunk in Markdown form
                 st.warning(f"Error processing chunk: {chunk_e}")
                 analysis_results.append(f"[Error processing pages {start_page+1}-{end_page+1}]")
         
-        doc.close()
-        
         # Combine results
         combined_result = "\n\n".join(analysis_results)
         
@@ -694,10 +930,7 @@ Provide the complete, integrated chapter in Markdown format.
             messages = [{"role": "user", "content": integration_prompt}]
             
             final_completion = client.chat.completions.create(
-                extra_headers={
-                    "HTTP-Referer": YOUR_SITE_URL,
-                    "X-Title": YOUR_SITE_NAME,
-                },
+                extra_headers=OPENROUTER_EXTRA_HEADERS,
                 model=MODEL_NAME,
                 messages=messages,
                 max_tokens=65536,
@@ -716,9 +949,21 @@ Provide the complete, integrated chapter in Markdown format.
         st.error(f"Error during chunked PDF analysis: {e}")
         return f"Error: Could not complete chunked analysis. {e}", "Error"
 
+@st.cache_resource(show_spinner=False)
+def _docx_template_bytes():
+    """Serializes the base Word template once per process; documents are opened from these bytes."""
+    # python-docx is imported on the first download rather than on every cold start
+    from docx import Document
+    
+    template_io = io.BytesIO()
+    Document().save(template_io)
+    return template_io.getvalue()
+
 def create_word_document(improved_text_markdown):
     """Creates a Word document from the improved text (Markdown formatted)."""
-    doc = Document()
+    from docx import Document
+    
+    doc = Document(io.BytesIO(_docx_template_bytes()))
     
     lines = improved_text_markdown.split('\n')
     
@@ -739,10 +984,74 @@ def create_word_document(improved_text_markdown):
             
     return doc
 
+@st.cache_data(show_spinner=False, max_entries=8, ttl=86400)
+def _build_docx_bytes(content: str) -> bytes:
+    """Builds the Word document for some content once and returns its bytes (cached per content)"""
+    doc_io = io.BytesIO()
+    create_word_document(content).save(doc_io)
+    return doc_io.getvalue()
+
+# Characters XML 1.0 cannot hold (python-docx rejects them; the streamed writer drops them)
+_XML_INVALID_CHARS = re.compile('[\x00-\x08\x0b\x0c\x0e-\x1f]')
+
+def _docx_paragraph_xml(line):
+    """Returns the paragraph XML create_word_document would add for one stripped Markdown line"""
+    style = None
+    if line.startswith("# "):
+        style, line = "Heading1", line[2:]
+    elif line.startswith("## "):
+        style, line = "Heading2", line[3:]
+    elif line.startswith("### "):
+        style, line = "Heading3", line[4:]
+    elif line.startswith("- ") or line.startswith("* "):
+        style = "ListBullet"
+    
+    properties = f'<w:pPr><w:pStyle w:val="{style}"/></w:pPr>' if style else ""
+    text = xml_escape(_XML_INVALID_CHARS.sub("", line))
+    return f'<w:p>{properties}<w:r><w:t xml:space="preserve">{text}</w:t></w:r></w:p>'
+
+@st.cache_data(show_spinner=False, max_entries=4, ttl=86400)
+def _build_combined_docx_bytes(sections: tuple) -> bytes:
+    """Writes (heading, Markdown) sections into the .docx zip one at a time, without joining them or building a python-docx tree"""
+    template = zipfile.ZipFile(io.BytesIO(_docx_template_bytes()))
+    document_xml = template.read("word/document.xml").decode("utf-8")
+    # Paragraphs go where python-docx adds them: before the section properties at the end of the body
+    body_end = document_xml.rfind("<w:sectPr")
+    if body_end == -1:
+        body_end = document_xml.rindex("</w:body>")
+    
+    doc_io = io.BytesIO()
+    with zipfile.ZipFile(doc_io, "w", zipfile.ZIP_DEFLATED) as docx:
+        # Styles, settings and relationships are copied from the template unchanged
+        for item in template.infolist():
+            if item.filename != "word/document.xml":
+                docx.writestr(item, template.read(item.filename))
+        
+        with docx.open("word/document.xml", "w") as part:
+            part.write(document_xml[:body_end].encode("utf-8"))
+            for heading, content in sections:
+                part.write(_docx_paragraph_xml(f"# {heading}").encode("utf-8"))
+                for line in content.split('\n'):
+                    line = line.strip()
+                    if line:
+                        part.write(_docx_paragraph_xml(line).encode("utf-8"))
+            part.write(document_xml[body_end:].encode("utf-8"))
+    return doc_io.getvalue()
+
 # Helper Functions for Content Generation
 def create_specific_prompt(content_type, grade_level, model_progression_text, subject_type="Science", word_limits=None):
     """Creates a prompt focused on a specific content type"""
-    
+    word_limits_items = tuple(sorted(word_limits.items())) if word_limits is not None else None
+    return _cached_specific_prompt(content_type, grade_level, model_progression_text, subject_type, word_limits_items)
+
+@st.cache_data(show_spinner=False, max_entries=64)
+def _cached_specific_prompt(content_type, grade_level, model_progression_text, subject_type, word_limits_items):
+    """Builds each unique prompt once and reuses it across Streamlit reruns"""
+    word_limits = dict(word_limits_items) if word_limits_items is not None else None
+    return _build_specific_prompt(content_type, grade_level, model_progression_text, subject_type, word_limits)
+
+def _build_specific_prompt(content_type, grade_level, model_progression_text, subject_type="Science", word_limits=None):
+    """Dispatches to the subject- and content-type-specific prompt builder"""
     if subject_type == "Mathematics":
         if content_type == "chapter":
             return create_math_chapter_prompt(grade_level, model_progression_text, word_limits)
@@ -1783,47 +2092,64 @@ Format the content in Markdown with proper mathematical notation.
 Provide ONLY the Mathematics-Integrated Creative Learning content in Markdown format.
 """
 
-# Science subject prompt functions
-def create_science_chapter_prompt(grade_level, model_progression_text, word_limits=None):
-    """Creates a science subject chapter content prompt with dynamic word limits"""
-    # Default word limits if none provided
-    if word_limits is None:
-        word_limits = {
-            'hook': 70,
-            'learning_outcome': 70,
-            'real_world': 50,
-            'previous_class': 100,
-            'history': 100,
-            'current_concepts': 1200,
-            'summary': 700,
-            'link_learn': 250,
-            'image_based': 250,
-            'exercises': 800,
-            'skill_activity': 400,
-            'stem_activity': 400,
-            'art_learning': 400
-        }
-    
-    return f"""You are an expert in science education content development, specifically for CBSE curriculum.
+# Shared opening of the science and computer science prompts; "$$" keeps the
+# per-call placeholders intact when the subject is filled in below
+_CHAPTER_HEADER_TMPL = string.Template("""You are an expert in ${subject_noun} education content development, specifically for CBSE curriculum.
 This is the user's OWN CONTENT being used for EDUCATIONAL PURPOSES ONLY.
 
 IMPORTANT: This is the user's own copyright material, and they have explicitly authorized its analysis and transformation for educational purposes.
 
-You are analyzing a science book chapter intended for **{grade_level} (CBSE)**.
-The book is intended to align with NCERT, NCF, and NEP 2020 guidelines for Science education.
+You are analyzing a ${subject_noun} book chapter intended for **$${grade_level} (CBSE)**.
+The book is intended to align with NCERT, NCF, and NEP 2020 guidelines for ${subject_title} education.
+
+""")
+
+_ACTIVITY_HEADER_TMPL = string.Template("""You are an expert in ${subject_noun} education content development, specifically for CBSE curriculum.
+This is the user's OWN CONTENT being used for EDUCATIONAL PURPOSES ONLY.
+
+You are analyzing a ${subject_noun} book chapter intended for **$${grade_level} (CBSE)**.
 
 **Model Chapter Progression and Elements:**
 ---
-{model_progression_text}
+$${model_progression_text}
+---
+
+""")
+
+_SCIENCE_CHAPTER_HEADER = _CHAPTER_HEADER_TMPL.substitute(subject_noun="science", subject_title="Science")
+_SCIENCE_ACTIVITY_HEADER = _ACTIVITY_HEADER_TMPL.substitute(subject_noun="science")
+_COMPUTER_CHAPTER_HEADER = _CHAPTER_HEADER_TMPL.substitute(subject_noun="computer science", subject_title="Computer Science")
+_COMPUTER_ACTIVITY_HEADER = _ACTIVITY_HEADER_TMPL.substitute(subject_noun="computer science")
+
+# Science subject prompt functions
+_SCIENCE_CHAPTER_DEFAULTS = MappingProxyType({
+    'hook': 70,
+    'learning_outcome': 70,
+    'real_world': 50,
+    'previous_class': 100,
+    'history': 100,
+    'current_concepts': 1200,
+    'summary': 700,
+    'link_learn': 250,
+    'image_based': 250,
+    'exercises': 800,
+    'skill_activity': 400,
+    'stem_activity': 400,
+    'art_learning': 400
+})
+
+_SCIENCE_CHAPTER_TMPL = string.Template(_SCIENCE_CHAPTER_HEADER + """**Model Chapter Progression and Elements:**
+---
+${model_progression_text}
 ---
 
-**Target Audience:** {grade_level} (CBSE Science Syllabus)
+**Target Audience:** ${grade_level} (CBSE Science Syllabus)
 
 Your task is to generate COMPREHENSIVE CORE SCIENCE CHAPTER CONTENT that should be equivalent to a complete science textbook chapter.
 
 **REQUIRED SECTIONS (Generate ALL with substantial content):**
 
-1. **Current Concepts** (Target: {word_limits.get('current_concepts', 1200)} words)
+1. **Current Concepts** (Target: ${current_concepts} words)
    
    For each major scientific concept in the chapter, include ALL of the following:
    
@@ -1891,46 +2217,46 @@ Your task is to generate COMPREHENSIVE CORE SCIENCE CHAPTER CONTENT that should
    - Mark concepts which are exactly coming from the PDF and give some extra concepts for higher level understanding
    - Make sure there is no repetition of concepts
 
-2. **Hook (with Image Prompt)** (Target: {word_limits.get('hook', 80)} words)
+2. **Hook (with Image Prompt)** (Target: ${hook} words)
    - Create an engaging scientific opening that captures student interest
    - Use scientific storytelling, surprising scientific facts, or thought-provoking scientific questions
    - Connect to students' daily scientific experiences or current scientific events
    - Include a detailed image prompt for a compelling scientific visual
 
-3. **Learning Outcome** (Target: {word_limits.get('learning_outcome', 70)} words)
+3. **Learning Outcome** (Target: ${learning_outcome} words)
    - List specific, measurable scientific learning objectives
    - Use action verbs (analyze, evaluate, create, experiment, investigate, etc.)
    - Align with Bloom's Taxonomy levels for science education
    - Connect to CBSE science curriculum standards
 
-4. **Real World Connection** (Target: {word_limits.get('real_world', 50)} words)
+4. **Real World Connection** (Target: ${real_world} words)
    - Provide multiple real-world applications of the scientific concepts
    - Include current examples from technology, environment, health, space science, etc.
    - Explain how the scientific concepts impact daily life
    - Connect to scientific careers and future studies
 
-5. **Previous Class Concept** (Target: {word_limits.get('previous_class', 100)} words)
+5. **Previous Class Concept** (Target: ${previous_class} words)
    - Give the scientific concept name and the previous class it was studied in according to NCERT science textbooks
    - Link to prior scientific knowledge and foundations
 
-6. **History** (Target: {word_limits.get('history', 100)} words)
+6. **History** (Target: ${history} words)
    - Provide comprehensive historical background of scientific discoveries
    - Include key scientists, inventors, or scientific figures and their contributions
    - Explain the timeline of scientific developments and discoveries
    - Connect historical scientific context to modern understanding
 
-7. **Summary** (Target: {word_limits.get('summary', 700)} words)
+7. **Summary** (Target: ${summary} words)
    - Create detailed concept-wise scientific summaries (not just one overall summary)
    - Include key scientific points, formulas, and important scientific facts
    - Organize by individual scientific concepts covered in the chapter
    - Provide clear, concise explanations that reinforce scientific learning
 
-8. **Link and Learn Based Question** (Target: {word_limits.get('link_learn', 250)} words)
+8. **Link and Learn Based Question** (Target: ${link_learn} words)
    - Create 3-5 questions that connect different scientific concepts
    - Include questions that link to other science subjects or real-world scientific scenarios
    - Provide detailed explanations for the scientific connections
 
-9. **Image Based Question** (Target: {word_limits.get('image_based', 250)} words)
+9. **Image Based Question** (Target: ${image_based} words)
    - Create 3-5 questions based on scientific images/diagrams from the chapter
    - Include detailed scientific image descriptions if creating new image prompts
    - Ensure questions test scientific understanding, not just observation
@@ -1939,7 +2265,7 @@ Your task is to generate COMPREHENSIVE CORE SCIENCE CHAPTER CONTENT that should
 * **Scientific Accuracy**: Ensure all scientific content is accurate and up-to-date
 * **Detailed Scientific Explanations**: Each scientific concept should be explained thoroughly with multiple paragraphs
 * **Scientific Examples and Illustrations**: Include numerous scientific examples, case studies, and practical applications
-* **Age-Appropriate Scientific Language**: Use scientific vocabulary suitable for {grade_level} but don't oversimplify
+* **Age-Appropriate Scientific Language**: Use scientific vocabulary suitable for ${grade_level} but don't oversimplify
 * **Engaging Scientific Tone**: Write in an engaging, conversational style that maintains student interest in science
 * **Clear Scientific Structure**: Use proper headings, subheadings, and formatting for science content
 * **Visual Integration**: Include detailed image prompts for scientific diagrams, experiments, and illustrations
@@ -1963,26 +2289,18 @@ Your task is to generate COMPREHENSIVE CORE SCIENCE CHAPTER CONTENT that should
 Analyze the PDF document thoroughly and create improved scientific content that expands significantly on what's provided while maintaining all original concept names and terminology.
 
 Provide ONLY the comprehensive science chapter content in Markdown format. Do not include exercises, activities, or art projects.
-"""
-
-def create_science_exercises_prompt(grade_level, model_progression_text, word_limits=None):
-    """Creates a science subject exercises prompt with dynamic word limits"""
-    if word_limits is None:
-        word_limits = {
-            'exercises': 800
-        }
-    return f"""You are an expert in science education content development, specifically for CBSE curriculum.
-This is the user's OWN CONTENT being used for EDUCATIONAL PURPOSES ONLY.
+""")
 
-You are analyzing a science book chapter intended for **{grade_level} (CBSE)**.
+def create_science_chapter_prompt(grade_level, model_progression_text, word_limits=None):
+    """Creates a science subject chapter content prompt with dynamic word limits"""
+    return _build_prompt("science", "chapter", grade_level, model_progression_text, word_limits)
 
-**Model Chapter Progression and Elements:**
----
-{model_progression_text}
----
+_SCIENCE_EXERCISES_DEFAULTS = MappingProxyType({
+    'exercises': 800
+})
 
-Your task is to generate COMPREHENSIVE SCIENCE EXERCISES based on the chapter content in the PDF.
-**Target Total Word Count for All Exercises**: {word_limits.get('exercises', 800)} words
+_SCIENCE_EXERCISES_TMPL = string.Template(_SCIENCE_ACTIVITY_HEADER + """Your task is to generate COMPREHENSIVE SCIENCE EXERCISES based on the chapter content in the PDF.
+**Target Total Word Count for All Exercises**: ${exercises} words
 
 **Core Science Exercise Types:**
 
@@ -2007,7 +2325,7 @@ Create the following science exercise types:
 Ensure that:
 * Questions cover ALL important scientific concepts from the PDF
 * Questions follow Bloom's Taxonomy at various levels (Remember, Understand, Apply, Analyze, Evaluate, Create)
-* Scientific language is clear and appropriate for {grade_level}
+* Scientific language is clear and appropriate for ${grade_level}
 * Questions increase in difficulty from basic scientific recall to higher-order scientific thinking
 * All exercises include correct answers or model scientific solutions
 * Content is formatted in Markdown with proper scientific notation
@@ -2017,28 +2335,20 @@ Ensure that:
 Do NOT directly copy questions from the PDF. Create new, original scientific questions based on the content.
 
 Provide ONLY the comprehensive science exercises in Markdown format.
-"""
-
-def create_science_skills_prompt(grade_level, model_progression_text, word_limits=None):
-    """Creates a science subject skills and STEM activities prompt with dynamic word limits"""
-    if word_limits is None:
-        word_limits = {
-            'skill_activity': 400,
-            'stem_activity': 400
-        }
-    return f"""You are an expert in science education content development, specifically for CBSE curriculum.
-This is the user's OWN CONTENT being used for EDUCATIONAL PURPOSES ONLY.
+""")
 
-You are analyzing a science book chapter intended for **{grade_level} (CBSE)**.
+def create_science_exercises_prompt(grade_level, model_progression_text, word_limits=None):
+    """Creates a science subject exercises prompt with dynamic word limits"""
+    return _build_prompt("science", "exercises", grade_level, model_progression_text, word_limits)
 
-**Model Chapter Progression and Elements:**
----
-{model_progression_text}
----
+_SCIENCE_SKILLS_DEFAULTS = MappingProxyType({
+    'skill_activity': 400,
+    'stem_activity': 400
+})
 
-Your task is to generate SCIENCE SKILL-BASED ACTIVITIES and STEM projects based on the chapter content in the PDF.
+_SCIENCE_SKILLS_TMPL = string.Template(_SCIENCE_ACTIVITY_HEADER + """Your task is to generate SCIENCE SKILL-BASED ACTIVITIES and STEM projects based on the chapter content in the PDF.
 
-## Science Skill-Based Activities (Target: {word_limits.get('skill_activity', 400)} words)
+## Science Skill-Based Activities (Target: ${skill_activity} words)
 
 Create at least 3 hands-on science activities that:
 * Reinforce the key scientific concepts from the chapter
@@ -2058,7 +2368,7 @@ Create at least 3 hands-on science activities that:
 7. **Scientific Reflection Questions**
 8. **Expected Scientific Outcomes and Learning**
 
-## Science STEM Projects (Target: {word_limits.get('stem_activity', 400)} words)
+## Science STEM Projects (Target: ${stem_activity} words)
 
 Create at least 2 comprehensive STEM projects that:
 * Integrate Science, Technology, Engineering and Mathematics
@@ -2098,26 +2408,18 @@ For each activity/project, include:
 Format the content in Markdown with proper scientific headings, lists, and organization.
 
 Provide ONLY the Science Skill Activities and STEM Projects in Markdown format.
-"""
-
-def create_science_art_prompt(grade_level, model_progression_text, word_limits=None):
-    """Creates a science subject art integration prompt with dynamic word limits"""
-    if word_limits is None:
-        word_limits = {
-            'art_learning': 400
-        }
-    return f"""You are an expert in science education content development, specifically for CBSE curriculum.
-This is the user's OWN CONTENT being used for EDUCATIONAL PURPOSES ONLY.
+""")
 
-You are analyzing a science book chapter intended for **{grade_level} (CBSE)**.
+def create_science_skills_prompt(grade_level, model_progression_text, word_limits=None):
+    """Creates a science subject skills and STEM activities prompt with dynamic word limits"""
+    return _build_prompt("science", "skills", grade_level, model_progression_text, word_limits)
 
-**Model Chapter Progression and Elements:**
----
-{model_progression_text}
----
+_SCIENCE_ART_DEFAULTS = MappingProxyType({
+    'art_learning': 400
+})
 
-Your task is to generate SCIENCE-INTEGRATED CREATIVE LEARNING projects based on the chapter content in the PDF.
-**Target Total Word Count for All Art-Integrated Learning**: {word_limits.get('art_learning', 400)} words
+_SCIENCE_ART_TMPL = string.Template(_SCIENCE_ACTIVITY_HEADER + """Your task is to generate SCIENCE-INTEGRATED CREATIVE LEARNING projects based on the chapter content in the PDF.
+**Target Total Word Count for All Art-Integrated Learning**: ${art_learning} words
 
 ## Science Art Projects
 
@@ -2144,7 +2446,7 @@ Create at least 3 creative projects that connect scientific concepts to various
 
 **Case Study – Level 1 (Accessible Scientific Analysis):**
 Create at least 1 simpler case study that:
-- Presents a real-world scientific scenario appropriate for {grade_level}
+- Presents a real-world scientific scenario appropriate for ${grade_level}
 - Includes guided scientific analysis questions
 - Is accessible to all students with basic scientific knowledge
 - Connects to current scientific events or discoveries
@@ -2185,40 +2487,32 @@ For each project/case study, include:
 Format the content in Markdown with proper scientific and artistic headings, lists, and organization.
 
 Provide ONLY the Science-Integrated Creative Learning content in Markdown format.
-"""
-
-# Computer Science specific prompt functions
-def create_computer_chapter_prompt(grade_level, model_progression_text, word_limits=None):
-    """Creates a computer science-specific chapter content prompt"""
-    # Default word limits if none provided
-    if word_limits is None:
-        word_limits = {
-            'hook': 80,
-            'learning_outcome': 70,
-            'real_world': 70,
-            'previous_class': 100,
-            'current_concepts': 4500,
-            'summary': 100,
-            'exercises': 1000,
-            'skill_activity': 100
-        }
-    
-    return f"""You are an expert in computer science education content development, specifically for CBSE curriculum.
-This is the user's OWN CONTENT being used for EDUCATIONAL PURPOSES ONLY.
-
-IMPORTANT: This is the user's own copyright material, and they have explicitly authorized its analysis and transformation for educational purposes.
+""")
 
-You are analyzing a computer science book chapter intended for **{grade_level} (CBSE)**.
-The book is intended to align with NCERT, NCF, and NEP 2020 guidelines for Computer Science education.
+def create_science_art_prompt(grade_level, model_progression_text, word_limits=None):
+    """Creates a science subject art integration prompt with dynamic word limits"""
+    return _build_prompt("science", "art", grade_level, model_progression_text, word_limits)
 
-**CRITICAL INSTRUCTION**: The PDF may contain MULTIPLE MAJOR SECTIONS (e.g., Section 1, Section 2, Section 3, etc.). You MUST include ALL sections present in the PDF. Do NOT stop after completing just one or two sections. Generate comprehensive content for EVERY section found in the document.
+# Computer Science specific prompt functions
+_COMPUTER_CHAPTER_DEFAULTS = MappingProxyType({
+    'hook': 80,
+    'learning_outcome': 70,
+    'real_world': 70,
+    'previous_class': 100,
+    'current_concepts': 4500,
+    'summary': 100,
+    'exercises': 1000,
+    'skill_activity': 100
+})
+
+_COMPUTER_CHAPTER_TMPL = string.Template(_COMPUTER_CHAPTER_HEADER + """**CRITICAL INSTRUCTION**: The PDF may contain MULTIPLE MAJOR SECTIONS (e.g., Section 1, Section 2, Section 3, etc.). You MUST include ALL sections present in the PDF. Do NOT stop after completing just one or two sections. Generate comprehensive content for EVERY section found in the document.
 
 **Model Chapter Progression and Elements (Base Structure):**
 ---
-{model_progression_text}
+${model_progression_text}
 ---
 
-**Target Audience:** {grade_level} (CBSE Computer Science Syllabus)
+**Target Audience:** ${grade_level} (CBSE Computer Science Syllabus)
 
 Your task is to generate COMPREHENSIVE COMPUTER SCIENCE CHAPTER CONTENT following the Model Chapter Progression structure enhanced with computer science-specific elements.
 
@@ -2230,25 +2524,25 @@ Your task is to generate COMPREHENSIVE COMPUTER SCIENCE CHAPTER CONTENT followin
 
 1. **Chapter Title** - Engaging and technology-focused
 
-2. **Hook (with Image Prompt)** (Target: {word_limits.get('hook', 80)} words)
+2. **Hook (with Image Prompt)** (Target: ${hook} words)
    - Create an engaging technological opening that captures student interest
    - Use real-life technology scenarios, digital innovations, or computational challenges
    - Connect to students' digital experiences and interests
    - Include a detailed image prompt for a compelling tech visual
 
-3. **Real-World Connection** (Target: {word_limits.get('real_world', 70)} words)
+3. **Real-World Connection** (Target: ${real_world} words)
    - Provide multiple real-world applications of the computer science concepts
    - Show how technology is transforming various industries
    - Include examples from gaming, apps, AI, robotics, web development, etc.
    - Connect to tech careers and future opportunities
 
-4. **Learning Outcomes** (Target: {word_limits.get('learning_outcome', 70)} words)
+4. **Learning Outcomes** (Target: ${learning_outcome} words)
    - List specific, measurable computer science learning objectives
    - Use action verbs (code, debug, design, implement, analyze, create, etc.)
    - Align with Bloom's Taxonomy for computational thinking
    - Connect to CBSE computer science curriculum standards
 
-5. **Previous Class Link** (Target: {word_limits.get('previous_class', 100)} words)
+5. **Previous Class Link** (Target: ${previous_class} words)
    - Link to prior computer science knowledge from previous classes
    - Explain how previous concepts build into current learning
    - Provide a brief review of essential prerequisites
@@ -2271,7 +2565,7 @@ Your task is to generate COMPREHENSIVE COMPUTER SCIENCE CHAPTER CONTENT followin
    - Create 5-7 engaging warm-up activities that connect to prior tech knowledge
    - Include unplugged activities, quick challenges, or digital puzzles
 
-10. **Current Concepts** (Target: {word_limits.get('current_concepts', 4500)} words minimum PER SECTION)
+10. **Current Concepts** (Target: ${current_concepts} words minimum PER SECTION)
     
     For each major concept in EACH section, include ALL of the following:
     
@@ -2360,7 +2654,7 @@ Your task is to generate COMPREHENSIVE COMPUTER SCIENCE CHAPTER CONTENT followin
     - 2-3 common mistakes per concept
     - How to identify and fix them
 
-12. **Summary/Points to Remember** (Target: {word_limits.get('summary', 100)} words)
+12. **Summary/Points to Remember** (Target: ${summary} words)
     - Key takeaways from the chapter
     - Essential concepts and skills learned
     - Important technical points to remember
@@ -2369,7 +2663,7 @@ Your task is to generate COMPREHENSIVE COMPUTER SCIENCE CHAPTER CONTENT followin
     - Programming skills checklist
     - Concept understanding verification
 
-14. **Chapter-wise Lab Exercise** (Target: {word_limits.get('exercises', 1000)} words)
+14. **Chapter-wise Lab Exercise** (Target: ${exercises} words)
     - Comprehensive Lab Project
     - Multiple Choice Questions (5)
     - Fill in the Blanks (5)
@@ -2384,7 +2678,7 @@ Your task is to generate COMPREHENSIVE COMPUTER SCIENCE CHAPTER CONTENT followin
     - Answer the Following Questions - Short (5)
     - Answer the Following Questions - Long (5)
 
-15. **Apply Your Digital Skills** (Target: {word_limits.get('skill_activity', 100)} words)
+15. **Apply Your Digital Skills** (Target: ${skill_activity} words)
     - Real-world technology project
     - Cross-curricular integration
 
@@ -2398,26 +2692,18 @@ Your task is to generate COMPREHENSIVE COMPUTER SCIENCE CHAPTER CONTENT followin
 * DO NOT copy code directly from the PDF - create new examples
 
 Provide ONLY the comprehensive computer science chapter content in Markdown format. Remember to include EVERY section found in the PDF document.
-"""
-
-def create_computer_exercises_prompt(grade_level, model_progression_text, word_limits=None):
-    """Creates a computer science-specific exercises prompt"""
-    if word_limits is None:
-        word_limits = {
-            'exercises': 800
-        }
-    return f"""You are an expert in computer science education content development, specifically for CBSE curriculum.
-This is the user's OWN CONTENT being used for EDUCATIONAL PURPOSES ONLY.
+""")
 
-You are analyzing a computer science book chapter intended for **{grade_level} (CBSE)**.
+def create_computer_chapter_prompt(grade_level, model_progression_text, word_limits=None):
+    """Creates a computer science-specific chapter content prompt"""
+    return _build_prompt("computer", "chapter", grade_level, model_progression_text, word_limits)
 
-**Model Chapter Progression and Elements:**
----
-{model_progression_text}
----
+_COMPUTER_EXERCISES_DEFAULTS = MappingProxyType({
+    'exercises': 800
+})
 
-Your task is to generate COMPREHENSIVE COMPUTER SCIENCE EXERCISES based on the chapter content in the PDF.
-**Target Total Word Count for All Exercises**: {word_limits.get('exercises', 800)} words
+_COMPUTER_EXERCISES_TMPL = string.Template(_COMPUTER_ACTIVITY_HEADER + """Your task is to generate COMPREHENSIVE COMPUTER SCIENCE EXERCISES based on the chapter content in the PDF.
+**Target Total Word Count for All Exercises**: ${exercises} words
 
 **Core Computer Science Exercise Types:**
 1. **MCQ (Multiple Choice Questions)** - at least 12 questions covering theory and concepts
@@ -2449,33 +2735,25 @@ Ensure that:
 * Questions cover ALL important computer science concepts from the PDF
 * Include practical coding exercises, not just theory
 * Questions progress from basic recall to complex problem-solving
-* Language and complexity are appropriate for {grade_level}
+* Language and complexity are appropriate for ${grade_level}
 * All exercises include detailed solutions with explanations
 * Code examples use proper syntax and best practices
 
 Provide ONLY the comprehensive computer science exercises in Markdown format.
-"""
-
-def create_computer_skills_prompt(grade_level, model_progression_text, word_limits=None):
-    """Creates a computer science-specific skills and lab activities prompt"""
-    if word_limits is None:
-        word_limits = {
-            'skill_activity': 400,
-            'stem_activity': 400
-        }
-    return f"""You are an expert in computer science education content development, specifically for CBSE curriculum.
-This is the user's OWN CONTENT being used for EDUCATIONAL PURPOSES ONLY.
+""")
 
-You are analyzing a computer science book chapter intended for **{grade_level} (CBSE)**.
+def create_computer_exercises_prompt(grade_level, model_progression_text, word_limits=None):
+    """Creates a computer science-specific exercises prompt"""
+    return _build_prompt("computer", "exercises", grade_level, model_progression_text, word_limits)
 
-**Model Chapter Progression and Elements:**
----
-{model_progression_text}
----
+_COMPUTER_SKILLS_DEFAULTS = MappingProxyType({
+    'skill_activity': 400,
+    'stem_activity': 400
+})
 
-Your task is to generate COMPUTER SCIENCE SKILL-BASED ACTIVITIES and LAB PROJECTS.
+_COMPUTER_SKILLS_TMPL = string.Template(_COMPUTER_ACTIVITY_HEADER + """Your task is to generate COMPUTER SCIENCE SKILL-BASED ACTIVITIES and LAB PROJECTS.
 
-## Computer Science Skill-Based Activities (Target: {word_limits.get('skill_activity', 400)} words)
+## Computer Science Skill-Based Activities (Target: ${skill_activity} words)
 
 Create at least 3 comprehensive hands-on activities:
 
@@ -2499,7 +2777,7 @@ Create at least 3 comprehensive hands-on activities:
 - Digital Art/Animation Creation
 - Robotics/IoT Projects (conceptual if hardware unavailable)
 
-## Computer Lab Projects (STEM Integration) (Target: {word_limits.get('stem_activity', 400)} words)
+## Computer Lab Projects (STEM Integration) (Target: ${stem_activity} words)
 
 Create at least 2 comprehensive lab projects that integrate computer science with other STEM fields:
 
@@ -2532,26 +2810,18 @@ Include for each activity:
 Format the content in Markdown with proper code formatting using triple backticks for code blocks.
 
 Provide ONLY the Computer Science Skill Activities and Lab Projects in Markdown format.
-"""
-
-def create_computer_art_prompt(grade_level, model_progression_text, word_limits=None):
-    """Creates a computer science-specific creative and case study prompt"""
-    if word_limits is None:
-        word_limits = {
-            'art_learning': 400
-        }
-    return f"""You are an expert in computer science education content development, specifically for CBSE curriculum.
-This is the user's OWN CONTENT being used for EDUCATIONAL PURPOSES ONLY.
+""")
 
-You are analyzing a computer science book chapter intended for **{grade_level} (CBSE)**.
+def create_computer_skills_prompt(grade_level, model_progression_text, word_limits=None):
+    """Creates a computer science-specific skills and lab activities prompt"""
+    return _build_prompt("computer", "skills", grade_level, model_progression_text, word_limits)
 
-**Model Chapter Progression and Elements:**
----
-{model_progression_text}
----
+_COMPUTER_ART_DEFAULTS = MappingProxyType({
+    'art_learning': 400
+})
 
-Your task is to generate COMPUTER SCIENCE CREATIVE PROJECTS and CASE STUDIES.
-**Target Total Word Count for All Art-Integrated Learning**: {word_limits.get('art_learning', 400)} words
+_COMPUTER_ART_TMPL = string.Template(_COMPUTER_ACTIVITY_HEADER + """Your task is to generate COMPUTER SCIENCE CREATIVE PROJECTS and CASE STUDIES.
+**Target Total Word Count for All Art-Integrated Learning**: ${art_learning} words
 
 ## Digital Creativity Projects
 
@@ -2581,7 +2851,7 @@ Create at least 3 creative projects that blend computer science with artistic ex
 
 **Case Study – Level 1 (Foundational Analysis):**
 Create at least 1 accessible case study that:
-- Presents a real-world technology scenario appropriate for {grade_level}
+- Presents a real-world technology scenario appropriate for ${grade_level}
 - Includes guided analysis of technical solutions
 - Focuses on problem-solving with technology
 - Is accessible to students with basic computer skills
@@ -2620,7 +2890,30 @@ Include for each case study:
 Format the content in Markdown with proper formatting for code examples.
 
 Provide ONLY the Computer Science Creative Projects and Case Studies in Markdown format.
-"""
+""")
+
+def create_computer_art_prompt(grade_level, model_progression_text, word_limits=None):
+    """Creates a computer science-specific creative and case study prompt"""
+    return _build_prompt("computer", "art", grade_level, model_progression_text, word_limits)
+
+_SUBJECT_PROMPTS = {
+    ("science", "chapter"): (_SCIENCE_CHAPTER_DEFAULTS, _SCIENCE_CHAPTER_TMPL),
+    ("science", "exercises"): (_SCIENCE_EXERCISES_DEFAULTS, _SCIENCE_EXERCISES_TMPL),
+    ("science", "skills"): (_SCIENCE_SKILLS_DEFAULTS, _SCIENCE_SKILLS_TMPL),
+    ("science", "art"): (_SCIENCE_ART_DEFAULTS, _SCIENCE_ART_TMPL),
+    ("computer", "chapter"): (_COMPUTER_CHAPTER_DEFAULTS, _COMPUTER_CHAPTER_TMPL),
+    ("computer", "exercises"): (_COMPUTER_EXERCISES_DEFAULTS, _COMPUTER_EXERCISES_TMPL),
+    ("computer", "skills"): (_COMPUTER_SKILLS_DEFAULTS, _COMPUTER_SKILLS_TMPL),
+    ("computer", "art"): (_COMPUTER_ART_DEFAULTS, _COMPUTER_ART_TMPL),
+}
+
+def _build_prompt(subject, kind, grade_level, model_progression_text, word_limits=None):
+    """Fills the science/computer science template for one content kind"""
+    defaults, template = _SUBJECT_PROMPTS[subject, kind]
+    params = defaults | (word_limits or {})
+    params['grade_level'] = grade_level
+    params['model_progression_text'] = model_progression_text
+    return template.substitute(params)
 
 # English Communication & Grammar (Classes 1-8) specific prompt functions
 def create_english_chapter_prompt(grade_level, word_limits=None):
@@ -5234,265 +5527,498 @@ Create at least 4 innovative projects that showcase AI applications across domai
 Provide comprehensive AI CSL creative projects in Markdown format.
 """
 
-def generate_specific_content(content_type, pdf_bytes, pdf_filename, grade_level, model_progression_text, subject_type="Science", word_limits=None, use_chunked=False, use_openrouter_method=False, pdf_method="Text Extraction (Original)"):
-    """Generates specific content based on content type"""
-    
+# Word-limit keys that size each non-chapter content type (layouts name them differently)
+_CONTENT_TYPE_WORD_KEYS = {
+    "exercises": ("exercises",),
+    "skills": ("skill_activity", "skills"),
+    "art": ("art_learning", "art", "projects"),
+}
+# Reasoning tokens count against max_tokens, so estimates never go below this
+MIN_ESTIMATED_MAX_TOKENS = 32768
+
+def _estimate_max_tokens(word_limits, content_type, ceiling):
+    """Sizes max_tokens from the content type's own word target, never exceeding the subject's ceiling"""
+    # Chapter targets repeat for every section in the PDF, so their sum is not an upper bound
+    if content_type == "chapter" or not word_limits:
+        return ceiling
+    words = next((word_limits[key] for key in _CONTENT_TYPE_WORD_KEYS.get(content_type, ()) if key in word_limits), None)
+    if words is None:
+        return ceiling
+    # ~1.7 tokens per word, plus generous headroom for markdown, worked solutions and model reasoning
+    return min(ceiling, max(MIN_ESTIMATED_MAX_TOKENS, int(words * 1.7) + 24576))
+
+def _prepare_specific_request(content_type, pdf_bytes, pdf_filename, grade_level, model_progression_text, subject_type="Science", word_limits=None, use_openrouter_method=False, pdf_method="Text Extraction (Original)"):
+    """Builds the chat completion arguments for one content type, or None if the PDF could not be processed"""
     # Special handling for AI Composite Skill Lab without PDF
     if subject_type == "Artificial Intelligence (Composite Skill Lab)" and pdf_bytes is None:
         # Direct generation without PDF for AI textbook/CSL creation
-        try:
-            prompt = create_specific_prompt(content_type, grade_level, model_progression_text, subject_type, word_limits)
-            
-            # Show info for content generation
-            st.info(f"Generating {content_type} content for {grade_level}...")
-            
-            # Direct API call without PDF content
-            messages = [{"role": "user", "content": prompt}]
-            
-            # Use different max_tokens based on subject
-            if subject_type == "Artificial Intelligence":
-                max_tokens = 70000  # CBSE AI curriculum
-            else:
-                max_tokens = 80000  # AI CSL needs more for advanced topics
-            
-            completion = client.chat.completions.create(
-                extra_headers={
-                    "HTTP-Referer": YOUR_SITE_URL,
-                    "X-Title": YOUR_SITE_NAME,
-                },
-                model=MODEL_NAME,
-                messages=messages,
-                max_tokens=max_tokens,
-                temperature=0.4,
-            )
-            
-            content = completion.choices[0].message.content
-            return content, "Success"
-            
-        except Exception as e:
-            return None, f"Error generating AI content: {str(e)}"
+        prompt = create_specific_prompt(content_type, grade_level, model_progression_text, subject_type, word_limits)
+        
+        # Show info for content generation
+        st.info(f"Generating {content_type} content for {grade_level}...")
+        
+        # Direct API call without PDF content (AI CSL needs more tokens for advanced topics)
+        return {
+            "messages": [{"role": "user", "content": prompt}],
+            "max_tokens": 80000,
+            "temperature": 0.4,
+        }
     
-    # Regular flow for other subjects with PDF
-    if not use_chunked:
-        # Standard approach
-        try:
-            # Get the specific prompt (Mathematics Primary doesn't use model_progression_text)
-            if subject_type == "Mathematics Primary (Classes 1-5)":
-                prompt = create_specific_prompt(content_type, grade_level, None, subject_type, word_limits)
-            else:
-                prompt = create_specific_prompt(content_type, grade_level, model_progression_text, subject_type, word_limits)
-            
-            # Show info for content generation
-            st.info(f"Generating {content_type} content for {grade_level}...")
-            
-            if use_openrouter_method:
-                # Use OpenRouter's recommended direct PDF upload
-                messages = create_messages_with_pdf_openrouter(prompt, pdf_bytes, pdf_filename)
-                
-                # Configure PDF processing engine
-                plugins = [
-                    {
-                        "id": "file-parser",
-                        "pdf": {
-                            "engine": "pdf-text"  # or "mistral-ocr" for OCR
-                        }
-                    }
-                ]
-                
-                # Determine max tokens based on content type and subject
-                if subject_type == "Mathematics" and content_type == "chapter":
-                    max_tokens = 131072
-                elif subject_type == "Robotics":
-                    max_tokens = 80000  # Increased for comprehensive Robotics content
-                elif subject_type == "Artificial Intelligence (Composite Skill Lab)":
-                    max_tokens = 80000  # AI CSL with advanced topics
-                else:
-                    max_tokens = 65536
-                
-                # Make API call with plugins
-                completion = client.chat.completions.create(
-                    extra_headers={
-                        "HTTP-Referer": YOUR_SITE_URL,
-                        "X-Title": YOUR_SITE_NAME,
-                    },
-                    model=MODEL_NAME,
-                    messages=messages,
-                    plugins=plugins,
-                    max_tokens=max_tokens,
-                    temperature=0.3,
-                )
-            else:
-                # Use text extraction method (original or Mistral OCR)
-                if pdf_method == "Mistral OCR (Advanced)":
-                    st.info("🔍 **DEBUG:** Attempting Mistral OCR processing...")
-                    # Use Mistral OCR for advanced text extraction
-                    pdf_text, pdf_images = process_pdf_with_mistral_ocr(pdf_bytes, pdf_filename)
-                    if pdf_text is None:
-                        st.error("🔍 **DEBUG:** Mistral OCR failed - returning error")
-                        return None, "Failed to process PDF with Mistral OCR"
-                    st.success("🔍 **DEBUG:** Mistral OCR succeeded - proceeding with OCR content")
-                    # Create messages with Mistral OCR content
-                    messages = create_messages_with_mistral_ocr_content(prompt, pdf_text, pdf_images)
-                else:
-                    st.info(f"🔍 **DEBUG:** Using method: {pdf_method}")
-                # Use original text extraction method
-                pdf_text = extract_text_from_pdf(pdf_bytes)
-                pdf_images = extract_images_from_pdf(pdf_bytes)
-                # Create messages with PDF content
-                messages = create_messages_with_pdf_content(prompt, pdf_text, pdf_images)
-                
-                # Determine max tokens based on content type and subject
-                if subject_type == "Mathematics" and content_type == "chapter":
-                    max_tokens = 131072
-                elif subject_type == "Robotics":
-                    max_tokens = 80000  # Increased for comprehensive Robotics content
-                elif subject_type == "Artificial Intelligence (Composite Skill Lab)":
-                    max_tokens = 80000  # AI CSL with advanced topics
-                else:
-                    max_tokens = 65536
-                
-                # Make API call
-                completion = client.chat.completions.create(
-                    extra_headers={
-                        "HTTP-Referer": YOUR_SITE_URL,
-                        "X-Title": YOUR_SITE_NAME,
-                    },
-                    model=MODEL_NAME,
-                    messages=messages,
-                    max_tokens=max_tokens,
-                    temperature=0.3,
-                )
+    # Get the specific prompt (Mathematics Primary doesn't use model_progression_text)
+    if subject_type == "Mathematics Primary (Classes 1-5)":
+        prompt = create_specific_prompt(content_type, grade_level, None, subject_type, word_limits)
+    else:
+        prompt = create_specific_prompt(content_type, grade_level, model_progression_text, subject_type, word_limits)
+    
+    # Show info for content generation
+    st.info(f"Generating {content_type} content for {grade_level}...")
+    
+    request = {}
+    if use_openrouter_method:
+        # Use OpenRouter's recommended direct PDF upload
+        messages = create_messages_with_pdf_openrouter(prompt, pdf_bytes, pdf_filename)
+        
+        # Configure PDF processing engine (an OpenRouter field, so it goes through the SDK's extra_body)
+        request["extra_body"] = {"plugins": PDF_TEXT_PLUGINS}
+    else:
+        # Use text extraction method (original or Mistral OCR)
+        if pdf_method == "Mistral OCR (Advanced)":
+            st.info("🔍 **DEBUG:** Attempting Mistral OCR processing...")
+            # Use Mistral OCR for advanced text extraction
+            pdf_text, pdf_images = process_pdf_with_mistral_ocr_cached(pdf_bytes, pdf_filename)
+            if pdf_text is None:
+                st.error("🔍 **DEBUG:** Mistral OCR failed - returning error")
+                return None
+            st.success("🔍 **DEBUG:** Mistral OCR succeeded - proceeding with OCR content")
+            # Create messages with Mistral OCR content
+            messages = create_messages_with_mistral_ocr_content(prompt, pdf_text, pdf_images)
+        else:
+            st.info(f"🔍 **DEBUG:** Using method: {pdf_method}")
+            # Use original text extraction method
+            pdf_text, pdf_images = extract_text_and_images(pdf_bytes)
+            # Create messages with PDF content
+            messages = create_messages_with_pdf_content(prompt, pdf_text, pdf_images)
+    
+    # Determine max tokens based on content type and subject
+    if subject_type == "Mathematics" and content_type == "chapter":
+        max_tokens = 131072
+    elif subject_type == "Robotics":
+        max_tokens = 80000  # Increased for comprehensive Robotics content
+    elif subject_type == "Artificial Intelligence (Composite Skill Lab)":
+        max_tokens = 80000  # AI CSL with advanced topics
+    else:
+        max_tokens = 65536
+    
+    request["messages"] = messages
+    request["max_tokens"] = _estimate_max_tokens(word_limits, content_type, max_tokens)
+    request["temperature"] = 0.3
+    return request
+
+def _complete_specific_request(request, use_streaming=False):
+    """Sends a prepared request to OpenRouter, optionally streaming the response into the page as it arrives"""
+    completion = client.chat.completions.create(
+        extra_headers=OPENROUTER_EXTRA_HEADERS,
+        model=MODEL_NAME,
+        stream=use_streaming,
+        **request
+    )
+    if not use_streaming:
+        return completion.choices[0].message.content
+    
+    return st.write_stream(
+        chunk.choices[0].delta.content
+        for chunk in completion
+        if chunk.choices and chunk.choices[0].delta.content
+    )
+
+def _llm_cache_key(prompt, pdf_bytes, use_openrouter_method, pdf_method, use_chunked=False):
+    """Hashes everything that determines a generated response (the chunked approach writes differently, so it is part of the key)"""
+    key = hashlib.blake2b(digest_size=32)
+    for part in (prompt, pdf_content_key(pdf_bytes) if pdf_bytes else "", MODEL_NAME, str(use_openrouter_method), pdf_method, str(use_chunked)):
+        key.update(part.encode("utf-8"))
+        key.update(b"\x00")
+    return key.hexdigest()
+
+def _completion_cache_key(messages, max_tokens, temperature):
+    """Hashes a completion call's model, parameters and messages"""
+    payload = json.dumps([MODEL_NAME, max_tokens, temperature, messages], sort_keys=True, default=str)
+    return hashlib.blake2b(payload.encode("utf-8"), digest_size=32).hexdigest()
+
+def _llm_cache_get(cache_key):
+    """Returns a stored response younger than LLM_CACHE_TTL_SECONDS, or None"""
+    try:
+        with closing(sqlite3.connect(LLM_CACHE_PATH)) as conn:
+            conn.execute("CREATE TABLE IF NOT EXISTS responses (key TEXT PRIMARY KEY, content TEXT NOT NULL, created REAL NOT NULL)")
+            row = conn.execute(
+                "SELECT content FROM responses WHERE key = ? AND created > ?",
+                (cache_key, time.time() - LLM_CACHE_TTL_SECONDS)
+            ).fetchone()
+        return row[0] if row else None
+    except sqlite3.Error:
+        return None
+
+def _llm_cache_set(cache_key, content):
+    """Stores a generated response and evicts expired and excess rows; cache write failures never break generation"""
+    try:
+        with closing(sqlite3.connect(LLM_CACHE_PATH)) as conn, conn:
+            conn.execute("CREATE TABLE IF NOT EXISTS responses (key TEXT PRIMARY KEY, content TEXT NOT NULL, created REAL NOT NULL)")
+            now = time.time()
+            conn.execute(
+                "INSERT OR REPLACE INTO responses (key, content, created) VALUES (?, ?, ?)",
+                (cache_key, content, now)
+            )
+            # Freed pages are reused by later writes, so the file stops growing once the cap is reached
+            conn.execute("DELETE FROM responses WHERE created <= ?", (now - LLM_CACHE_TTL_SECONDS,))
+            conn.execute(
+                "DELETE FROM responses WHERE key NOT IN (SELECT key FROM responses ORDER BY created DESC LIMIT ?)",
+                (LLM_CACHE_MAX_ENTRIES,)
+            )
+    except sqlite3.Error:
+        pass
+
+def generate_specific_content(content_type, pdf_bytes, pdf_filename, grade_level, model_progression_text, subject_type="Science", word_limits=None, use_chunked=False, use_openrouter_method=False, pdf_method="Text Extraction (Original)", use_streaming=False, force_refresh=False):
+    """Generates specific content based on content type, reusing stored responses for identical requests"""
+    prompt = create_specific_prompt(content_type, grade_level, model_progression_text, subject_type, word_limits)
+    cache_key = _llm_cache_key(prompt, pdf_bytes, use_openrouter_method, pdf_method, use_chunked)
+    
+    if not force_refresh:
+        cached_content = _llm_cache_get(cache_key)
+        if cached_content is not None:
+            return cached_content, "Loaded from response cache (use force refresh to regenerate)."
+    
+    wait_for_pdf_prefetch()
+    content, message, complete = _generate_specific_content_uncached(content_type, pdf_bytes, pdf_filename, grade_level, model_progression_text, 
+                                                                     subject_type, word_limits, use_chunked, use_openrouter_method, pdf_method, use_streaming, force_refresh)
+    # Partial results (failed chunks, integration fallbacks) are shown once but never served from the cache
+    if content and complete:
+        _llm_cache_set(cache_key, content)
+    return content, message
+
+def _generate_specific_content_uncached(content_type, pdf_bytes, pdf_filename, grade_level, model_progression_text, subject_type="Science", word_limits=None, use_chunked=False, use_openrouter_method=False, pdf_method="Text Extraction (Original)", use_streaming=False, force_refresh=False):
+    """Generates specific content based on content type; returns (content, message, complete), complete only for full successes"""
+    
+    # Special handling for AI Composite Skill Lab without PDF
+    if subject_type == "Artificial Intelligence (Composite Skill Lab)" and pdf_bytes is None:
+        try:
+            request = _prepare_specific_request(content_type, pdf_bytes, pdf_filename, grade_level, model_progression_text, subject_type, word_limits)
             
-            result_text = completion.choices[0].message.content
+            content = _complete_specific_request(request, use_streaming)
+            return content, "Success", True
             
-            return result_text, "Generated successfully using standard approach."
+        except Exception as e:
+            return None, f"Error generating AI content: {str(e)}", False
+    
+    # Regular flow for other subjects with PDF
+    if not use_chunked:
+        # Standard approach
+        try:
+            request = _prepare_specific_request(content_type, pdf_bytes, pdf_filename, grade_level, model_progression_text, 
+                                                subject_type, word_limits, use_openrouter_method, pdf_method)
+            if request is None:
+                return None, "Failed to process PDF with Mistral OCR", False
+            
+            # Make API call (with plugins for direct PDF upload)
+            result_text = _complete_specific_request(request, use_streaming)
+            
+            if use_streaming:
+                return result_text, "Generated successfully using streaming approach.", True
+            return result_text, "Generated successfully using standard approach.", True
             
         except Exception as e:
             st.error(f"Error during content generation: {e}")
             if "token" in str(e).lower() or "limit" in str(e).lower():
                 st.info("Document might be too large. Trying chunked approach...")
-                return generate_specific_content(content_type, pdf_bytes, pdf_filename, grade_level, 
-                                               model_progression_text, subject_type, word_limits, use_chunked=True, use_openrouter_method=use_openrouter_method)
-            return None, f"Error: {str(e)}"
+                # Page text and images from the failed attempt are cached by content hash, so the retry goes straight to the chunk calls
+                return _generate_specific_content_uncached(content_type, pdf_bytes, pdf_filename, grade_level, 
+                                                           model_progression_text, subject_type, word_limits, use_chunked=True, use_openrouter_method=use_openrouter_method, 
+                                                           pdf_method=pdf_method, force_refresh=force_refresh)
+            return None, f"Error: {str(e)}", False
     else:
         # Chunked approach
         return analyze_with_chunked_approach_for_specific_content(content_type, pdf_bytes, pdf_filename, 
-                                                                 grade_level, model_progression_text, subject_type, word_limits, use_openrouter_method, pdf_method)
-
-def analyze_with_chunked_approach_for_specific_content(content_type, pdf_bytes, pdf_filename, 
-                                                       grade_level, model_progression_text, subject_type, word_limits, use_openrouter_method, pdf_method="Text Extraction (Original)"):
-    """Specialized chunked approach for specific content types"""
-    st.info(f"Using chunked approach to generate {content_type} content...")
+                                                                 grade_level, model_progression_text, subject_type, word_limits, use_openrouter_method, pdf_method, 
+                                                                 force_refresh=force_refresh)
+
+async def generate_specific_content_async(content_type, pdf_bytes, pdf_filename, grade_level, model_progression_text, async_client, semaphore, subject_type="Science", word_limits=None, use_openrouter_method=False, pdf_method="Text Extraction (Original)", placeholder=None, force_refresh=False):
+    """Generates specific content with the async client, collecting the streamed response (shown live in placeholder if given)"""
+    # Same key as generate_specific_content, so Generate All and the per-type buttons reuse each other's results
+    prompt = create_specific_prompt(content_type, grade_level, model_progression_text, subject_type, word_limits)
+    cache_key = _llm_cache_key(prompt, pdf_bytes, use_openrouter_method, pdf_method)
+    if not force_refresh:
+        cached_content = _llm_cache_get(cache_key)
+        if cached_content is not None:
+            return cached_content, "Loaded from response cache (use force refresh to regenerate)."
     
     try:
-        # Extract text from PDF for determining page chunks
-        doc = fitz.open(stream=pdf_bytes, filetype="pdf")
-        total_pages = len(doc)
+        request = _prepare_specific_request(content_type, pdf_bytes, pdf_filename, grade_level, model_progression_text, 
+                                            subject_type, word_limits, use_openrouter_method, pdf_method)
+        if request is None:
+            return None, "Failed to process PDF with Mistral OCR"
         
-        # Determine chunk size
-        pages_per_chunk = 5
+        async with semaphore:
+            stream = await async_client.chat.completions.create(
+                extra_headers=OPENROUTER_EXTRA_HEADERS,
+                model=MODEL_NAME,
+                stream=True,
+                **request
+            )
+            
+            content_parts = []
+            last_render_time = 0.0
+            async for chunk in stream:
+                if chunk.choices and chunk.choices[0].delta.content:
+                    content_parts.append(chunk.choices[0].delta.content)
+                    # The event loop runs on the script thread, so placeholders can be updated directly
+                    if placeholder is not None and time.monotonic() - last_render_time >= STREAM_RENDER_INTERVAL:
+                        last_render_time = time.monotonic()
+                        placeholder.markdown("".join(content_parts) + " ⏳")
         
-        # Process chunks
-        analysis_results = []
+        if placeholder is not None:
+            placeholder.empty()
+        content = "".join(content_parts)
+        # The stream ran to the end without error, so the response is complete
+        if content:
+            _llm_cache_set(cache_key, content)
+        return content, "Generated successfully using concurrent approach."
         
-        for start_page in range(0, total_pages, pages_per_chunk):
-            end_page = min(start_page + pages_per_chunk - 1, total_pages - 1)
-            st.info(f"Analyzing chunk: Pages {start_page+1}-{end_page+1} of {total_pages}...")
-            
-            # Extract text and images for this chunk
-            chunk_text = ""
-            chunk_images = []
-            
-            for page_num in range(start_page, end_page + 1):
-                page = doc.load_page(page_num)
-                chunk_text += f"\n\n--- Page {page_num + 1} ---\n"
-                chunk_text += page.get_text()
-                
-                # Extract all images
-                image_list = page.get_images(full=True)
-                for img in image_list:  # Include all images from page
-                    try:
-                        xref = img[0]
-                        base_image = doc.extract_image(xref)
-                        image_bytes = base_image["image"]
-                        base64_image = base64.b64encode(image_bytes).decode('utf-8')
-                        ext = base_image["ext"]
-                        chunk_images.append({
-                            "page": page_num + 1,
-                            "base64": f"data:image/{ext};base64,{base64_image}",
-                        })
-                    except:
-                        pass
-            
-            # Analyze this chunk
-            chunk_prompt = f"""You are an expert in educational content development for CBSE curriculum.
+    except Exception as e:
+        return None, f"Error: {str(e)}"
+
+def generate_all(content_types, pdf_bytes, pdf_filename, grade_level, model_progression_text, subject_type="Science", word_limits=None, use_openrouter_method=False, pdf_method="Text Extraction (Original)", placeholders=None, use_chunked=False, force_refresh=False):
+    """Generates several content types (concurrently, or one after another when chunked) and returns {content_type: (content, message)}"""
+    if use_chunked:
+        # The chunked approach runs its own event loop per content type (its chunks are already concurrent)
+        return {
+            content_type: generate_specific_content(content_type, pdf_bytes, pdf_filename, grade_level, model_progression_text, subject_type, word_limits, 
+                                                    use_chunked=True, use_openrouter_method=use_openrouter_method, pdf_method=pdf_method, force_refresh=force_refresh)
+            for content_type in content_types
+        }
+    
+    placeholders = placeholders or {}
+    wait_for_pdf_prefetch()
+    
+    async def run_all():
+        semaphore = asyncio.Semaphore(MAX_CONCURRENT_GENERATIONS)
+        # Async connections are bound to this event loop, so the client lives only for this run
+        async with AsyncOpenAI(
+            base_url="https://openrouter.ai/api/v1",
+            api_key=OPENROUTER_API_KEY,
+            http_client=httpx.AsyncClient(limits=OPENROUTER_HTTP_LIMITS, timeout=OPENROUTER_HTTP_TIMEOUT),
+        ) as async_client:
+            results = await asyncio.gather(*(
+                generate_specific_content_async(content_type, pdf_bytes, pdf_filename, grade_level, model_progression_text, 
+                                                async_client, semaphore, subject_type, word_limits, use_openrouter_method, pdf_method, 
+                                                placeholder=placeholders.get(content_type), force_refresh=force_refresh)
+                for content_type in content_types
+            ))
+        return dict(zip(content_types, results))
+    
+    return asyncio.run(run_all())
+
+_CHUNK_ANALYSIS_PROMPT_TMPL = string.Template("""You are an expert in educational content development for CBSE curriculum.
 This is the user's OWN CONTENT being used for EDUCATIONAL PURPOSES ONLY.
 
-IMPORTANT: You are analyzing CHUNK (Pages {start_page+1}-{end_page+1} of {total_pages}) from a book chapter for **{grade_level} (CBSE)**.
+IMPORTANT: You are analyzing CHUNK (Pages ${first_page}-${last_page} of ${total_pages}) from a book chapter for **${grade_level} (CBSE)**.
 This is just a PORTION of the full chapter - focus only on this section.
 
-You are extracting information relevant for: {content_type.upper()} CONTENT
+You are extracting information relevant for: ${content_type_upper} CONTENT
 
 Please analyze these specific pages and extract:
-* Key concepts, topics, and terminology relevant to {content_type}
+* Key concepts, topics, and terminology relevant to ${content_type}
 * Important facts, examples, and explanations
 * For any images, their content and relevance
-* Any specific information that would be useful for creating {content_type} content
+* Any specific information that would be useful for creating ${content_type} content
 
 Format your analysis in Markdown. This is just an intermediate step - don't create final content yet.
-"""
-            
+""")
+
+_INTEGRATION_PROMPT_TMPL = string.Template("""You are an expert educational content developer for CBSE curriculum.
+You have been given analyses of different chunks of a book chapter for **${grade_level} (CBSE)**.
+Your task is to create comprehensive ${content_type_upper} content based on these analyses.
+
+This is the user's OWN CONTENT being used for EDUCATIONAL PURPOSES ONLY.
+
+**Content Type Requirements:**
+${specific_prompt}
+
+**Analyses from different parts of the chapter:**
+${analyses}
+
+Based on these analyses, create the complete ${content_type_upper} content in Markdown format.
+Ensure it is cohesive, well-structured, and follows all the requirements for ${content_type} content.
+""")
+
+def _chunk_analysis_messages(content_type, grade_level, total_pages, start_page, end_page, chunk_text, chunk_images):
+    """Builds the intermediate analysis request for one page chunk"""
+    chunk_prompt = _CHUNK_ANALYSIS_PROMPT_TMPL.substitute(
+        first_page=start_page + 1,
+        last_page=end_page + 1,
+        total_pages=total_pages,
+        grade_level=grade_level,
+        content_type=content_type,
+        content_type_upper=content_type.upper(),
+    )
+    
+    # Chunks always go as text and images (OpenRouter's PDF upload needs the whole file)
+    return create_messages_with_pdf_content(chunk_prompt, chunk_text, chunk_images)
+
+async def _analyze_chunk(async_client, semaphore, messages, cancel_event, force_refresh=False):
+    """Streams the analysis of one page chunk and returns (text, usage); retries re-send the same messages, cancellation raises"""
+    cache_key = _completion_cache_key(messages, 32768, 0.3)
+    if not force_refresh:
+        cached_content = _llm_cache_get(cache_key)
+        if cached_content is not None:
+            return cached_content, None
+    
+    async with semaphore:
+        for attempt in range(CHUNK_ANALYSIS_ATTEMPTS):
             try:
-                if use_openrouter_method:
-                    # For chunked OpenRouter approach, we'll need to create a temporary PDF for this chunk
-                    # This is a limitation - OpenRouter expects a full PDF, not partial text
-                    # So we'll fall back to text-based approach for chunks
-                    messages = create_messages_with_pdf_content(chunk_prompt, chunk_text, chunk_images)
-                else:
-                    messages = create_messages_with_pdf_content(chunk_prompt, chunk_text, chunk_images)
-                
-                completion = client.chat.completions.create(
-                    extra_headers={
-                        "HTTP-Referer": YOUR_SITE_URL,
-                        "X-Title": YOUR_SITE_NAME,
-                    },
+                stream = await async_client.chat.completions.create(
+                    extra_headers=OPENROUTER_EXTRA_HEADERS,
                     model=MODEL_NAME,
                     messages=messages,
                     max_tokens=32768,
                     temperature=0.3,
+                    stream=True,
+                    stream_options={"include_usage": True},
                 )
                 
-                analysis_chunk = completion.choices[0].message.content
-                analysis_results.append(analysis_chunk)
+                content_parts = []
+                usage = None
+                async for chunk in stream:
+                    if cancel_event is not None and cancel_event.is_set():
+                        await stream.close()
+                        # A cut-off analysis must not be integrated (or cached) as if it were complete
+                        raise RuntimeError("Generation cancelled by user.")
+                    if chunk.choices and chunk.choices[0].delta.content:
+                        content_parts.append(chunk.choices[0].delta.content)
+                    if chunk.usage:
+                        usage = chunk.usage.model_dump()
+                content = "".join(content_parts)
+                if content:
+                    _llm_cache_set(cache_key, content)
+                return content, usage
+            except Exception:
+                if attempt == CHUNK_ANALYSIS_ATTEMPTS - 1 or (cancel_event is not None and cancel_event.is_set()):
+                    raise
+
+def _fit_analyses_to_budget(analyses, budget):
+    """Trims chunk analyses to a shared token budget; short analyses stay whole and the longest are cut"""
+    token_counts = [_count_tokens(analysis) for analysis in analyses]
+    if sum(token_counts) <= budget:
+        return list(analyses)
+    
+    fitted = [None] * len(analyses)
+    remaining = budget
+    # Visit shortest first so budget left unused by short analyses goes to the longer ones
+    order = sorted(range(len(analyses)), key=token_counts.__getitem__)
+    for position, idx in enumerate(order):
+        share = remaining // (len(order) - position)
+        if token_counts[idx] <= share:
+            fitted[idx] = analyses[idx]
+            remaining -= token_counts[idx]
+        else:
+            fitted[idx] = _truncate_to_tokens(analyses[idx], share) + "\n[... analysis truncated ...]"
+            remaining -= share
+    return fitted
+
+def analyze_with_chunked_approach_for_specific_content(content_type, pdf_bytes, pdf_filename, 
+                                                       grade_level, model_progression_text, subject_type, word_limits, use_openrouter_method, pdf_method="Text Extraction (Original)", concurrency=None, force_refresh=False):
+    """Specialized chunked approach for specific content types; returns (content, message, complete)"""
+    st.info(f"Using chunked approach to generate {content_type} content...")
+    concurrency = concurrency or CHUNK_ANALYSIS_CONCURRENCY
+    
+    try:
+        # Per-page text and images are cached by content hash, so a retry after a failed
+        # standard attempt reuses the pages that were already extracted
+        pdf_key = pdf_content_key(pdf_bytes)
+        page_texts, page_images = _cached_page_content(pdf_key, pdf_bytes)
+        total_pages = len(page_texts)
+        
+        # Determine chunk size
+        pages_per_chunk = 5
+        
+        # Assemble text and images for every chunk up front; each distinct image is sent with the first chunk that has it
+        chunks = []
+        seen_image_ids = set()
+        
+        for start_page in range(0, total_pages, pages_per_chunk):
+            end_page = min(start_page + pages_per_chunk - 1, total_pages - 1)
+            
+            # Extract text and images for this chunk
+            chunk_parts = []
+            chunk_images = []
+            
+            for page_num in range(start_page, end_page + 1):
+                chunk_parts.append(f"\n\n--- Page {page_num + 1} ---\n")
+                chunk_parts.append(page_texts[page_num])
+                chunk_images.extend(dedupe_images(page_images[page_num], seen_image_ids))
+            
+            chunks.append((start_page, end_page, "".join(chunk_parts), chunk_images))
+        
+        # Analyze chunks concurrently; results keep page order
+        st.info(f"Analyzing {len(chunks)} chunks of {total_pages} pages (up to {concurrency} at a time)...")
+        analysis_results = [None] * len(chunks)
+        failed_chunks = []  # Indices of chunks that errored; their placeholders make the result partial
+        chunk_messages = [
+            _chunk_analysis_messages(content_type, grade_level, total_pages, *chunk)
+            for chunk in chunks
+        ]
+        cancel_event = st.session_state.get('cancel_event')
+        
+        async def run_chunks():
+            semaphore = asyncio.Semaphore(concurrency)
+            # Async connections are bound to this event loop, so the client lives only for this run
+            async with AsyncOpenAI(
+                base_url="https://openrouter.ai/api/v1",
+                api_key=OPENROUTER_API_KEY,
+                http_client=httpx.AsyncClient(limits=OPENROUTER_HTTP_LIMITS, timeout=OPENROUTER_HTTP_TIMEOUT),
+            ) as async_client:
+                async def run_chunk(idx):
+                    try:
+                        return idx, await _analyze_chunk(async_client, semaphore, chunk_messages[idx], cancel_event, force_refresh), None
+                    except Exception as chunk_e:
+                        return idx, None, chunk_e
                 
-            except Exception as chunk_e:
-                st.warning(f"Error processing chunk: {chunk_e}")
-                analysis_results.append(f"[Error processing pages {start_page+1}-{end_page+1}]")
+                for finished in asyncio.as_completed([run_chunk(idx) for idx in range(len(chunks))]):
+                    idx, result, chunk_e = await finished
+                    start_page, end_page = chunks[idx][:2]
+                    if chunk_e is None:
+                        analysis_results[idx], usage = result
+                        record_token_usage(usage)
+                        st.info(f"Analyzed chunk: Pages {start_page+1}-{end_page+1} of {total_pages}")
+                    else:
+                        st.warning(f"Error processing chunk: {chunk_e}")
+                        analysis_results[idx] = f"[Error processing pages {start_page+1}-{end_page+1}]"
+                        failed_chunks.append(idx)
         
-        doc.close()
+        asyncio.run(run_chunks())
         
-        # Combine chunk analyses
+        # A cancelled run has unfinished chunks, so integrating it would pass partial analyses off as complete
+        if cancel_event is not None and cancel_event.is_set():
+            st.warning("Generation cancelled by user.")
+            return None, "Generation cancelled by user.", False
+
+        # Combine chunk analyses, keeping the integration prompt within its token budget
         combined_analyses = "\n\n".join(analysis_results)
+        analyses_tokens = _count_tokens(combined_analyses)
+        if analyses_tokens > INTEGRATION_ANALYSES_TOKENS:
+            integration_analyses = "\n\n".join(_fit_analyses_to_budget(analysis_results, INTEGRATION_ANALYSES_TOKENS))
+            st.caption(f"Chunk analyses trimmed from ~{analyses_tokens} to ~{_count_tokens(integration_analyses)} tokens for the final step")
+        else:
+            integration_analyses = combined_analyses
         
         # Get the specific prompt for this content type
         specific_prompt = create_specific_prompt(content_type, grade_level, model_progression_text, subject_type, word_limits)
         
         # Create the final integration prompt
-        integration_prompt = f"""You are an expert educational content developer for CBSE curriculum.
-You have been given analyses of different chunks of a book chapter for **{grade_level} (CBSE)**.
-Your task is to create comprehensive {content_type.upper()} content based on these analyses.
-
-This is the user's OWN CONTENT being used for EDUCATIONAL PURPOSES ONLY.
-
-**Content Type Requirements:**
-{specific_prompt}
-
-**Analyses from different parts of the chapter:**
-{combined_analyses}
-
-Based on these analyses, create the complete {content_type.upper()} content in Markdown format.
-Ensure it is cohesive, well-structured, and follows all the requirements for {content_type} content.
-"""
+        integration_prompt = _INTEGRATION_PROMPT_TMPL.substitute(
+            grade_level=grade_level,
+            content_type=content_type,
+            content_type_upper=content_type.upper(),
+            specific_prompt=specific_prompt,
+            analyses=integration_analyses,
+        )
         
         # Generate the final content
         st.info(f"Creating final {content_type} content...")
@@ -5503,38 +6029,47 @@ Ensure it is cohesive, well-structured, and follows all the requirements for {co
             
             messages = [{"role": "user", "content": integration_prompt}]
             
-            final_completion = client.chat.completions.create(
-                extra_headers={
-                    "HTTP-Referer": YOUR_SITE_URL,
-                    "X-Title": YOUR_SITE_NAME,
-                },
-                model=MODEL_NAME,
-                messages=messages,
-                max_tokens=max_tokens,
-                temperature=0.3,
-            )
-            
-            final_content = final_completion.choices[0].message.content
+            usage = {}
+            final_content = _collect_stream(messages, max_tokens, 0.3, cancel_event=cancel_event, usage_out=usage)
+            record_token_usage(usage)
             
-            return final_content, "Generated successfully using chunked approach."
+            if failed_chunks:
+                return final_content, f"Generated using chunked approach, but {len(failed_chunks)} chunk(s) could not be analyzed.", False
+            return final_content, "Generated successfully using chunked approach.", True
             
         except Exception as integration_e:
+            if cancel_event is not None and cancel_event.is_set():
+                st.warning("Generation cancelled by user.")
+                return None, "Generation cancelled by user.", False
             st.error(f"Error during final integration: {integration_e}")
-            return combined_analyses, "Partial analysis complete - final integration failed."
+            return combined_analyses, "Partial analysis complete - final integration failed.", False
             
     except Exception as e:
         st.error(f"Error during chunked analysis: {e}")
-        return None, f"Error during chunked analysis: {str(e)}"
-
-def encode_pdf_to_base64(pdf_bytes):
-    """Encodes PDF bytes to base64 string for OpenRouter API."""
-    return base64.b64encode(pdf_bytes).decode('utf-8')
+        return None, f"Error during chunked analysis: {str(e)}", False
+
+def encode_pdf_to_base64(pdf_bytes, prefix=""):
+    """Encodes PDF bytes to base64 string for OpenRouter API, optionally behind a data-URL prefix."""
+    # Encode in blocks into one preallocated buffer so large PDFs avoid extra full-size copies
+    buffer = bytearray(len(prefix) + 4 * ((len(pdf_bytes) + 2) // 3))
+    buffer[:len(prefix)] = prefix.encode('ascii')
+    view = memoryview(pdf_bytes)
+    out = len(prefix)
+    for start in range(0, len(view), PDF_BASE64_BLOCK):
+        encoded = base64.b64encode(view[start:start + PDF_BASE64_BLOCK])
+        buffer[out:out + len(encoded)] = encoded
+        out += len(encoded)
+    return buffer.decode('ascii')
+
+@st.cache_resource(show_spinner=False, max_entries=8)
+def _cached_pdf_data_url(pdf_key, _pdf_bytes):
+    """Encodes each unique PDF once; cache_resource hands back the same string instead of a copy"""
+    return encode_pdf_to_base64(_pdf_bytes, prefix="data:application/pdf;base64,")
 
 def create_messages_with_pdf_openrouter(prompt, pdf_bytes, pdf_filename):
     """Creates messages array for OpenRouter API with direct PDF upload."""
-    # Encode PDF to base64
-    base64_pdf = encode_pdf_to_base64(pdf_bytes)
-    data_url = f"data:application/pdf;base64,{base64_pdf}"
+    # Encode PDF to base64 (reused across content types for the same PDF)
+    data_url = _cached_pdf_data_url(pdf_content_key(pdf_bytes), pdf_bytes)
     
     messages = [
         {
@@ -5542,7 +6077,9 @@ def create_messages_with_pdf_openrouter(prompt, pdf_bytes, pdf_filename):
             "content": [
                 {
                     "type": "text",
-                    "text": prompt
+                    "text": prompt,
+                    # Prompts are long and reused across regenerations; let Anthropic-family models cache them
+                    "cache_control": {"type": "ephemeral"}
                 },
                 {
                     "type": "file",
@@ -5657,55 +6194,52 @@ Provide the complete, rewritten chapter text in Markdown format, incorporating a
         messages = create_messages_with_pdf_openrouter(prompt_content, pdf_file_bytes, pdf_filename)
         
         # Optional: Configure PDF processing engine
-        plugins = [
-            {
-                "id": "file-parser",
-                "pdf": {
-                    "engine": "pdf-text"  # or "mistral-ocr" for OCR
-                }
-            }
-        ]
+        plugins = PDF_TEXT_PLUGINS
         
-        # Make API call with plugins
-        completion = client.chat.completions.create(
-            extra_headers={
-                "HTTP-Referer": YOUR_SITE_URL,
-                "X-Title": YOUR_SITE_NAME,
-            },
-            model=MODEL_NAME,
-            messages=messages,
-            plugins=plugins,  # Add plugins for PDF processing
-            max_tokens=65536,
-            temperature=0.3,
-        )
-        
-        improved_text = completion.choices[0].message.content
+        # Make API call with plugins, streaming the text as it arrives
+        usage = {}
+        improved_text = _collect_stream(messages, 65536, 0.3, plugins=plugins,
+                                        cancel_event=st.session_state.get('cancel_event'), usage_out=usage)
+        record_token_usage(usage)
         
         return improved_text, "LLM analysis and rewrite complete using Claude via OpenRouter with direct PDF upload."
         
     except Exception as e:
+        if st.session_state.get('cancel_event') is not None and st.session_state.cancel_event.is_set():
+            st.warning("Generation cancelled by user.")
+            return None, "Generation cancelled by user."
         st.error(f"Error during OpenRouter API call: {e}")
         # Fallback to the original text extraction method
         st.info("Trying alternative method with text extraction...")
         return analyze_with_llm(pdf_file_bytes, pdf_filename, model_progression_text, grade_level)
 
-def generate_chat_response(user_prompt, chat_history, uploaded_files, grade_level, subject):
-    """Generate a response from EeeBee for the chat interface"""
-    try:
-        # Build context from chat history
-        conversation_context = ""
-        if len(chat_history) > 1:
-            recent_messages = chat_history[-6:]  # Keep last 6 messages for context
-            for msg in recent_messages[:-1]:  # Exclude the current message
-                conversation_context += f"{msg['role'].title()}: {msg['content']}\n"
-        
-        # Build system prompt for EeeBee
-        system_prompt = f"""You are EeeBee, an expert educational content development assistant specializing in CBSE curriculum.
+def _count_tokens(text):
+    """Estimates the token count of text (about 4 characters per token)"""
+    return (len(text) + 3) // 4
+
+def _truncate_to_tokens(text, max_tokens):
+    """Cuts text down to roughly max_tokens tokens"""
+    return text[:max(max_tokens, 0) * 4]
+
+def _build_conversation_context(chat_history, budget):
+    """Formats the most recent previous chat messages that fit within the token budget"""
+    lines = []
+    tokens_used = 0
+    for msg in reversed(chat_history[:-1]):  # Exclude the current message
+        line = f"{msg['role'].title()}: {msg['content']}\n"
+        line_tokens = _count_tokens(line)
+        if tokens_used + line_tokens > budget:
+            break
+        lines.append(line)
+        tokens_used += line_tokens
+    return "".join(reversed(lines))
+
+_CHAT_SYSTEM_PROMPT_TMPL = string.Template("""You are EeeBee, an expert educational content development assistant specializing in CBSE curriculum.
 You help content teams create, modify, and improve educational materials that align with NCERT, NCF, and NEP 2020 guidelines.
 
 Context:
-- Target Grade: {grade_level}
-- Subject Area: {subject}
+- Target Grade: ${grade_level}
+- Subject Area: ${subject}
 - This is the user's OWN CONTENT being used for EDUCATIONAL PURPOSES ONLY
 
 Your expertise includes:
@@ -5726,42 +6260,70 @@ Guidelines:
 - Maintain consistency with CBSE/NCERT guidelines
 
 Previous conversation:
-{conversation_context}
+${conversation_context}
 
-Current user question: {user_prompt}"""
+Current user question: ${user_prompt}""")
+
+def _chat_pdf_text(uploaded_files, budget):
+    """Extracts the text of chat-uploaded PDFs ((name, bytes) pairs) into one block, sharing the token budget in proportion to length"""
+    pdf_texts = []
+    for file_name, pdf_bytes in uploaded_files:
+        try:
+            pdf_text = extract_text_from_pdf(pdf_bytes)
+            if pdf_text:
+                pdf_texts.append((file_name, pdf_text))
+        except Exception as e:
+            st.warning(f"Could not process {file_name}: {e}")
+    
+    total_tokens = sum(_count_tokens(pdf_text) for _, pdf_text in pdf_texts)
+    parts = []
+    for name, pdf_text in pdf_texts:
+        if total_tokens > budget:
+            pdf_text = _truncate_to_tokens(pdf_text, budget * _count_tokens(pdf_text) // total_tokens)
+        parts.append(f"\n\nContent from {name}:\n{pdf_text}")
+    return "".join(parts)
+
+def generate_chat_response(user_prompt, chat_history, uploaded_files, grade_level, subject):
+    """Generate a response from EeeBee for the chat interface"""
+    try:
+        # Build context from chat history (newest messages first, up to half the prompt budget)
+        history_budget = (CHAT_PROMPT_BUDGET - _count_tokens(user_prompt)) // 2
+        conversation_context = _build_conversation_context(chat_history, history_budget)
+        
+        # Build system prompt for EeeBee
+        system_prompt = _CHAT_SYSTEM_PROMPT_TMPL.substitute(
+            grade_level=grade_level,
+            subject=subject,
+            conversation_context=conversation_context,
+            user_prompt=user_prompt,
+        )
 
         # Prepare content parts
         content_parts = [{"type": "text", "text": system_prompt}]
+        prompt_tokens = _count_tokens(system_prompt)
         
-        # Add uploaded PDFs if any
+        # Add uploaded PDFs if any, as one text part within what is left of the prompt budget
         if uploaded_files:
-            for uploaded_file in uploaded_files:
-                try:
-                    # Extract text from PDF
-                    pdf_bytes = uploaded_file.getvalue()
-                    pdf_text = extract_text_from_pdf(pdf_bytes)
-                    
-                    if pdf_text:
-                        content_parts.append({
-                            "type": "text",
-                            "text": f"\n\nContent from {uploaded_file.name}:\n{pdf_text[:10000]}"  # Limit text length
-                        })
-                    
-                except Exception as e:
-                    st.warning(f"Could not process {uploaded_file.name}: {e}")
+            pdf_part_text = _chat_pdf_text(uploaded_files, CHAT_PROMPT_BUDGET - prompt_tokens)
+            if pdf_part_text:
+                prompt_tokens += _count_tokens(pdf_part_text)
+                content_parts.append({
+                    "type": "text",
+                    "text": pdf_part_text
+                })
         
         # Create messages
         messages = [{"role": "user", "content": content_parts}]
         
+        if CHAT_TOKEN_DEBUG:
+            st.caption(f"Chat prompt: ~{prompt_tokens} tokens (budget {CHAT_PROMPT_BUDGET})")
+        
         # Generate response
         completion = client.chat.completions.create(
-            extra_headers={
-                "HTTP-Referer": YOUR_SITE_URL,
-                "X-Title": YOUR_SITE_NAME,
-            },
+            extra_headers=OPENROUTER_EXTRA_HEADERS,
             model=MODEL_NAME,
             messages=messages,
-            max_tokens=8192,
+            max_tokens=CHAT_MAX_TOKENS,
             temperature=0.7,
         )
         
@@ -5773,150 +6335,217 @@ Current user question: {user_prompt}"""
 def generate_chat_response_stream(user_prompt, chat_history, uploaded_files, grade_level, subject):
     """Generate a streaming response from EeeBee for the chat interface using requests"""
     try:
-        # Build context from chat history
-        conversation_context = ""
-        if len(chat_history) > 1:
-            recent_messages = chat_history[-6:]  # Keep last 6 messages for context
-            for msg in recent_messages[:-1]:  # Exclude the current message
-                conversation_context += f"{msg['role'].title()}: {msg['content']}\n"
+        # Build context from chat history (newest messages first, up to half the prompt budget)
+        history_budget = (CHAT_PROMPT_BUDGET - _count_tokens(user_prompt)) // 2
+        conversation_context = _build_conversation_context(chat_history, history_budget)
         
         # Build system prompt for EeeBee
-        system_prompt = f"""You are EeeBee, an expert educational content development assistant specializing in CBSE curriculum.
-You help content teams create, modify, and improve educational materials that align with NCERT, NCF, and NEP 2020 guidelines.
-
-Context:
-- Target Grade: {grade_level}
-- Subject Area: {subject}
-- This is the user's OWN CONTENT being used for EDUCATIONAL PURPOSES ONLY
-
-Your expertise includes:
-- Content creation and improvement for CBSE curriculum
-- Curriculum alignment and standards compliance
-- Age-appropriate content development
-- Educational activity design
-- Assessment and exercise creation
-- Pedagogical best practices
-- Integration of 21st-century skills
-
-Guidelines:
-- Be helpful, friendly, and professional
-- Provide detailed, actionable advice
-- Reference educational standards and best practices
-- Suggest specific improvements or modifications
-- Ask clarifying questions when needed
-- Maintain consistency with CBSE/NCERT guidelines
-
-Previous conversation:
-{conversation_context}
-
-Current user question: {user_prompt}"""
+        system_prompt = _CHAT_SYSTEM_PROMPT_TMPL.substitute(
+            grade_level=grade_level,
+            subject=subject,
+            conversation_context=conversation_context,
+            user_prompt=user_prompt,
+        )
 
         # Prepare content parts
         content_parts = [{"type": "text", "text": system_prompt}]
         
-        # Add uploaded PDFs if any
+        # Add uploaded PDFs if any: the smallest goes as a Direct PDF Upload, the rest as one extracted-text part
         if uploaded_files:
-            for uploaded_file in uploaded_files:
-                try:
-                    # For chat, we'll use the Direct PDF Upload method
-                    pdf_bytes = uploaded_file.getvalue()
-                    pdf_filename = uploaded_file.name
-                    
-                    # Encode PDF to base64
-                    base64_pdf = encode_pdf_to_base64(pdf_bytes)
-                    data_url = f"data:application/pdf;base64,{base64_pdf}"
-                    
-                    # Add as file in content
+            (direct_name, pdf_bytes), *text_files = sorted(uploaded_files, key=lambda uploaded_file: len(uploaded_file[1]))
+            try:
+                # Encode PDF to base64 (once per PDF; later messages in the conversation reuse it)
+                data_url = _cached_pdf_data_url(pdf_content_key(pdf_bytes), pdf_bytes)
+                
+                # Add as file in content
+                content_parts.append({
+                    "type": "file",
+                    "file": {
+                        "filename": direct_name,
+                        "file_data": data_url
+                    }
+                })
+                
+            except Exception as e:
+                st.warning(f"Could not process {direct_name}: {e}")
+            
+            if text_files:
+                st.caption(f"Attached {direct_name} as a PDF; sending extracted text for the other {len(text_files)} file(s).")
+                pdf_part_text = _chat_pdf_text(text_files, CHAT_PROMPT_BUDGET - _count_tokens(system_prompt))
+                if pdf_part_text:
                     content_parts.append({
-                        "type": "file",
-                        "file": {
-                            "filename": pdf_filename,
-                            "file_data": data_url
-                        }
+                        "type": "text",
+                        "text": pdf_part_text
                     })
-                    
-                except Exception as e:
-                    st.warning(f"Could not process {uploaded_file.name}: {e}")
         
         # Create messages
         messages = [{"role": "user", "content": content_parts}]
         
+        if CHAT_TOKEN_DEBUG:
+            st.caption(f"Chat prompt: ~{_count_tokens(system_prompt)} tokens before PDF attachments (budget {CHAT_PROMPT_BUDGET})")
+        
         # Use the streaming function
         cancel_event = st.session_state.get('chat_cancel_event', Event())
         
+        usage = {}
         for chunk in stream_openrouter_response(
             messages=messages,
             model_name=MODEL_NAME,
-            max_tokens=8192,
+            max_tokens=CHAT_MAX_TOKENS,
             temperature=0.7,
-            plugins=[{"id": "file-parser", "pdf": {"engine": "pdf-text"}}] if uploaded_files else None,
-            cancel_event=cancel_event
+            plugins=PDF_TEXT_PLUGINS if uploaded_files else None,
+            cancel_event=cancel_event,
+            usage_out=usage
         ):
             yield chunk
+        record_token_usage(usage)
             
     except Exception as e:
         yield f"I encountered an error: {str(e)}. Please try asking your question again or check if your uploaded files are valid PDFs."
 
 # --- Streaming Support Functions ---
-def stream_openrouter_response(messages, model_name, max_tokens, temperature, plugins=None, cancel_event=None):
+def prefetch_stream(chunks):
+    """
+    Reads a chunk iterator on a background thread and yields its chunks as they arrive,
+    so the network keeps flowing while the caller renders. The iterator must not call st.*.
+    """
+    chunk_queue = queue.Queue()
+    stop = Event()
+    done = object()
+    
+    def reader():
+        try:
+            for chunk in chunks:
+                chunk_queue.put(chunk)
+                if stop.is_set():
+                    break
+        except Exception as e:
+            chunk_queue.put(e)
+        finally:
+            # Closing the generator here also closes its HTTP response when the caller stopped early
+            if hasattr(chunks, "close"):
+                chunks.close()
+            chunk_queue.put(done)
+    
+    Thread(target=reader, daemon=True).start()
+    try:
+        while True:
+            chunk = chunk_queue.get()
+            if chunk is done:
+                return
+            if isinstance(chunk, Exception):
+                raise chunk
+            yield chunk
+    finally:
+        stop.set()
+
+def stream_openrouter_response(messages, model_name, max_tokens, temperature, plugins=None, cancel_event=None, usage_out=None):
     """
     Stream responses from OpenRouter API with cancellation support.
     Returns a generator that yields response chunks.
+    If usage_out is a dict, it receives the token usage reported at the end of the stream.
     """
-    headers = {
-        "Authorization": f"Bearer {OPENROUTER_API_KEY}",
-        "HTTP-Referer": YOUR_SITE_URL,
-        "X-Title": YOUR_SITE_NAME,
-        "Content-Type": "application/json"
-    }
+    headers = OPENROUTER_REQUEST_HEADERS
     
     payload = {
         "model": model_name,
         "messages": messages,
         "max_tokens": max_tokens,
         "temperature": temperature,
-        "stream": True
+        "stream": True,
+        "stream_options": {"include_usage": True}
     }
     
     if plugins:
         payload["plugins"] = plugins
     
+    body = encode_json_body(payload)
+    if OPENROUTER_GZIP_REQUESTS:
+        # Base64 PDF and image data still compress well; level 1 keeps the cost low for large bodies
+        body = gzip.compress(body, compresslevel=1)
+        headers = {**headers, "Content-Encoding": "gzip"}
+    
     try:
         with requests.post(
             "https://openrouter.ai/api/v1/chat/completions",
             headers=headers,
-            json=payload,
+            data=body,
             stream=True,
             timeout=300  # 5 minute timeout
         ) as response:
             response.raise_for_status()
             
-            for line in response.iter_lines():
+            # Read network chunks as they arrive and split SSE lines out of a byte buffer
+            buffer = bytearray()
+            for chunk in response.iter_content(chunk_size=None):
                 if cancel_event and cancel_event.is_set():
                     response.close()
                     yield "[CANCELLED] Generation cancelled by user."
                     return
-                    
-                if line:
-                    line_text = line.decode('utf-8')
-                    if line_text.startswith('data: '):
-                        data_str = line_text[6:]  # Remove 'data: ' prefix
-                        if data_str == '[DONE]':
-                            return
-                        try:
-                            data = json.loads(data_str)
-                            if 'choices' in data and len(data['choices']) > 0:
-                                delta = data['choices'][0].get('delta', {})
-                                if 'content' in delta:
-                                    yield delta['content']
-                        except json.JSONDecodeError:
-                            continue
+                
+                buffer.extend(chunk)
+                end = buffer.rfind(b"\n")
+                if end == -1:
+                    continue
+                # Only complete lines are parsed; a partial line stays buffered for the next chunk
+                lines = bytes(buffer[:end]).split(b"\n")
+                del buffer[:end + 1]
+                
+                for line in lines:
+                    if not line.startswith(b"data: "):
+                        continue
+                    data_str = line[6:].strip()  # Remove 'data: ' prefix
+                    if data_str == b"[DONE]":
+                        return
+                    try:
+                        data = json.loads(data_str)
+                        if 'choices' in data and len(data['choices']) > 0:
+                            delta = data['choices'][0].get('delta', {})
+                            if 'content' in delta:
+                                yield delta['content']
+                        if usage_out is not None and data.get('usage'):
+                            usage_out.update(data['usage'])
+                    except json.JSONDecodeError:
+                        continue
                             
     except requests.exceptions.RequestException as e:
         yield f"\n\n[ERROR] Request failed: {str(e)}"
     except Exception as e:
         yield f"\n\n[ERROR] Unexpected error: {str(e)}"
 
+def _collect_stream(messages, max_tokens, temperature, plugins=None, cancel_event=None, render=True, usage_out=None):
+    """
+    Streams a completion through stream_openrouter_response and returns the full text.
+    Errors and cancellation raise RuntimeError. With render=True the text is shown as it arrives; worker threads must pass render=False.
+    """
+    content_parts = []
+    
+    def chunks():
+        for chunk in stream_openrouter_response(messages, MODEL_NAME, max_tokens, temperature, plugins, cancel_event, usage_out):
+            if chunk.startswith("\n\n[ERROR]"):
+                # Surface failures as exceptions so callers keep their fallback paths
+                raise RuntimeError(chunk.strip())
+            if chunk.startswith("[CANCELLED]"):
+                # Partial text is not a finished answer, so cancellation fails the call like an error
+                raise RuntimeError(chunk.strip())
+            content_parts.append(chunk)
+            yield chunk
+    
+    if render:
+        st.write_stream(chunks())
+    else:
+        for _ in chunks():
+            pass
+    return "".join(content_parts)
+
+def record_token_usage(usage):
+    """Adds a response's reported token usage to the session totals (main thread only)"""
+    if not usage:
+        return
+    totals = st.session_state.setdefault("running_cost_tokens", {"prompt_tokens": 0, "completion_tokens": 0})
+    totals["prompt_tokens"] += usage.get("prompt_tokens", 0)
+    totals["completion_tokens"] += usage.get("completion_tokens", 0)
+
 def analyze_with_llm_streaming(pdf_file_bytes, pdf_filename, model_progression_text, grade_level, use_openrouter_method=False):
     """
     Analyzes the uploaded PDF chapter with streaming support.
@@ -6009,11 +6638,10 @@ Provide the complete, rewritten chapter text in Markdown format, incorporating a
     if use_openrouter_method:
         # Create messages with direct PDF upload
         messages = create_messages_with_pdf_openrouter(prompt_content, pdf_file_bytes, pdf_filename)
-        plugins = [{"id": "file-parser", "pdf": {"engine": "pdf-text"}}]
+        plugins = PDF_TEXT_PLUGINS
     else:
         # Extract text and images from PDF
-        pdf_text = extract_text_from_pdf(pdf_file_bytes)
-        pdf_images = extract_images_from_pdf(pdf_file_bytes)
+        pdf_text, pdf_images = extract_text_and_images(pdf_file_bytes)
         messages = create_messages_with_pdf_content(prompt_content, pdf_text, pdf_images)
         plugins = None
     
@@ -6021,22 +6649,55 @@ Provide the complete, rewritten chapter text in Markdown format, incorporating a
     cancel_event = st.session_state.get('cancel_event', Event())
     
     # Stream the response
+    usage = {}
     for chunk in stream_openrouter_response(
         messages=messages,
         model_name=MODEL_NAME,
         max_tokens=65536,
         temperature=0.3,
         plugins=plugins,
-        cancel_event=cancel_event
+        cancel_event=cancel_event,
+        usage_out=usage
     ):
         yield chunk
+    record_token_usage(usage)
 
 def generate_specific_content_streaming(content_type, pdf_bytes, pdf_filename, grade_level, 
-                                       model_progression_text, subject_type, word_limits, use_openrouter_method, pdf_method="Text Extraction (Original)"):
+                                       model_progression_text, subject_type, word_limits, use_openrouter_method, pdf_method="Text Extraction (Original)", force_refresh=False):
+    """
+    Generates specific content with streaming support, reusing stored responses for identical requests.
+    Returns a generator that yields response chunks.
+    """
+    # Same key as generate_specific_content, so streamed and non-streamed results are interchangeable
+    prompt = create_specific_prompt(content_type, grade_level, model_progression_text, subject_type, word_limits)
+    cache_key = _llm_cache_key(prompt, pdf_bytes, use_openrouter_method, pdf_method)
+    
+    if not force_refresh:
+        cached_content = _llm_cache_get(cache_key)
+        if cached_content is not None:
+            yield cached_content
+            return
+    
+    content_parts = []
+    for chunk in _stream_specific_content(content_type, pdf_bytes, pdf_filename, grade_level, model_progression_text, 
+                                          subject_type, word_limits, use_openrouter_method, pdf_method):
+        content_parts.append(chunk)
+        yield chunk
+    
+    # Only completed streams are stored; a cancelled or failed stream would poison the cache
+    content = "".join(content_parts)
+    cancel_event = st.session_state.get('cancel_event')
+    if content and "\n\n[ERROR] " not in content and not (cancel_event is not None and cancel_event.is_set()):
+        _llm_cache_set(cache_key, content)
+
+def _stream_specific_content(content_type, pdf_bytes, pdf_filename, grade_level, 
+                             model_progression_text, subject_type, word_limits, use_openrouter_method, pdf_method="Text Extraction (Original)"):
     """
     Generates specific content with streaming support.
     Returns a generator that yields response chunks.
     """
+    wait_for_pdf_prefetch()
+    
     # Get the specific prompt (Mathematics Primary doesn't use model_progression_text)
     if subject_type == "Mathematics Primary (Classes 1-5)":
         prompt = create_specific_prompt(content_type, grade_level, None, subject_type, word_limits)
@@ -6056,10 +6717,7 @@ def generate_specific_content_streaming(content_type, pdf_bytes, pdf_filename, g
         
         # Stream the response
         stream = client.chat.completions.create(
-            extra_headers={
-                "HTTP-Referer": YOUR_SITE_URL,
-                "X-Title": YOUR_SITE_NAME,
-            },
+            extra_headers=OPENROUTER_EXTRA_HEADERS,
             model=MODEL_NAME,
             messages=messages,
             max_tokens=max_tokens,
@@ -6076,13 +6734,13 @@ def generate_specific_content_streaming(content_type, pdf_bytes, pdf_filename, g
     if use_openrouter_method:
         # Create messages with direct PDF upload
         messages = create_messages_with_pdf_openrouter(prompt, pdf_bytes, pdf_filename)
-        plugins = [{"id": "file-parser", "pdf": {"engine": "pdf-text"}}]
+        plugins = PDF_TEXT_PLUGINS
     else:
         # Use text extraction method (original, Mistral OCR, or other)
         if pdf_method == "Mistral OCR (Advanced)":
             st.info("🔍 **DEBUG (Streaming):** Attempting Mistral OCR processing...")
             # Use Mistral OCR for advanced text extraction
-            pdf_text, pdf_images = process_pdf_with_mistral_ocr(pdf_bytes, pdf_filename)
+            pdf_text, pdf_images = process_pdf_with_mistral_ocr_cached(pdf_bytes, pdf_filename)
             if pdf_text is None:
                 st.error("🔍 **DEBUG (Streaming):** Mistral OCR failed - cannot proceed with streaming")
                 return  # Stop the generator
@@ -6092,9 +6750,8 @@ def generate_specific_content_streaming(content_type, pdf_bytes, pdf_filename, g
         else:
             st.info(f"🔍 **DEBUG (Streaming):** Using method: {pdf_method}")
             # Extract text and images from PDF using original method
-        pdf_text = extract_text_from_pdf(pdf_bytes)
-        pdf_images = extract_images_from_pdf(pdf_bytes)
-        messages = create_messages_with_pdf_content(prompt, pdf_text, pdf_images)
+            pdf_text, pdf_images = extract_text_and_images(pdf_bytes)
+            messages = create_messages_with_pdf_content(prompt, pdf_text, pdf_images)
         plugins = None
     
     # Determine max tokens based on content type and subject
@@ -6112,34 +6769,43 @@ def generate_specific_content_streaming(content_type, pdf_bytes, pdf_filename, g
     # Create cancel event (can be controlled from UI)
     cancel_event = st.session_state.get('cancel_event', Event())
     
-    # Stream the response
-    for chunk in stream_openrouter_response(
+    # Stream the response; the HTTP stream is read on a background thread while the caller renders
+    usage = {}
+    for chunk in prefetch_stream(stream_openrouter_response(
         messages=messages,
         model_name=MODEL_NAME,
         max_tokens=max_tokens,
         temperature=0.3,
         plugins=plugins,
-        cancel_event=cancel_event
-    ):
+        cancel_event=cancel_event,
+        usage_out=usage
+    )):
         yield chunk
+    record_token_usage(usage)
 
 def handle_streaming_generation(content_type, pdf_bytes, pdf_filename, selected_grade, 
-                               model_progression, subject_type, word_limits, button_key, pdf_method="Text Extraction (Original)"):
+                               model_progression, subject_type, word_limits, button_key, pdf_method="Text Extraction (Original)", force_refresh=False):
     """Helper function to handle streaming content generation with UI"""
-    # Initialize cancel event for streaming
-    st.session_state.cancel_event = Event()
+    # Reuse the session's cancel event for streaming, reset for this generation; the
+    # per-chunk loop checks the local binding instead of going through session_state
+    cancel_event = st.session_state.setdefault("cancel_event", Event())
+    cancel_event.clear()
     cancel_col1, cancel_col2 = st.columns([5, 1])
     with cancel_col2:
         cancel_button = st.button("🛑 Cancel", key=f"cancel_{button_key}")
         if cancel_button:
-            st.session_state.cancel_event.set()
+            cancel_event.set()
     
     # Create a container for streaming content
     content_container = st.container()
     with content_container:
         content_placeholder = st.empty()
-        accumulated_content = ""
+        content_parts = []
+        content_length = 0
         content_saved = False
+        save_state = {}
+        last_render_time = 0.0
+        stream_placeholder = None
         
         try:
             # Stream the content with the selected PDF method
@@ -6152,36 +6818,46 @@ def handle_streaming_generation(content_type, pdf_bytes, pdf_filename, selected_
                 subject_type,
                 word_limits,
                 use_openrouter_method=(pdf_method == "Direct PDF Upload (OpenRouter Recommended)"),
-                pdf_method=pdf_method
+                pdf_method=pdf_method,
+                force_refresh=force_refresh
             ):
-                if st.session_state.cancel_event.is_set():
+                if cancel_event.is_set():
                     st.warning("⚠️ Generation cancelled by user.")
                     break
                 
-                accumulated_content += chunk
+                content_parts.append(chunk)
+                content_length += len(chunk)
                 
                 # CRITICAL: Auto-save during streaming to prevent loss
-                auto_save_during_streaming(content_type, accumulated_content)
+                auto_save_during_streaming(content_type, content_parts, content_length, save_state)
                 
-                # Update the placeholder with accumulated content
-                with content_placeholder.container():
-                    st.markdown(f"### Generated {content_type.title()} Content:")
-                    st.markdown(accumulated_content + " ⏳")
+                # Update the placeholder with accumulated content (throttled; the final render follows the loop)
+                if time.monotonic() - last_render_time >= STREAM_RENDER_INTERVAL:
+                    last_render_time = time.monotonic()
+                    if stream_placeholder is None:
+                        # The header is emitted once; later renders only replace the streamed text
+                        with content_placeholder.container():
+                            st.markdown(f"### Generated {content_type.title()} Content:")
+                            stream_placeholder = st.empty()
+                    stream_placeholder.markdown("".join(content_parts) + " ⏳")
+            
+            accumulated_content = "".join(content_parts)
             
             # Always try to save content if we have any, regardless of completion status
             if accumulated_content:
                 # CRITICAL: Final save with all protection strategies
                 save_content_safely(content_type, accumulated_content)
+                content_saved = True
                 
                 with content_placeholder.container():
-                    if st.session_state.cancel_event.is_set():
+                    if cancel_event.is_set():
                         st.markdown(f"### ⚠️ {content_type.title()} Content (Cancelled - Partial):")
                     else:
                         st.markdown(f"### ✅ {content_type.title()} Content (Complete):")
                     st.markdown(accumulated_content)
                 
                 # Determine success message
-                if st.session_state.cancel_event.is_set():
+                if cancel_event.is_set():
                     return accumulated_content, "Partial content saved (generation cancelled by user)"
                 else:
                     return accumulated_content, "Generated successfully using streaming!"
@@ -6191,99 +6867,111 @@ def handle_streaming_generation(content_type, pdf_bytes, pdf_filename, selected_
         except Exception as e:
             st.error(f"❌ Error during streaming: {e}")
             # Always try to save any content we managed to generate
+            accumulated_content = "".join(content_parts)
             if accumulated_content:
                 st.info("💾 Saving partial content despite error...")
                 
                 # CRITICAL: Save partial content with protection
                 save_content_safely(content_type, accumulated_content)
+                content_saved = True
                 
                 with content_placeholder.container():
                     st.markdown(f"### ⚠️ {content_type.title()} Content (Partial - Error Occurred):")
                     st.markdown(accumulated_content)
                 return accumulated_content, f"Partial content saved due to error: {str(e)}"
             return None, f"Error: {str(e)}"
+        finally:
+            # A rerun stops the script with an exception the handler above doesn't catch;
+            # keep whatever streamed since the last periodic save
+            if not content_saved and content_parts:
+                save_content_safely(content_type, "".join(content_parts), persist_to_browser=False)
 
 # --- Hybrid Content Expansion System ---
+# Section markers, compiled once; the cheap prefix checks in parse_content_sections skip the regex for plain paragraphs
+_RE_HEADING = re.compile(r'^#{1,6}\s+(.+)$')
+_RE_BOLD = re.compile(r'^\*\*([^*]+)\*\*')
+_RE_LIST = re.compile(r'^[-*+]\s+(.+)$')
+
+@st.cache_data(show_spinner=False, max_entries=16)
 def parse_content_sections(content: str) -> List[Dict[str, Any]]:
-    """Automatically detect expandable sections in generated content"""
+    """Automatically detect expandable sections in generated content (cached per content, so reruns skip the parse)"""
     sections = []
     
     if not content:
         return sections
     
-    # Split content into lines for processing
-    lines = content.split('\n')
-    current_section = ""
+    # Split content into lines for processing (any line ending), stripping each line once up front
+    lines = [line.strip() for line in content.splitlines()]
+    current_lines = []  # Lines of the section being built, joined when it is flushed
     section_type = "paragraph"
     
     for i, line in enumerate(lines):
-        line = line.strip()
         if not line:
             continue
             
         # Detect different section types
-        if re.match(r'^#{1,6}\s+(.+)$', line):  # Headings
-            if current_section:
+        if line.startswith('#') and _RE_HEADING.match(line):  # Headings
+            if current_lines:
                 sections.append({
                     'type': section_type,
-                    'text': current_section.strip(),
+                    'text': "\n".join(current_lines).strip(),
                     'expandable': True,
                     'line_start': max(0, i-10),
                     'line_end': min(len(lines), i+10)
                 })
-            current_section = line
+            current_lines = [line]
             section_type = 'heading'
             
-        elif re.match(r'^\*\*([^*]+)\*\*', line):  # Bold concepts
-            if current_section:
+        elif line.startswith('**') and _RE_BOLD.match(line):  # Bold concepts
+            if current_lines:
                 sections.append({
                     'type': section_type,
-                    'text': current_section.strip(),
+                    'text': "\n".join(current_lines).strip(),
                     'expandable': True,
                     'line_start': max(0, i-5),
                     'line_end': min(len(lines), i+15)
                 })
-            current_section = line
+            current_lines = [line]
             section_type = 'concept'
             
-        elif re.match(r'^[-*+]\s+(.+)$', line):  # List items
+        elif line[0] in '-*+' and _RE_LIST.match(line):  # List items
             if section_type != 'list':
-                if current_section:
+                if current_lines:
                     sections.append({
                         'type': section_type,
-                        'text': current_section.strip(),
+                        'text': "\n".join(current_lines).strip(),
                         'expandable': True,
                         'line_start': max(0, i-5),
                         'line_end': min(len(lines), i+10)
                     })
-                current_section = line
+                current_lines = [line]
                 section_type = 'list'
             else:
-                current_section += "\n" + line
+                current_lines.append(line)
                 
         elif len(line) > 50:  # Regular paragraphs
-            if section_type in ['heading', 'concept'] and current_section:
-                current_section += "\n" + line
+            if section_type in ['heading', 'concept'] and current_lines:
+                current_lines.append(line)
             else:
-                if current_section and section_type != 'paragraph':
+                if current_lines and section_type != 'paragraph':
                     sections.append({
                         'type': section_type,
-                        'text': current_section.strip(),
+                        'text': "\n".join(current_lines).strip(),
                         'expandable': True,
                         'line_start': max(0, i-5),
                         'line_end': min(len(lines), i+10)
                     })
                 if section_type != 'paragraph':
-                    current_section = line
+                    current_lines = [line]
                     section_type = 'paragraph'
                 else:
-                    current_section += "\n" + line
+                    current_lines.append(line)
     
     # Add the last section
-    if current_section:
+    if current_lines:
         sections.append({
             'type': section_type,
-            'text': current_section.strip(),
+            'text': "\n".join(current_lines).strip(),
             'expandable': True,
             'line_start': 0,
             'line_end': len(lines)
@@ -6291,8 +6979,38 @@ def parse_content_sections(content: str) -> List[Dict[str, Any]]:
     
     return sections
 
-def expand_text_with_ai(selected_text: str, expansion_type: str, context: str, content_type: str, grade_level: str, subject_type: str) -> str:
-    """Generate expanded content for selected text using AI"""
+def expander_sections(content_type: str, content: str) -> List[Dict[str, Any]]:
+    """Returns the sections (with display text) for the expander, re-parsed only when the content changes"""
+    cached = st.session_state.get(f"_{content_type}_expander_sections")
+    # Same identity check as content_preview: reruns with unchanged content skip hashing the content for the parse cache
+    if cached is None or cached[0] is not content:
+        sections = parse_content_sections(content)
+        for section in sections:
+            text = section['text']
+            if section['type'] in ('heading', 'concept'):
+                section['display'] = text
+            else:
+                # Truncate long paragraphs for display
+                section['display'] = text[:200] + "..." if len(text) > 200 else text
+        cached = (content, sections)
+        st.session_state[f"_{content_type}_expander_sections"] = cached
+    return cached[1]
+
+# Button labels for each expansion type, in the order the expanders offer them
+EXPANSION_TYPE_LABELS = {
+    'detail': "📝 More Detail",
+    'examples': "💡 Add Examples",
+    'activities': "🎯 Add Activities",
+    'simplify': "📖 Simplify",
+    'questions': "❓ Add Questions",
+    'connections': "🔗 Add Connections",
+    'shorten': "✂️ Make Shorter",
+    'summarize': "📋 Summarize",
+    'bullet_points': "• Bullet Points"
+}
+
+def _expansion_messages(selected_text: str, expansion_type: str, context: str, content_type: str, grade_level: str, subject_type: str) -> List[Dict[str, Any]]:
+    """Build the chat messages that ask the AI to expand or shorten selected text"""
     
     expansion_prompts = {
         'detail': "Provide more detailed explanation and depth",
@@ -6329,33 +7047,132 @@ REQUIREMENTS:
 
 EXPANDED CONTENT:"""
     
+    return [{"role": "user", "content": prompt}]
+
+def _expansion_cache_key(selected_text: str, expansion_type: str, context: str, content_type: str, grade_level: str, subject_type: str) -> str:
+    """Hashes an expansion request with whitespace normalized (case is kept: pH and PH differ), so repeated headings share one response"""
+    def normalize(text):
+        return " ".join(text.split())
+    payload = json.dumps(["expansion", MODEL_NAME, expansion_type, normalize(selected_text), normalize(context[:500]),
+                          content_type, grade_level, subject_type])
+    return hashlib.blake2b(payload.encode("utf-8"), digest_size=32).hexdigest()
+
+def expand_text_with_ai(selected_text: str, expansion_type: str, context: str, content_type: str, grade_level: str, subject_type: str, force_refresh: bool = False) -> str:
+    """Generate expanded content for selected text using AI"""
     try:
+        cache_key = _expansion_cache_key(selected_text, expansion_type, context, content_type, grade_level, subject_type)
+        if not force_refresh:
+            cached = _llm_cache_get(cache_key)
+            if cached is not None:
+                return cached
+        
         # Create messages for AI
-        messages = [{"role": "user", "content": prompt}]
+        messages = _expansion_messages(selected_text, expansion_type, context, content_type, grade_level, subject_type)
         
         # Generate expansion
         completion = client.chat.completions.create(
-            extra_headers={
-                "HTTP-Referer": YOUR_SITE_URL,
-                "X-Title": YOUR_SITE_NAME,
-            },
+            extra_headers=OPENROUTER_EXTRA_HEADERS,
             model=MODEL_NAME,
             messages=messages,
             max_tokens=8192,
             temperature=0.4,
         )
         
-        return completion.choices[0].message.content
+        expanded_content = completion.choices[0].message.content
+        if expanded_content:
+            _llm_cache_set(cache_key, expanded_content)
+        return expanded_content
+        
+    except Exception as e:
+        return f"Error generating expansion: {str(e)}"
+
+async def aexpand_text_with_ai(async_client, semaphore, selected_text: str, expansion_type: str, context: str, content_type: str, grade_level: str, subject_type: str, force_refresh: bool = False) -> str:
+    """Async version of expand_text_with_ai for running several expansions at once"""
+    try:
+        cache_key = _expansion_cache_key(selected_text, expansion_type, context, content_type, grade_level, subject_type)
+        if not force_refresh:
+            cached = _llm_cache_get(cache_key)
+            if cached is not None:
+                return cached
+        
+        messages = _expansion_messages(selected_text, expansion_type, context, content_type, grade_level, subject_type)
+        
+        async with semaphore:
+            completion = await async_client.chat.completions.create(
+                extra_headers=OPENROUTER_EXTRA_HEADERS,
+                model=MODEL_NAME,
+                messages=messages,
+                max_tokens=8192,
+                temperature=0.4,
+            )
+        
+        expanded_content = completion.choices[0].message.content
+        if expanded_content:
+            _llm_cache_set(cache_key, expanded_content)
+        return expanded_content
         
     except Exception as e:
         return f"Error generating expansion: {str(e)}"
 
-def display_section_expander(sections: List[Dict[str, Any]], content_type: str, grade_level: str, subject_type: str):
+def expand_many(jobs: List[Dict[str, Any]]) -> List[str]:
+    """Runs several expansions concurrently; each job holds expand_text_with_ai's keyword arguments"""
+    async def run_all():
+        semaphore = asyncio.Semaphore(MAX_CONCURRENT_GENERATIONS)
+        # Async connections are bound to this event loop, so the client lives only for this run
+        async with AsyncOpenAI(
+            base_url="https://openrouter.ai/api/v1",
+            api_key=OPENROUTER_API_KEY,
+            http_client=httpx.AsyncClient(limits=OPENROUTER_HTTP_LIMITS, timeout=OPENROUTER_HTTP_TIMEOUT),
+        ) as async_client:
+            return await asyncio.gather(*(aexpand_text_with_ai(async_client, semaphore, **job) for job in jobs))
+    
+    return asyncio.run(run_all())
+
+def display_section_expander(sections: List[Dict[str, Any]], content_type: str, grade_level: str, subject_type: str, force_refresh: bool = False):
     """Display expandable sections with expansion buttons"""
     
     st.subheader("🔍 Section-by-Section Expansion")
     st.markdown("*Click the expand button next to any section you want to develop further.*")
     
+    # Per-section expansion state: {section index: {"show_opts": bool, "content": expanded text or None}}
+    section_expansions = st.session_state.setdefault("section_expansions", {})
+    
+    # Queued expansions ({section index: expansion type}) run together with one click
+    pending_expansions = st.session_state.setdefault(f"pending_expansions_{content_type}", {})
+    queue_expansions = st.checkbox(
+        "Queue expansions and run them together",
+        key=f"queue_expansions_{content_type}",
+        help="Pick expansions for several sections, then generate them all at once"
+    )
+    if pending_expansions:
+        if st.button(f"⚡ Expand All Queued ({len(pending_expansions)})", key=f"expand_all_{content_type}"):
+            queued = [(i, expansion_type) for i, expansion_type in pending_expansions.items() if i < len(sections)]
+            jobs = [
+                {
+                    "selected_text": sections[i]['text'],
+                    "expansion_type": expansion_type,
+                    "context": sections[i]['text'],
+                    "content_type": content_type,
+                    "grade_level": grade_level,
+                    "subject_type": subject_type,
+                    "force_refresh": force_refresh,
+                }
+                for i, expansion_type in queued
+            ]
+            with st.spinner(f"🧠 Expanding {len(jobs)} sections..."):
+                results = expand_many(jobs)
+            for (i, _), expanded_content in zip(queued, results):
+                section_expansions.setdefault(i, {"show_opts": False, "content": None})["content"] = expanded_content
+            pending_expansions.clear()
+            st.rerun()
+    
+    # (hash, expanded) of each section's expansion as last shown, per content type. The expanded flag only
+    # changes when an expansion is new or changed, so reruns keep each expander as the user left it
+    all_rendered_hashes = st.session_state.setdefault("_rendered_hashes", {})
+    first_render = content_type not in all_rendered_hashes
+    rendered_hashes = all_rendered_hashes.get(content_type, {})
+    shown_hashes = {}
+    
     # Get fresh content from session state to ensure we have the latest version
     def get_current_content():
         if content_type == "chapter":
@@ -6369,55 +7186,44 @@ def display_section_expander(sections: List[Dict[str, Any]], content_type: str,
         return ""
     
     for i, section in enumerate(sections):
-        # Create container for each section
-        with st.container():
+        expansion_state = section_expansions.setdefault(i, {"show_opts": False, "content": None})
+        
+        # Create a bordered container for each section (the border replaces a separate divider element per row)
+        with st.container(border=True):
             col1, col2 = st.columns([5, 1])
             
             with col1:
-                # Display section based on type
-                if section['type'] == 'heading':
-                    st.markdown(section['text'])
-                elif section['type'] == 'concept':
-                    st.markdown(section['text'])
-                else:
-                    # Truncate long paragraphs for display
-                    display_text = section['text'][:200] + "..." if len(section['text']) > 200 else section['text']
-                    st.markdown(display_text)
+                # Display text is prepared once per content by expander_sections
+                st.markdown(section['display'])
             
             with col2:
                 # Expansion button
                 if st.button("🔍 Expand", key=f"expand_section_{i}", help=f"Expand this {section['type']}"):
                     # Show expansion options
-                    st.session_state[f"show_expansion_options_{i}"] = True
+                    expansion_state["show_opts"] = True
                     st.rerun()
             
             # Show expansion options if button was clicked
-            if st.session_state.get(f"show_expansion_options_{i}", False):
+            if expansion_state["show_opts"]:
                 with st.container():
-                    st.markdown("**Expand Content:**")
-                    exp_col1, exp_col2, exp_col3, exp_col4 = st.columns(4)
+                    # One radio and one Apply button instead of a button per expansion type
+                    selected_type = st.radio(
+                        "Expand or shorten:",
+                        options=["detail", "examples", "activities", "simplify", "shorten", "summarize", "bullet_points"],
+                        format_func=EXPANSION_TYPE_LABELS.get,
+                        key=f"expansion_type_{i}",
+                        horizontal=True
+                    )
                     
                     expansion_type = None
-                    if exp_col1.button("📝 More Detail", key=f"detail_{i}"):
-                        expansion_type = "detail"
-                    if exp_col2.button("💡 Add Examples", key=f"examples_{i}"):
-                        expansion_type = "examples"
-                    if exp_col3.button("🎯 Add Activities", key=f"activities_{i}"):
-                        expansion_type = "activities"
-                    if exp_col4.button("📖 Simplify", key=f"simplify_{i}"):
-                        expansion_type = "simplify"
+                    if st.button("✨ Apply", key=f"apply_expansion_{i}"):
+                        expansion_type = selected_type
                     
-                    st.markdown("**Shorten Content:**")
-                    short_col1, short_col2, short_col3 = st.columns(3)
-                    
-                    if short_col1.button("✂️ Make Shorter", key=f"shorten_{i}"):
-                        expansion_type = "shorten"
-                    if short_col2.button("📋 Summarize", key=f"summarize_{i}"):
-                        expansion_type = "summarize"
-                    if short_col3.button("• Bullet Points", key=f"bullets_{i}"):
-                        expansion_type = "bullet_points"
-                    
-                    if expansion_type:
+                    if expansion_type and queue_expansions:
+                        pending_expansions[i] = expansion_type
+                        expansion_state["show_opts"] = False
+                        st.rerun()
+                    elif expansion_type:
                         with st.spinner(f"🧠 Expanding section with {expansion_type}..."):
                             expanded_content = expand_text_with_ai(
                                 selected_text=section['text'],
@@ -6425,17 +7231,29 @@ def display_section_expander(sections: List[Dict[str, Any]], content_type: str,
                                 context=section['text'],  # For now, use section itself as context
                                 content_type=content_type,
                                 grade_level=grade_level,
-                                subject_type=subject_type
+                                subject_type=subject_type,
+                                force_refresh=force_refresh
                             )
                             
-                            st.session_state[f"expanded_content_{i}"] = expanded_content
-                            st.session_state[f"show_expansion_options_{i}"] = False
+                            expansion_state["content"] = expanded_content
+                            expansion_state["show_opts"] = False
                             st.rerun()
             
+            if i in pending_expansions:
+                st.caption(f"⏳ Queued: {pending_expansions[i]}")
+            
             # Show expanded content if available
-            if st.session_state.get(f"expanded_content_{i}"):
-                with st.expander("✨ Expanded Content", expanded=True):
-                    st.markdown(st.session_state[f"expanded_content_{i}"])
+            if expansion_state["content"]:
+                expanded_hash = hashlib.blake2b(expansion_state["content"].encode("utf-8"), digest_size=16).hexdigest()
+                previous = rendered_hashes.get(i)
+                if previous is not None and previous[0] == expanded_hash:
+                    is_expanded = previous[1]
+                else:
+                    # New expansions open; ones already saved when the panel first appears start collapsed
+                    is_expanded = not first_render
+                shown_hashes[i] = (expanded_hash, is_expanded)
+                with st.expander("✨ Expanded Content", expanded=is_expanded):
+                    st.markdown(expansion_state["content"])
                     
                     # Option to replace original content
                     col1, col2 = st.columns(2)
@@ -6445,7 +7263,7 @@ def display_section_expander(sections: List[Dict[str, Any]], content_type: str,
                         
                         if original_content and section['text'] in original_content:
                             # Replace the section in the original content
-                            updated_content = original_content.replace(section['text'], st.session_state[f"expanded_content_{i}"])
+                            updated_content = original_content.replace(section['text'], expansion_state["content"])
                             
                             # Update the session state with the modified content
                             if content_type == "chapter":
@@ -6461,8 +7279,7 @@ def display_section_expander(sections: List[Dict[str, Any]], content_type: str,
                             save_content_safely(content_type, updated_content)
                             
                             # Clear the expanded content and expansion options to prevent stale data
-                            st.session_state.pop(f"expanded_content_{i}", None)
-                            st.session_state.pop(f"show_expansion_options_{i}", None)
+                            section_expansions.pop(i, None)
                             
                             st.success("✅ Section replaced in original content!")
                             st.rerun()
@@ -6490,7 +7307,7 @@ def display_section_expander(sections: List[Dict[str, Any]], content_type: str,
                                 
                                 if full_section:
                                     # Replace with the reconstructed section
-                                    updated_content = original_content.replace(full_section, st.session_state[f"expanded_content_{i}"])
+                                    updated_content = original_content.replace(full_section, expansion_state["content"])
                                     
                                     # Update the session state
                                     if content_type == "chapter":
@@ -6506,8 +7323,7 @@ def display_section_expander(sections: List[Dict[str, Any]], content_type: str,
                                     save_content_safely(content_type, updated_content)
                                     
                                     # Clear the expanded content and expansion options
-                                    st.session_state.pop(f"expanded_content_{i}", None)
-                                    st.session_state.pop(f"show_expansion_options_{i}", None)
+                                    section_expansions.pop(i, None)
                                     
                                     st.success("✅ Section replaced in original content!")
                                     st.rerun()
@@ -6518,10 +7334,11 @@ def display_section_expander(sections: List[Dict[str, Any]], content_type: str,
                     
                     if col2.button("💾 Keep Both", key=f"keep_{i}"):
                         st.success("✅ Expanded content saved separately! Original content unchanged.")
-            
-            st.divider()
+    
+    # Only sections that still have an expansion are kept, so replaced or cleared ones don't accumulate
+    all_rendered_hashes[content_type] = shown_hashes
 
-def display_manual_text_expander(original_content: str, content_type: str, grade_level: str, subject_type: str):
+def display_manual_text_expander(original_content: str, content_type: str, grade_level: str, subject_type: str, force_refresh: bool = False):
     """Allow users to manually specify text for expansion"""
     
     st.subheader("🎯 Manual Text Expansion")
@@ -6536,34 +7353,18 @@ def display_manual_text_expander(original_content: str, content_type: str, grade
     )
     
     if selected_text.strip():
-        # Expansion type selection
-        st.markdown("**Expand Content:**")
-        exp_col1, exp_col2, exp_col3 = st.columns(3)
-        exp_col4, exp_col5, exp_col6 = st.columns(3)
+        # Expansion type selection: one radio and one Apply button instead of a button per type
+        selected_type = st.radio(
+            "Expand or shorten:",
+            options=list(EXPANSION_TYPE_LABELS),
+            format_func=EXPANSION_TYPE_LABELS.get,
+            key="manual_expansion_type",
+            horizontal=True
+        )
         
         expansion_type = None
-        if exp_col1.button("📝 More Detail", key="manual_detail"):
-            expansion_type = "detail"
-        if exp_col2.button("💡 Add Examples", key="manual_examples"):
-            expansion_type = "examples"
-        if exp_col3.button("🎯 Add Activities", key="manual_activities"):
-            expansion_type = "activities"
-        if exp_col4.button("📖 Simplify", key="manual_simplify"):
-            expansion_type = "simplify"
-        if exp_col5.button("❓ Add Questions", key="manual_questions"):
-            expansion_type = "questions"
-        if exp_col6.button("🔗 Add Connections", key="manual_connections"):
-            expansion_type = "connections"
-        
-        st.markdown("**Shorten Content:**")
-        short_col1, short_col2, short_col3 = st.columns(3)
-        
-        if short_col1.button("✂️ Make Shorter", key="manual_shorten"):
-            expansion_type = "shorten"
-        if short_col2.button("📋 Summarize", key="manual_summarize"):
-            expansion_type = "summarize"
-        if short_col3.button("• Bullet Points", key="manual_bullets"):
-            expansion_type = "bullet_points"
+        if st.button("✨ Apply", key="manual_apply_expansion"):
+            expansion_type = selected_type
         
         if expansion_type:
             with st.spinner(f"🧠 Expanding your text with {expansion_type}..."):
@@ -6581,7 +7382,8 @@ def display_manual_text_expander(original_content: str, content_type: str, grade
                     context=context,
                     content_type=content_type,
                     grade_level=grade_level,
-                    subject_type=subject_type
+                    subject_type=subject_type,
+                    force_refresh=force_refresh
                 )
                 
                 st.markdown("### ✨ Expanded Content:")
@@ -6640,6 +7442,126 @@ def display_manual_text_expander(original_content: str, content_type: str, grade
                     # This would copy to clipboard if we had JavaScript support
                     st.info("💡 You can manually copy the expanded content above.")
 
+def _global_enhancement_prompt(global_action: str, content: str, content_type: str, grade_level: str) -> str:
+    """Build the prompt for one global enhancement action"""
+    if global_action == "longer":
+        prompt = f"""Make this {content_type} content significantly longer and more detailed for {grade_level} CBSE students.
+                
+Original Content:
+{content}
+
+Add more depth, explanations, and comprehensive coverage while maintaining the same structure and educational quality."""
+        
+    elif global_action == "activities":
+        prompt = f"""Add more hands-on activities, exercises, and interactive elements throughout this {content_type} content for {grade_level} CBSE students.
+
+Original Content:
+{content}
+
+Integrate practical activities that reinforce learning and engage students actively."""
+        
+    elif global_action == "examples":
+        prompt = f"""Add more real-world examples, case studies, and practical applications throughout this {content_type} content for {grade_level} CBSE students.
+
+Original Content:
+{content}
+
+Include diverse examples that help students understand concepts better."""
+        
+    elif global_action == "shorten":
+        prompt = f"""Make this {content_type} content more concise and brief for {grade_level} CBSE students while keeping all essential information and concepts.
+
+Original Content:
+{content}
+
+Remove unnecessary details, redundant explanations, and verbose sections while maintaining educational quality and completeness."""
+        
+    elif global_action == "summarize":
+        prompt = f"""Create a condensed summary of this {content_type} content for {grade_level} CBSE students, focusing on key concepts and main points.
+
+Original Content:
+{content}
+
+Extract and present the most important information in a clear, organized summary format."""
+        
+    elif global_action == "bullet_points":
+        prompt = f"""Convert this {content_type} content into clear, concise bullet points for {grade_level} CBSE students.
+
+Original Content:
+{content}
+
+Organize the content into well-structured bullet points that capture all key concepts and information."""
+    
+    return prompt
+
+def _split_for_enhancement(content: str, max_chars: int = GLOBAL_ENHANCE_PART_CHARS) -> List[str]:
+    """Split content at markdown headings, packing whole sections into parts of up to max_chars (every line is kept)"""
+    sections = []
+    current_lines = []
+    for line in content.split('\n'):
+        if line.startswith('#') and current_lines:
+            sections.append('\n'.join(current_lines))
+            current_lines = []
+        current_lines.append(line)
+    if current_lines:
+        sections.append('\n'.join(current_lines))
+    
+    parts = []
+    current_parts = []
+    current_len = 0
+    for section in sections:
+        if current_parts and current_len + len(section) > max_chars:
+            parts.append('\n'.join(current_parts))
+            current_parts = []
+            current_len = 0
+        current_parts.append(section)
+        current_len += len(section) + 1
+    if current_parts:
+        parts.append('\n'.join(current_parts))
+    return [part for part in parts if part.strip()]
+
+def enhance_content_parts(prompts: List[str], placeholder=None) -> str:
+    """Streams one enhancement per prompt concurrently, showing the combined output in document order as it arrives"""
+    part_outputs = [[] for _ in prompts]
+    last_render_time = 0.0
+    
+    def render(final=False):
+        nonlocal last_render_time
+        if placeholder is None or (not final and time.monotonic() - last_render_time < STREAM_RENDER_INTERVAL):
+            return
+        last_render_time = time.monotonic()
+        placeholder.markdown("\n\n".join("".join(output) for output in part_outputs if output) + ("" if final else " ⏳"))
+    
+    async def enhance_part(async_client, semaphore, index, prompt):
+        async with semaphore:
+            stream = await async_client.chat.completions.create(
+                extra_headers=OPENROUTER_EXTRA_HEADERS,
+                model=MODEL_NAME,
+                messages=[{"role": "user", "content": prompt}],
+                max_tokens=16384,
+                temperature=0.4,
+                stream=True,
+            )
+            async for chunk in stream:
+                if chunk.choices and chunk.choices[0].delta.content:
+                    part_outputs[index].append(chunk.choices[0].delta.content)
+                    # The event loop runs on the script thread, so the placeholder can be updated directly
+                    render()
+    
+    async def run_all():
+        semaphore = asyncio.Semaphore(MAX_CONCURRENT_GENERATIONS)
+        # Async connections are bound to this event loop, so the client lives only for this run
+        async with AsyncOpenAI(
+            base_url="https://openrouter.ai/api/v1",
+            api_key=OPENROUTER_API_KEY,
+            http_client=httpx.AsyncClient(limits=OPENROUTER_HTTP_LIMITS, timeout=OPENROUTER_HTTP_TIMEOUT),
+        ) as async_client:
+            await asyncio.gather(*(enhance_part(async_client, semaphore, i, prompt) for i, prompt in enumerate(prompts)))
+    
+    asyncio.run(run_all())
+    render(final=True)
+    return "\n\n".join("".join(output).strip() for output in part_outputs)
+
 def display_global_content_expander(original_content: str, content_type: str, grade_level: str, subject_type: str):
     """Global content expansion options"""
     
@@ -6669,72 +7591,16 @@ def display_global_content_expander(original_content: str, content_type: str, gr
     
     if global_action:
         with st.spinner(f"🧠 Enhancing entire content..."):
-            if global_action == "longer":
-                prompt = f"""Make this {content_type} content significantly longer and more detailed for {grade_level} CBSE students.
-                
-Original Content:
-{original_content}
-
-Add more depth, explanations, and comprehensive coverage while maintaining the same structure and educational quality."""
-                
-            elif global_action == "activities":
-                prompt = f"""Add more hands-on activities, exercises, and interactive elements throughout this {content_type} content for {grade_level} CBSE students.
-
-Original Content:
-{original_content}
-
-Integrate practical activities that reinforce learning and engage students actively."""
-                
-            elif global_action == "examples":
-                prompt = f"""Add more real-world examples, case studies, and practical applications throughout this {content_type} content for {grade_level} CBSE students.
-
-Original Content:
-{original_content}
-
-Include diverse examples that help students understand concepts better."""
-                
-            elif global_action == "shorten":
-                prompt = f"""Make this {content_type} content more concise and brief for {grade_level} CBSE students while keeping all essential information and concepts.
-
-Original Content:
-{original_content}
-
-Remove unnecessary details, redundant explanations, and verbose sections while maintaining educational quality and completeness."""
-                
-            elif global_action == "summarize":
-                prompt = f"""Create a condensed summary of this {content_type} content for {grade_level} CBSE students, focusing on key concepts and main points.
-
-Original Content:
-{original_content}
-
-Extract and present the most important information in a clear, organized summary format."""
-                
-            elif global_action == "bullet_points":
-                prompt = f"""Convert this {content_type} content into clear, concise bullet points for {grade_level} CBSE students.
-
-Original Content:
-{original_content}
-
-Organize the content into well-structured bullet points that capture all key concepts and information."""
+            # A summary needs the whole document; the other actions work section by section, concurrently
+            if global_action == "summarize":
+                content_parts = [original_content]
+            else:
+                content_parts = _split_for_enhancement(original_content)
+            prompts = [_global_enhancement_prompt(global_action, part, content_type, grade_level) for part in content_parts]
             
             try:
-                messages = [{"role": "user", "content": prompt}]
-                
-                completion = client.chat.completions.create(
-                    extra_headers={
-                        "HTTP-Referer": YOUR_SITE_URL,
-                        "X-Title": YOUR_SITE_NAME,
-                    },
-                    model=MODEL_NAME,
-                    messages=messages,
-                    max_tokens=16384,
-                    temperature=0.4,
-                )
-                
-                enhanced_content = completion.choices[0].message.content
-                
                 st.markdown("### ✨ Enhanced Content:")
-                st.markdown(enhanced_content)
+                enhanced_content = enhance_content_parts(prompts, st.empty())
                 
                 # Option to replace original content
                 col1, col2 = st.columns(2)
@@ -6783,22 +7649,30 @@ def hybrid_content_expander(content: str, content_type: str, grade_level: str, s
             return st.session_state.get("art_learning", "")
         return content  # fallback to original content
     
+    # Expansions are cached like generated content; this asks the model for a fresh one instead
+    force_refresh = st.checkbox(
+        "Regenerate expansions (ignore cached responses)",
+        value=False,
+        help="Identical expansion requests normally return the previously generated text. Tick to get a different expansion.",
+        key=f"force_refresh_expansions_{content_type}"
+    )
+    
     # Tab interface for different expansion methods
     tab1, tab2, tab3, tab4 = st.tabs(["🔍 Auto-Sections", "🎯 Manual Select", "🚀 Global Enhance", "💾 Saved Expansions"])
     
     with tab1:
         # Get fresh content and re-parse sections each time the tab is accessed
         fresh_content = get_fresh_content()
-        sections = parse_content_sections(fresh_content)
+        sections = expander_sections(content_type, fresh_content)
         
         if sections:
-            display_section_expander(sections, content_type, grade_level, subject_type)
+            display_section_expander(sections, content_type, grade_level, subject_type, force_refresh)
         else:
             st.info("No expandable sections detected. Try the Manual Select tab to expand specific text.")
     
     with tab2:
         fresh_content = get_fresh_content()
-        display_manual_text_expander(fresh_content, content_type, grade_level, subject_type)
+        display_manual_text_expander(fresh_content, content_type, grade_level, subject_type, force_refresh)
     
     with tab3:
         fresh_content = get_fresh_content()
@@ -6820,6 +7694,239 @@ def hybrid_content_expander(content: str, content_type: str, grade_level: str, s
         else:
             st.info("No saved expansions yet. Use the other tabs to create expansions.")
 
+# Word-limit fields per layout: columns of (column heading, fields); each field is
+# (word_limits key, label, min_value, default, step, widget key[, help])
+WORD_LIMIT_LAYOUTS = {
+    "Mathematics Primary (Classes 1-5)": {
+        "title": "**Mathematics Primary (Classes 1-5) Structure**",
+        "columns": [
+            (None, [
+                ('hook', "Chapter Opener - The Hook (words)", 100, 150, 10, "primary_hook_words"),
+                ('discover', "Let's Discover - Concept & Practice (words)", 1000, 1500, 100, "primary_discover_words"),
+                ('activity', "Activity Zone - Hands-on (words)", 200, 300, 25, "primary_activity_words"),
+            ]),
+            (None, [
+                ('recap', "Quick Recap - Revision (words)", 150, 200, 25, "primary_recap_words"),
+                ('exercises', "Exercises (words)", 500, 800, 50, "primary_exercises_words"),
+            ]),
+        ],
+    },
+    "Science & E.V.S. (Classes 1-2)": {
+        "title": "**Science & E.V.S. (Classes 1-2) Play-Based Structure**",
+        "columns": [
+            (None, [
+                ('opener', "Chapter Opener - Story and Wonder (words)", 100, 200, 25, "evs12_opener_words"),
+                ('activity', "Let's Play & Do - Per Activity (words)", 150, 250, 25, "evs12_activity_words"),
+                ('concept', "Concept Connect - Per Concept (words)", 100, 200, 25, "evs12_concept_words"),
+            ]),
+            (None, [
+                ('closer', "Chapter Closer - Learning Together (words)", 100, 150, 25, "evs12_closer_words"),
+                ('activities', "Play-Based Activities Total (words)", 400, 600, 50, "evs12_activities_words"),
+            ]),
+        ],
+    },
+    "Science & E.V.S. (Classes 3-5)": {
+        "title": "**Science & E.V.S. (Classes 3-5) Inquiry-Based Structure**",
+        "columns": [
+            (None, [
+                ('opener', "Chapter Opener Page (words)", 200, 300, 25, "evs35_opener_words"),
+                ('exploration', "Let's Uncover the Secrets (words)", 1500, 2000, 100, "evs35_exploration_words"),
+                ('project', "Capstone Project (words)", 300, 400, 50, "evs35_project_words"),
+            ]),
+            (None, [
+                ('summary', "Summary & Revision Tools (words)", 200, 250, 25, "evs35_summary_words"),
+                ('exercises', "End-of-Chapter Exercises (words)", 500, 600, 50, "evs35_exercises_words"),
+            ]),
+        ],
+    },
+    "English Primary (Classes 1-3)": {
+        "title": "**English Communication & Grammar (Oxford/Cambridge Style)**",
+        "subtitle": "*Primary Level (Classes 1-3): Foundation Building*",
+        "columns": [
+            (None, [
+                ('warm_up', "Warm-Up Activity (words)", 100, 200, 25, "eng_warmup_words"),
+                ('vocabulary', "Vocabulary Building (words)", 200, 300, 25, "eng_vocab_words"),
+                ('grammar_intro', "Grammar Introduction (words)", 150, 250, 25, "eng_grammar_words"),
+            ]),
+            (None, [
+                ('practice', "Practice Activities (words)", 300, 400, 50, "eng_practice_words"),
+                ('communication', "Communication Skills (words)", 200, 300, 25, "eng_comm_words"),
+                ('exercises', "Exercises & Assessment (words)", 400, 600, 50, "eng_exercises_words"),
+            ]),
+        ],
+    },
+    "English Elementary (Classes 4-5)": {
+        "title": "**English Communication & Grammar (Oxford/Cambridge Style)**",
+        "subtitle": "*Elementary Level (Classes 4-5): Skill Development*",
+        "columns": [
+            (None, [
+                ('introduction', "Chapter Introduction (words)", 150, 250, 25, "eng_intro_words"),
+                ('reading', "Reading Comprehension (words)", 400, 600, 50, "eng_reading_words"),
+                ('grammar', "Grammar Focus (words)", 300, 500, 50, "eng_grammar_focus_words"),
+                ('vocabulary', "Vocabulary Expansion (words)", 250, 350, 25, "eng_vocab_exp_words"),
+            ]),
+            (None, [
+                ('writing', "Writing Skills (words)", 300, 450, 50, "eng_writing_words"),
+                ('speaking', "Speaking & Listening (words)", 250, 350, 25, "eng_speaking_words"),
+                ('exercises', "Practice Exercises (words)", 500, 700, 50, "eng_exercises_elem_words"),
+            ]),
+        ],
+    },
+    "English Middle School (Classes 6-8)": {
+        "title": "**English Communication & Grammar (Oxford/Cambridge Style)**",
+        "subtitle": "*Middle School Level (Classes 6-8): Advanced Communication*",
+        "columns": [
+            ("Core Skills", [
+                ('introduction', "Chapter Introduction (words)", 200, 300, 25, "eng_intro_mid_words"),
+                ('reading', "Reading & Comprehension (words)", 500, 800, 50, "eng_reading_mid_words"),
+                ('grammar', "Grammar & Usage (words)", 400, 600, 50, "eng_grammar_mid_words"),
+            ]),
+            ("Communication", [
+                ('vocabulary', "Vocabulary & Etymology (words)", 300, 400, 25, "eng_vocab_mid_words"),
+                ('writing', "Composition & Writing (words)", 400, 600, 50, "eng_writing_mid_words"),
+                ('speaking', "Speaking & Presentation (words)", 300, 400, 25, "eng_speaking_mid_words"),
+            ]),
+            ("Assessment", [
+                ('literature', "Literature Appreciation (words)", 300, 500, 50, "eng_lit_words"),
+                ('exercises', "Comprehensive Exercises (words)", 600, 900, 50, "eng_exercises_mid_words"),
+                ('projects', "Language Projects (words)", 200, 300, 25, "eng_projects_words"),
+            ]),
+        ],
+    },
+    "Artificial Intelligence": {
+        "title": "**AI Textbook Chapter Structure (O'Reilly/CBSE Standards)**",
+        "info": "📚 Creating publisher-quality AI textbook chapters with comprehensive content",
+        "columns": [
+            ("Core Content", [
+                ('introduction', "Chapter Introduction & Hook (words)", 300, 400, 50, "ai_intro_words", "Real-world hook, objectives, roadmap"),
+                ('concepts', "Core AI Concepts & Theory (words)", 2000, 2500, 100, "ai_concepts_words", "Detailed explanations, algorithms, code examples"),
+                ('hands_on', "Hands-On Labs & Projects (words)", 1200, 1500, 100, "ai_handson_words", "Step-by-step project builds, experiments"),
+            ]),
+            ("Applications & Assessment", [
+                ('case_studies', "Case Studies & Applications (words)", 600, 800, 50, "ai_cases_words", "Industry examples, Indian context"),
+                ('exercises', "Exercises & Practice (words)", 800, 1000, 50, "ai_exercises_words", "MCQs, coding challenges, problems"),
+                ('projects', "Extended Projects & Resources (words)", 500, 600, 50, "ai_projects_words", "Capstone ideas, career connections"),
+            ]),
+        ],
+    },
+    "Robotics": {
+        "title": "**Robotics Structure**",
+        "columns": [
+            (None, [
+                ('mission_briefing', "Mission Briefing (words)", 200, 300, 25, "robotics_mission_words"),
+                ('domain_analysis', "Domain Analysis & Applications (words)", 600, 800, 50, "robotics_domain_words"),
+                ('core_concepts', "Core Concepts (words)", 2000, 3000, 100, "robotics_concepts_words"),
+            ]),
+            (None, [
+                ('hands_on_project', "Hands-On Project (words)", 1000, 1500, 100, "robotics_project_words"),
+                ('assessment', "Assessment & Debrief (words)", 400, 600, 50, "robotics_assessment_words"),
+                ('exercises', "Exercises (words)", 800, 1000, 50, "robotics_exercises_words"),
+            ]),
+        ],
+    },
+    "Artificial Intelligence (Composite Skill Lab)": {
+        "title": "**AI Composite Skill Lab Structure**",
+        "columns": [
+            (None, [
+                ('mission_briefing', "Mission Briefing (words)", 200, 300, 25, "ai_csl_mission_words"),
+                ('ai_world', "AI in Our World (words)", 400, 600, 50, "ai_csl_world_words"),
+                ('core_concepts', "Core AI Concepts (words)", 2000, 2500, 100, "ai_csl_concepts_words"),
+                ('hands_on_tools', "Hands-On with AI Tools (words)", 800, 1200, 100, "ai_csl_tools_words"),
+            ]),
+            (None, [
+                ('build_project', "Build Your AI Project (words)", 1000, 1500, 100, "ai_csl_project_words"),
+                ('testing', "Training & Testing (words)", 600, 800, 50, "ai_csl_testing_words"),
+                ('ethical_ai', "Ethical AI Explorer (words)", 300, 500, 50, "ai_csl_ethical_words"),
+                ('challenge', "Challenge Zone (words)", 400, 600, 50, "ai_csl_challenge_words"),
+                ('exercises', "Exercises (words)", 800, 1200, 100, "ai_csl_exercises_words"),
+            ]),
+        ],
+    },
+    # Standard word limits for other subjects
+    "Standard": {
+        "columns": [
+            ("Core Sections", [
+                ('hook', "Hook (words)", 20, 80, 10, "hook_words"),
+                ('learning_outcome', "Learning Outcome (words)", 30, 70, 10, "learning_outcome_words"),
+                ('real_world', "Real World Connection (words)", 30, 50, 10, "real_world_words"),
+                ('previous_class', "Previous Class Concept (words)", 30, 100, 10, "previous_class_words"),
+                ('history', "History (words)", 50, 100, 10, "history_words"),
+            ]),
+            ("Main Content", [
+                ('current_concepts', "Current Concepts (words)", 500, 1200, 100, "current_concepts_words"),
+                ('summary', "Summary (words)", 300, 700, 50, "summary_words"),
+                ('link_learn', "Link and Learn Questions (words)", 100, 250, 25, "link_learn_words"),
+                ('image_based', "Image Based Questions (words)", 100, 250, 25, "image_based_words"),
+            ]),
+            ("Activities & Exercises", [
+                ('exercises', "Exercise Questions (words)", 300, 800, 50, "exercises_words"),
+                ('skill_activity', "Skill Activities (words)", 200, 400, 50, "skill_activity_words"),
+                ('stem_activity', "STEM Activities (words)", 200, 400, 50, "stem_activity_words"),
+                ('art_learning', "Art Learning (words)", 200, 400, 50, "art_learning_words"),
+            ]),
+        ],
+    },
+}
+
+# Previously generated content panels: (session key, key slug, expander label, empty message, download file name)
+PREVIOUS_CONTENT_PANELS = [
+    ("chapter_content", "chapter", "📖 Chapter Content Available", "📖 No chapter content generated yet", "chapter_content.docx"),
+    ("exercises", "exercises", "📝 Exercises Available", "📝 No exercises generated yet", "exercises.docx"),
+    ("skill_activities", "skills", "🛠️ Skills Available", "🛠️ No skill activities generated yet", "skill_activities.docx"),
+    ("art_learning", "art", "🎨 Art Learning Available", "🎨 No art learning generated yet", "art_learning.docx"),
+]
+
+# Per-type generate buttons: (content type, session state key, label, heading emoji, placeholder PDF name without an upload)
+GENERATED_CONTENT_TYPES = [
+    ("chapter", "chapter_content", "Chapter Content", "📖", "AI_Chapter_Generation"),
+    ("exercises", "exercises", "Exercises", "📝", "AI_Exercises_Generation"),
+    ("skills", "skill_activities", "Skill Activities", "🛠️", "AI_Skills_Generation"),
+    ("art", "art_learning", "Art-Integrated Learning", "🎨", "AI_Projects_Generation"),
+]
+
+@st.fragment
+def content_expander_panel(state_key, content_type, grade_level, subject_type, show_key, close_key):
+    """Expansion studio for one content type while show_key is set; its close button reruns only this fragment"""
+    if not st.session_state.get(show_key, False):
+        return
+    hybrid_content_expander(
+        st.session_state.get(state_key), 
+        content_type, 
+        grade_level, 
+        subject_type
+    )
+    if st.button("❌ Close Expander", key=close_key):
+        st.session_state[show_key] = False
+        st.rerun(scope="fragment")
+
+def render_word_limit_form(layout_name):
+    """Renders a word-limit layout as one form, so editing the numbers doesn't rerun the app until it is submitted"""
+    layout = WORD_LIMIT_LAYOUTS[layout_name]
+    word_limits = {}
+    
+    with st.form(f"wl_{layout_name}"):
+        if layout.get("title"):
+            st.markdown(layout["title"])
+        if layout.get("subtitle"):
+            st.markdown(layout["subtitle"])
+        if layout.get("info"):
+            st.info(layout["info"])
+        
+        for column, (heading, fields) in zip(st.columns(len(layout["columns"])), layout["columns"]):
+            with column:
+                if heading:
+                    st.markdown(f"**{heading}**")
+                for key, label, min_value, default, step, widget_key, *help_text in fields:
+                    word_limits[key] = st.number_input(
+                        label, min_value=min_value, value=default, step=step,
+                        key=widget_key, help=help_text[0] if help_text else None
+                    )
+        
+        st.form_submit_button("Save Word Limits")
+    
+    # Inside a form the inputs report their last submitted values, so this only changes on submit
+    st.session_state.word_limits = word_limits
+
 # --- Streamlit App ---
 st.set_page_config(layout="wide")
 st.title("📚 EeeBee Content Development Suite ✨ (OpenRouter Edition)")
@@ -6856,6 +7963,8 @@ with tab1:
         help="Choose the appropriate subject type based on your needs. Science EVS options are specialized for primary grades. English option uses best practices from Oxford, Cambridge, and Wren & Martin. AI options include CBSE curriculum (9-12) and Composite Skill Lab (JL1-SL3). Robotics option is designed for hands-on learning with IIT kits.",
         key="subject_selector_tab1"
     )
+    # Subject name without the selector annotation, as passed to the content expanders
+    clean_subject = subject_type.removesuffix(" (Uses Model Chapter Progression)")
 
     # Grade/Level Selector - Show appropriate options based on subject
     if subject_type == "Artificial Intelligence":
@@ -6874,339 +7983,45 @@ with tab1:
             help="Select the CBSE grade level for AI content amplification"
         )
         
-        st.info("📚 Upload your CBSE AI chapter PDF below. The content will be amplified and enhanced based on the selected grade level.")
-            
-    elif subject_type in ["Robotics", "Artificial Intelligence (Composite Skill Lab)"]:
-        # Level Selector for Robotics and AI Composite Skill Lab
-        level_options = [
-            "JL1 (Classes 1-3)",
-            "JL2 (Classes 4-5)", 
-            "SL1 (Classes 6-7)",
-            "SL2 (Classes 8-10)",
-            "SL3 (Class 11)"
-        ]
-        selected_level = st.selectbox("Select Target Level:", level_options, index=2, key="level_selector_tab1") # Default to SL1
-        
-        # For Robotics/AI CSL, use the level as grade_level for prompts
-        selected_grade = selected_level
-    else:
-        # Regular Grade Selector for other subjects
-        grade_options = [f"Grade {i}" for i in range(1, 13)] # Grades 1-12
-        selected_grade = st.selectbox("Select Target Grade Level (CBSE):", grade_options, index=8, key="grade_selector_tab1") # Default to Grade 9
-        selected_level = None  # No level for other subjects
-
-    # Word Limit Controls
-    st.subheader("📝 Content Length Settings")
-    with st.expander("Configure Word Limits for Each Section", expanded=False):
-        if subject_type == "Mathematics Primary (Classes 1-5)":
-            # Special word limits for Primary Mathematics
-            st.markdown("**Mathematics Primary (Classes 1-5) Structure**")
-            col1, col2 = st.columns(2)
-            
-            with col1:
-                hook_words = st.number_input("Chapter Opener - The Hook (words)", min_value=100, value=150, step=10, key="primary_hook_words")
-                discover_words = st.number_input("Let's Discover - Concept & Practice (words)", min_value=1000, value=1500, step=100, key="primary_discover_words")
-                activity_words = st.number_input("Activity Zone - Hands-on (words)", min_value=200, value=300, step=25, key="primary_activity_words")
-            
-            with col2:
-                recap_words = st.number_input("Quick Recap - Revision (words)", min_value=150, value=200, step=25, key="primary_recap_words")
-                exercises_words = st.number_input("Exercises (words)", min_value=500, value=800, step=50, key="primary_exercises_words")
-            
-            # Store word limits for primary mathematics
-            st.session_state.word_limits = {
-                'hook': hook_words,
-                'discover': discover_words,
-                'activity': activity_words,
-                'recap': recap_words,
-                'exercises': exercises_words
-            }
-        elif subject_type == "Science & E.V.S. (Classes 1-2)":
-            # Special word limits for Science EVS Classes 1-2
-            st.markdown("**Science & E.V.S. (Classes 1-2) Play-Based Structure**")
-            col1, col2 = st.columns(2)
-            
-            with col1:
-                opener_words = st.number_input("Chapter Opener - Story and Wonder (words)", min_value=100, value=200, step=25, key="evs12_opener_words")
-                activity_words = st.number_input("Let's Play & Do - Per Activity (words)", min_value=150, value=250, step=25, key="evs12_activity_words")
-                concept_words = st.number_input("Concept Connect - Per Concept (words)", min_value=100, value=200, step=25, key="evs12_concept_words")
-            
-            with col2:
-                closer_words = st.number_input("Chapter Closer - Learning Together (words)", min_value=100, value=150, step=25, key="evs12_closer_words")
-                activities_words = st.number_input("Play-Based Activities Total (words)", min_value=400, value=600, step=50, key="evs12_activities_words")
-            
-            # Store word limits for Science EVS Classes 1-2
-            st.session_state.word_limits = {
-                'opener': opener_words,
-                'activity': activity_words,
-                'concept': concept_words,
-                'closer': closer_words,
-                'activities': activities_words
-            }
-        elif subject_type == "Science & E.V.S. (Classes 3-5)":
-            # Special word limits for Science EVS Classes 3-5
-            st.markdown("**Science & E.V.S. (Classes 3-5) Inquiry-Based Structure**")
-            col1, col2 = st.columns(2)
-            
-            with col1:
-                opener_words = st.number_input("Chapter Opener Page (words)", min_value=200, value=300, step=25, key="evs35_opener_words")
-                exploration_words = st.number_input("Let's Uncover the Secrets (words)", min_value=1500, value=2000, step=100, key="evs35_exploration_words")
-                project_words = st.number_input("Capstone Project (words)", min_value=300, value=400, step=50, key="evs35_project_words")
-            
-            with col2:
-                summary_words = st.number_input("Summary & Revision Tools (words)", min_value=200, value=250, step=25, key="evs35_summary_words")
-                exercises_words = st.number_input("End-of-Chapter Exercises (words)", min_value=500, value=600, step=50, key="evs35_exercises_words")
-            
-            # Store word limits for Science EVS Classes 3-5
-            st.session_state.word_limits = {
-                'opener': opener_words,
-                'exploration': exploration_words,
-                'project': project_words,
-                'summary': summary_words,
-                'exercises': exercises_words
-            }
-        elif subject_type == "English Communication & Grammar (Classes 1-8)":
-            # Special word limits for English Communication & Grammar
-            st.markdown("**English Communication & Grammar (Oxford/Cambridge Style)**")
-            
-            # Determine class level for appropriate structure
-            class_num = int(selected_grade.split()[-1])
-            
-            if class_num <= 3:
-                st.markdown("*Primary Level (Classes 1-3): Foundation Building*")
-                col1, col2 = st.columns(2)
-                
-                with col1:
-                    warm_up_words = st.number_input("Warm-Up Activity (words)", min_value=100, value=200, step=25, key="eng_warmup_words")
-                    vocabulary_words = st.number_input("Vocabulary Building (words)", min_value=200, value=300, step=25, key="eng_vocab_words")
-                    grammar_intro_words = st.number_input("Grammar Introduction (words)", min_value=150, value=250, step=25, key="eng_grammar_words")
-                
-                with col2:
-                    practice_words = st.number_input("Practice Activities (words)", min_value=300, value=400, step=50, key="eng_practice_words")
-                    communication_words = st.number_input("Communication Skills (words)", min_value=200, value=300, step=25, key="eng_comm_words")
-                    exercises_words = st.number_input("Exercises & Assessment (words)", min_value=400, value=600, step=50, key="eng_exercises_words")
-                
-                st.session_state.word_limits = {
-                    'warm_up': warm_up_words,
-                    'vocabulary': vocabulary_words,
-                    'grammar_intro': grammar_intro_words,
-                    'practice': practice_words,
-                    'communication': communication_words,
-                    'exercises': exercises_words
-                }
-            
-            elif class_num <= 5:
-                st.markdown("*Elementary Level (Classes 4-5): Skill Development*")
-                col1, col2 = st.columns(2)
-                
-                with col1:
-                    introduction_words = st.number_input("Chapter Introduction (words)", min_value=150, value=250, step=25, key="eng_intro_words")
-                    reading_words = st.number_input("Reading Comprehension (words)", min_value=400, value=600, step=50, key="eng_reading_words")
-                    grammar_words = st.number_input("Grammar Focus (words)", min_value=300, value=500, step=50, key="eng_grammar_focus_words")
-                    vocabulary_words = st.number_input("Vocabulary Expansion (words)", min_value=250, value=350, step=25, key="eng_vocab_exp_words")
-                
-                with col2:
-                    writing_words = st.number_input("Writing Skills (words)", min_value=300, value=450, step=50, key="eng_writing_words")
-                    speaking_words = st.number_input("Speaking & Listening (words)", min_value=250, value=350, step=25, key="eng_speaking_words")
-                    exercises_words = st.number_input("Practice Exercises (words)", min_value=500, value=700, step=50, key="eng_exercises_elem_words")
-                
-                st.session_state.word_limits = {
-                    'introduction': introduction_words,
-                    'reading': reading_words,
-                    'grammar': grammar_words,
-                    'vocabulary': vocabulary_words,
-                    'writing': writing_words,
-                    'speaking': speaking_words,
-                    'exercises': exercises_words
-                }
-            
-            else:  # Classes 6-8
-                st.markdown("*Middle School Level (Classes 6-8): Advanced Communication*")
-                col1, col2, col3 = st.columns(3)
-                
-                with col1:
-                    st.markdown("**Core Skills**")
-                    introduction_words = st.number_input("Chapter Introduction (words)", min_value=200, value=300, step=25, key="eng_intro_mid_words")
-                    reading_words = st.number_input("Reading & Comprehension (words)", min_value=500, value=800, step=50, key="eng_reading_mid_words")
-                    grammar_words = st.number_input("Grammar & Usage (words)", min_value=400, value=600, step=50, key="eng_grammar_mid_words")
-                
-                with col2:
-                    st.markdown("**Communication**")
-                    vocabulary_words = st.number_input("Vocabulary & Etymology (words)", min_value=300, value=400, step=25, key="eng_vocab_mid_words")
-                    writing_words = st.number_input("Composition & Writing (words)", min_value=400, value=600, step=50, key="eng_writing_mid_words")
-                    speaking_words = st.number_input("Speaking & Presentation (words)", min_value=300, value=400, step=25, key="eng_speaking_mid_words")
-                
-                with col3:
-                    st.markdown("**Assessment**")
-                    literature_words = st.number_input("Literature Appreciation (words)", min_value=300, value=500, step=50, key="eng_lit_words")
-                    exercises_words = st.number_input("Comprehensive Exercises (words)", min_value=600, value=900, step=50, key="eng_exercises_mid_words")
-                    projects_words = st.number_input("Language Projects (words)", min_value=200, value=300, step=25, key="eng_projects_words")
-                
-                st.session_state.word_limits = {
-                    'introduction': introduction_words,
-                    'reading': reading_words,
-                    'grammar': grammar_words,
-                    'vocabulary': vocabulary_words,
-                    'writing': writing_words,
-                    'speaking': speaking_words,
-                    'literature': literature_words,
-                    'exercises': exercises_words,
-                    'projects': projects_words
-                }
-        elif subject_type == "Artificial Intelligence":
-            # Enhanced word limits for comprehensive AI textbook chapters
-            st.markdown("**AI Textbook Chapter Structure (O'Reilly/CBSE Standards)**")
-            st.info("📚 Creating publisher-quality AI textbook chapters with comprehensive content")
-            
-            col1, col2 = st.columns(2)
-            
-            with col1:
-                st.markdown("**Core Content**")
-                introduction_words = st.number_input(
-                    "Chapter Introduction & Hook (words)", 
-                    min_value=300, value=400, step=50, 
-                    key="ai_intro_words",
-                    help="Real-world hook, objectives, roadmap"
-                )
-                concepts_words = st.number_input(
-                    "Core AI Concepts & Theory (words)", 
-                    min_value=2000, value=2500, step=100, 
-                    key="ai_concepts_words",
-                    help="Detailed explanations, algorithms, code examples"
-                )
-                hands_on_words = st.number_input(
-                    "Hands-On Labs & Projects (words)", 
-                    min_value=1200, value=1500, step=100, 
-                    key="ai_handson_words",
-                    help="Step-by-step project builds, experiments"
-                )
-            
-            with col2:
-                st.markdown("**Applications & Assessment**")
-                case_studies_words = st.number_input(
-                    "Case Studies & Applications (words)", 
-                    min_value=600, value=800, step=50, 
-                    key="ai_cases_words",
-                    help="Industry examples, Indian context"
-                )
-                exercises_words = st.number_input(
-                    "Exercises & Practice (words)", 
-                    min_value=800, value=1000, step=50, 
-                    key="ai_exercises_words",
-                    help="MCQs, coding challenges, problems"
-                )
-                projects_words = st.number_input(
-                    "Extended Projects & Resources (words)", 
-                    min_value=500, value=600, step=50, 
-                    key="ai_projects_words",
-                    help="Capstone ideas, career connections"
-                )
-            
-            
-            # Store word limits for AI
-            st.session_state.word_limits = {
-                'introduction': introduction_words,
-                'concepts': concepts_words,
-                'hands_on': hands_on_words,
-                'case_studies': case_studies_words,
-                'exercises': exercises_words,
-                'projects': projects_words
-            }
-        elif subject_type == "Robotics":
-            # Special word limits for Robotics
-            st.markdown("**Robotics Structure**")
-            col1, col2 = st.columns(2)
-            
-            with col1:
-                mission_briefing_words = st.number_input("Mission Briefing (words)", min_value=200, value=300, step=25, key="robotics_mission_words")
-                domain_analysis_words = st.number_input("Domain Analysis & Applications (words)", min_value=600, value=800, step=50, key="robotics_domain_words")
-                core_concepts_words = st.number_input("Core Concepts (words)", min_value=2000, value=3000, step=100, key="robotics_concepts_words")
-            
-            with col2:
-                hands_on_project_words = st.number_input("Hands-On Project (words)", min_value=1000, value=1500, step=100, key="robotics_project_words")
-                assessment_words = st.number_input("Assessment & Debrief (words)", min_value=400, value=600, step=50, key="robotics_assessment_words")
-                exercises_words = st.number_input("Exercises (words)", min_value=800, value=1000, step=50, key="robotics_exercises_words")
-            
-            # Store word limits for Robotics
-            st.session_state.word_limits = {
-                'mission_briefing': mission_briefing_words,
-                'domain_analysis': domain_analysis_words,
-                'core_concepts': core_concepts_words,
-                'hands_on_project': hands_on_project_words,
-                'assessment': assessment_words,
-                'exercises': exercises_words
-            }
-        elif subject_type == "Artificial Intelligence (Composite Skill Lab)":
-            # Special word limits for AI Composite Skill Lab
-            st.markdown("**AI Composite Skill Lab Structure**")
-            col1, col2 = st.columns(2)
-            
-            with col1:
-                mission_briefing_words = st.number_input("Mission Briefing (words)", min_value=200, value=300, step=25, key="ai_csl_mission_words")
-                ai_world_words = st.number_input("AI in Our World (words)", min_value=400, value=600, step=50, key="ai_csl_world_words")
-                core_concepts_words = st.number_input("Core AI Concepts (words)", min_value=2000, value=2500, step=100, key="ai_csl_concepts_words")
-                hands_on_tools_words = st.number_input("Hands-On with AI Tools (words)", min_value=800, value=1200, step=100, key="ai_csl_tools_words")
-            
-            with col2:
-                build_project_words = st.number_input("Build Your AI Project (words)", min_value=1000, value=1500, step=100, key="ai_csl_project_words")
-                testing_words = st.number_input("Training & Testing (words)", min_value=600, value=800, step=50, key="ai_csl_testing_words")
-                ethical_ai_words = st.number_input("Ethical AI Explorer (words)", min_value=300, value=500, step=50, key="ai_csl_ethical_words")
-                challenge_words = st.number_input("Challenge Zone (words)", min_value=400, value=600, step=50, key="ai_csl_challenge_words")
-                exercises_words = st.number_input("Exercises (words)", min_value=800, value=1200, step=100, key="ai_csl_exercises_words")
-            
-            # Store word limits
-            st.session_state.word_limits = {
-                'mission_briefing': mission_briefing_words,
-                'ai_world': ai_world_words,
-                'core_concepts': core_concepts_words,
-                'hands_on_tools': hands_on_tools_words,
-                'build_project': build_project_words,
-                'testing': testing_words,
-                'ethical_ai': ethical_ai_words,
-                'challenge': challenge_words,
-                'exercises': exercises_words
-            }
-        else:
-            # Standard word limits for other subjects
-            col1, col2, col3 = st.columns(3)
-            
-            with col1:
-                st.markdown("**Core Sections**")
-                hook_words = st.number_input("Hook (words)", min_value=20, value=80, step=10, key="hook_words")
-                learning_outcome_words = st.number_input("Learning Outcome (words)", min_value=30, value=70, step=10, key="learning_outcome_words")
-                real_world_words = st.number_input("Real World Connection (words)", min_value=30, value=50, step=10, key="real_world_words")
-                previous_class_words = st.number_input("Previous Class Concept (words)", min_value=30, value=100, step=10, key="previous_class_words")
-                history_words = st.number_input("History (words)", min_value=50, value=100, step=10, key="history_words")
-            
-            with col2:
-                st.markdown("**Main Content**")
-                current_concepts_words = st.number_input("Current Concepts (words)", min_value=500, value=1200, step=100, key="current_concepts_words")
-                summary_words = st.number_input("Summary (words)", min_value=300, value=700, step=50, key="summary_words")
-                link_learn_words = st.number_input("Link and Learn Questions (words)", min_value=100, value=250, step=25, key="link_learn_words")
-                image_based_words = st.number_input("Image Based Questions (words)", min_value=100, value=250, step=25, key="image_based_words")
+        st.info("📚 Upload your CBSE AI chapter PDF below. The content will be amplified and enhanced based on the selected grade level.")
             
-            with col3:
-                st.markdown("**Activities & Exercises**")
-                exercises_words = st.number_input("Exercise Questions (words)", min_value=300, value=800, step=50, key="exercises_words")
-                skill_activity_words = st.number_input("Skill Activities (words)", min_value=200, value=400, step=50, key="skill_activity_words")
-                stem_activity_words = st.number_input("STEM Activities (words)", min_value=200, value=400, step=50, key="stem_activity_words")
-                art_learning_words = st.number_input("Art Learning (words)", min_value=200, value=400, step=50, key="art_learning_words")
-
-            # Store word limits in session state
-            st.session_state.word_limits = {
-                'hook': hook_words,
-                'learning_outcome': learning_outcome_words,
-                'real_world': real_world_words,
-                'previous_class': previous_class_words,
-                'history': history_words,
-                'current_concepts': current_concepts_words,
-                'summary': summary_words,
-                'link_learn': link_learn_words,
-                'image_based': image_based_words,
-                'exercises': exercises_words,
-                'skill_activity': skill_activity_words,
-                'stem_activity': stem_activity_words,
-                'art_learning': art_learning_words
-            }
+    elif subject_type in ["Robotics", "Artificial Intelligence (Composite Skill Lab)"]:
+        # Level Selector for Robotics and AI Composite Skill Lab
+        level_options = [
+            "JL1 (Classes 1-3)",
+            "JL2 (Classes 4-5)", 
+            "SL1 (Classes 6-7)",
+            "SL2 (Classes 8-10)",
+            "SL3 (Class 11)"
+        ]
+        selected_level = st.selectbox("Select Target Level:", level_options, index=2, key="level_selector_tab1") # Default to SL1
+        
+        # For Robotics/AI CSL, use the level as grade_level for prompts
+        selected_grade = selected_level
+    else:
+        # Regular Grade Selector for other subjects
+        grade_options = [f"Grade {i}" for i in range(1, 13)] # Grades 1-12
+        selected_grade = st.selectbox("Select Target Grade Level (CBSE):", grade_options, index=8, key="grade_selector_tab1") # Default to Grade 9
+        selected_level = None  # No level for other subjects
+
+    # Word Limit Controls
+    st.subheader("📝 Content Length Settings")
+    with st.expander("Configure Word Limits for Each Section", expanded=False):
+        if subject_type == "English Communication & Grammar (Classes 1-8)":
+            # Determine class level for appropriate structure
+            class_num = int(selected_grade.split()[-1])
+            if class_num <= 3:
+                word_limit_layout = "English Primary (Classes 1-3)"
+            elif class_num <= 5:
+                word_limit_layout = "English Elementary (Classes 4-5)"
+            else:
+                word_limit_layout = "English Middle School (Classes 6-8)"
+        elif subject_type in WORD_LIMIT_LAYOUTS:
+            word_limit_layout = subject_type
+        else:
+            word_limit_layout = "Standard"
+        
+        render_word_limit_form(word_limit_layout)
 
     # Determine when to show PDF processing options
     show_pdf_options = False
@@ -7254,6 +8069,14 @@ with tab1:
         help="Stream responses in real-time as they are generated. You can cancel generation at any time.",
         key="streaming_mode_tab1"
     )
+    
+    # Response cache toggle (streaming and non-streaming generation reuse identical earlier results)
+    force_refresh = st.checkbox(
+        "Regenerate (ignore cached responses)",
+        value=False,
+        help="Identical requests normally return the previously generated content instantly. Tick to call the model again.",
+        key="force_refresh_tab1"
+    )
 
     # Load Model Chapter Progression
     model_progression = load_model_chapter_progression()
@@ -7291,152 +8114,40 @@ with tab1:
                 st.success("✅ All content cleared!")
                 st.rerun()
         
-        prev_col1, prev_col2, prev_col3, prev_col4 = st.columns(4)
-        
-        with prev_col1:
-            if st.session_state.chapter_content:
-                with st.expander("📖 Chapter Content Available", expanded=False):
-                    st.markdown(st.session_state.chapter_content[:500] + "..." if len(st.session_state.chapter_content) > 500 else st.session_state.chapter_content)
-                    
-                    col_dl, col_expand = st.columns(2)
-                    with col_dl:
-                        doc = create_word_document(st.session_state.chapter_content)
-                        doc_io = io.BytesIO()
-                        doc.save(doc_io)
-                        doc_io.seek(0)
-                        st.download_button(
-                            label="📥 Download",
-                            data=doc_io,
-                            file_name="chapter_content.docx",
-                            mime="application/vnd.openxmlformats-officedocument.wordprocessingml.document",
-                            key="prev_download_chapter"
-                        )
-                    with col_expand:
-                        if st.button("✨ Expand Content", key="expand_chapter_btn"):
-                            st.session_state.show_chapter_expander = True
-                            st.rerun()
-            else:
-                st.info("📖 No chapter content generated yet")
-        
-        with prev_col2:
-            if st.session_state.exercises:
-                with st.expander("📝 Exercises Available", expanded=False):
-                    st.markdown(st.session_state.exercises[:500] + "..." if len(st.session_state.exercises) > 500 else st.session_state.exercises)
-                    
-                    col_dl, col_expand = st.columns(2)
-                    with col_dl:
-                        doc = create_word_document(st.session_state.exercises)
-                        doc_io = io.BytesIO()
-                        doc.save(doc_io)
-                        doc_io.seek(0)
-                        st.download_button(
-                            label="📥 Download",
-                            data=doc_io,
-                            file_name="exercises.docx",
-                            mime="application/vnd.openxmlformats-officedocument.wordprocessingml.document",
-                            key="prev_download_exercises"
-                        )
-                    with col_expand:
-                        if st.button("✨ Expand Content", key="expand_exercises_btn"):
-                            st.session_state.show_exercises_expander = True
-                            st.rerun()
-            else:
-                st.info("📝 No exercises generated yet")
-        
-        with prev_col3:
-            if st.session_state.skill_activities:
-                with st.expander("🛠️ Skills Available", expanded=False):
-                    st.markdown(st.session_state.skill_activities[:500] + "..." if len(st.session_state.skill_activities) > 500 else st.session_state.skill_activities)
-                    
-                    col_dl, col_expand = st.columns(2)
-                    with col_dl:
-                        doc = create_word_document(st.session_state.skill_activities)
-                        doc_io = io.BytesIO()
-                        doc.save(doc_io)
-                        doc_io.seek(0)
-                        st.download_button(
-                            label="📥 Download",
-                            data=doc_io,
-                            file_name="skill_activities.docx",
-                            mime="application/vnd.openxmlformats-officedocument.wordprocessingml.document",
-                            key="prev_download_skills"
-                        )
-                    with col_expand:
-                        if st.button("✨ Expand Content", key="expand_skills_btn"):
-                            st.session_state.show_skills_expander = True
-                            st.rerun()
-            else:
-                st.info("🛠️ No skill activities generated yet")
-        
-        with prev_col4:
-            if st.session_state.art_learning:
-                with st.expander("🎨 Art Learning Available", expanded=False):
-                    st.markdown(st.session_state.art_learning[:500] + "..." if len(st.session_state.art_learning) > 500 else st.session_state.art_learning)
-                    
-                    col_dl, col_expand = st.columns(2)
-                    with col_dl:
-                        doc = create_word_document(st.session_state.art_learning)
-                        doc_io = io.BytesIO()
-                        doc.save(doc_io)
-                        doc_io.seek(0)
-                        st.download_button(
-                            label="📥 Download",
-                            data=doc_io,
-                            file_name="art_learning.docx",
-                            mime="application/vnd.openxmlformats-officedocument.wordprocessingml.document",
-                            key="prev_download_art"
-                        )
-                    with col_expand:
-                        if st.button("✨ Expand Content", key="expand_art_btn"):
-                            st.session_state.show_art_expander = True
-                            st.rerun()
-            else:
-                st.info("🎨 No art learning generated yet")
-
-        # Content Expansion Displays (when expand buttons are clicked)
-        if st.session_state.get('show_chapter_expander', False):
-            hybrid_content_expander(
-                st.session_state.chapter_content, 
-                "chapter", 
-                selected_grade, 
-                subject_type.replace(" (Uses Model Chapter Progression)", "")
-            )
-            if st.button("❌ Close Expander", key="close_chapter_expander"):
-                st.session_state.show_chapter_expander = False
-                st.rerun()
-        
-        if st.session_state.get('show_exercises_expander', False):
-            hybrid_content_expander(
-                st.session_state.exercises, 
-                "exercises", 
-                selected_grade, 
-                subject_type.replace(" (Uses Model Chapter Progression)", "")
-            )
-            if st.button("❌ Close Expander", key="close_exercises_expander"):
-                st.session_state.show_exercises_expander = False
-                st.rerun()
-        
-        if st.session_state.get('show_skills_expander', False):
-            hybrid_content_expander(
-                st.session_state.skill_activities, 
-                "skills", 
-                selected_grade, 
-                subject_type.replace(" (Uses Model Chapter Progression)", "")
-            )
-            if st.button("❌ Close Expander", key="close_skills_expander"):
-                st.session_state.show_skills_expander = False
-                st.rerun()
-        
-        if st.session_state.get('show_art_expander', False):
-            hybrid_content_expander(
-                st.session_state.art_learning, 
-                "art", 
-                selected_grade, 
-                subject_type.replace(" (Uses Model Chapter Progression)", "")
-            )
-            if st.button("❌ Close Expander", key="close_art_expander"):
-                st.session_state.show_art_expander = False
-                st.rerun()
+        for prev_col, (state_key, slug, available_label, empty_message, file_name) in zip(st.columns(4), PREVIOUS_CONTENT_PANELS):
+            with prev_col:
+                if st.session_state.get(state_key):
+                    with st.expander(available_label, expanded=False):
+                        st.markdown(content_preview(state_key))
+                        
+                        col_dl, col_expand = st.columns(2)
+                        with col_dl:
+                            # The document is built when the button is clicked, not on every rerun
+                            st.download_button(
+                                label="📥 Download",
+                                data=partial(_build_docx_bytes, st.session_state[state_key]),
+                                file_name=file_name,
+                                mime="application/vnd.openxmlformats-officedocument.wordprocessingml.document",
+                                key=f"prev_download_{slug}"
+                            )
+                        with col_expand:
+                            if st.button("✨ Expand Content", key=f"expand_{slug}_btn"):
+                                # Opening one expander closes the others
+                                for _, other_slug, *_ in PREVIOUS_CONTENT_PANELS:
+                                    st.session_state[f"show_{other_slug}_expander"] = other_slug == slug
+                                st.rerun()
+                else:
+                    st.info(empty_message)
+
+        # Content Expansion Display (when an expand button is clicked). The expanders share widget keys,
+        # so only one is open at a time and the first open panel is the only one dispatched
+        open_panel = next(
+            ((state_key, slug) for state_key, slug, *_ in PREVIOUS_CONTENT_PANELS if st.session_state.get(f"show_{slug}_expander", False)),
+            None
+        )
+        if open_panel:
+            state_key, slug = open_panel
+            content_expander_panel(state_key, slug, selected_grade, clean_subject, f"show_{slug}_expander", f"close_{slug}_expander")
 
         # Check if AI subject is selected - PDF required for amplification
         if subject_type == "Artificial Intelligence":
@@ -7455,7 +8166,7 @@ with tab1:
             
             if uploaded_file_st is not None:
                 st.info(f"Processing '{uploaded_file_st.name}' for {selected_grade} - Will amplify and enhance the content...")
-                pdf_bytes = uploaded_file_st.getvalue()
+                pdf_bytes = uploaded_file_bytes(uploaded_file_st)
             else:
                 st.warning("Please upload a CBSE AI chapter PDF to amplify")
                 pdf_bytes = None
@@ -7471,7 +8182,7 @@ with tab1:
 
             if uploaded_file_st is not None:
                 st.info(f"Processing '{uploaded_file_st.name}' for {selected_grade} - Will improve based on your existing content...")
-                pdf_bytes = uploaded_file_st.getvalue()
+                pdf_bytes = uploaded_file_bytes(uploaded_file_st)
             else:
                 st.success("No PDF uploaded - Will generate fresh AI CSL content from scratch!")
                 pdf_bytes = None
@@ -7483,10 +8194,17 @@ with tab1:
                 st.info(f"Processing '{uploaded_file_st.name}' for {selected_grade}...")
                 
                 # Get PDF bytes for processing
-                pdf_bytes = uploaded_file_st.getvalue()
+                pdf_bytes = uploaded_file_bytes(uploaded_file_st)
             else:
                 pdf_bytes = None
 
+        # Start extracting the PDF text now so it is ready by the time a generate button is clicked
+        if pdf_bytes is not None:
+            start_pdf_prefetch(pdf_bytes, pdf_method)
+        
+        # Shared end of every download file name: the uploaded PDF's name as .docx, or the grade without an upload
+        docx_suffix = f"{uploaded_file_st.name.removesuffix('.pdf')}.docx" if uploaded_file_st else f"{selected_grade.replace(' ', '_')}.docx"
+
         st.divider()
         
         st.subheader("🚀 Generate New Content")
@@ -7550,14 +8268,19 @@ with tab1:
             # For primary mathematics, show chapter and exercises generation
             st.info("📘 **Mathematics Primary Mode**: For Classes 1-5, we provide specialized content generation designed for young learners.")
             
-            # Show chapter and exercises buttons for primary mathematics
-            prim_col1, prim_col2 = st.columns(2)
-            
-            with prim_col1:
-                generate_chapter = st.button("🔍 Generate Complete Mathematics Chapter", key="gen_primary_chapter")
-            
-            with prim_col2:
-                generate_exercises = st.button("📝 Generate Mathematics Exercises", key="gen_primary_exercises")
+            # Show chapter and exercises buttons for primary mathematics (only once a PDF is uploaded)
+            if uploaded_file_st is None:
+                st.info("⚠️ Please upload a chapter PDF first to enable generation options")
+                generate_chapter = False
+                generate_exercises = False
+            else:
+                prim_col1, prim_col2 = st.columns(2)
+                
+                with prim_col1:
+                    generate_chapter = st.button("🔍 Generate Complete Mathematics Chapter", key="gen_primary_chapter")
+                
+                with prim_col2:
+                    generate_exercises = st.button("📝 Generate Mathematics Exercises", key="gen_primary_exercises")
             
             generate_skills = False  
             generate_art = False
@@ -7565,14 +8288,19 @@ with tab1:
             # For Science EVS Classes 1-2, show chapter and activities generation
             st.info("🌱 **Science & E.V.S. Classes 1-2**: Play-based learning approach for foundational stage. Activities are integrated within the chapter.")
             
-            # Show chapter and activities buttons for Science EVS Classes 1-2
-            evs12_col1, evs12_col2 = st.columns(2)
-            
-            with evs12_col1:
-                generate_chapter = st.button("🔍 Generate Play-Based Chapter", key="gen_evs12_chapter")
-            
-            with evs12_col2:
-                generate_exercises = st.button("🎮 Generate Play Activities", key="gen_evs12_activities")
+            # Show chapter and activities buttons for Science EVS Classes 1-2 (only once a PDF is uploaded)
+            if uploaded_file_st is None:
+                st.info("⚠️ Please upload a chapter PDF first to enable generation options")
+                generate_chapter = False
+                generate_exercises = False
+            else:
+                evs12_col1, evs12_col2 = st.columns(2)
+                
+                with evs12_col1:
+                    generate_chapter = st.button("🔍 Generate Play-Based Chapter", key="gen_evs12_chapter")
+                
+                with evs12_col2:
+                    generate_exercises = st.button("🎮 Generate Play Activities", key="gen_evs12_activities")
             
             generate_skills = False  
             generate_art = False
@@ -7580,14 +8308,19 @@ with tab1:
             # For Science EVS Classes 3-5, show chapter and exercises generation
             st.info("🔬 **Science & E.V.S. Classes 3-5**: Inquiry-based learning approach for preparatory stage. Skills and art activities are integrated within the chapter.")
             
-            # Show chapter and exercises buttons for Science EVS Classes 3-5
-            evs35_col1, evs35_col2 = st.columns(2)
-            
-            with evs35_col1:
-                generate_chapter = st.button("🔍 Generate Inquiry-Based Chapter", key="gen_evs35_chapter")
-            
-            with evs35_col2:
-                generate_exercises = st.button("📝 Generate Assessment Exercises", key="gen_evs35_exercises")
+            # Show chapter and exercises buttons for Science EVS Classes 3-5 (only once a PDF is uploaded)
+            if uploaded_file_st is None:
+                st.info("⚠️ Please upload a chapter PDF first to enable generation options")
+                generate_chapter = False
+                generate_exercises = False
+            else:
+                evs35_col1, evs35_col2 = st.columns(2)
+                
+                with evs35_col1:
+                    generate_chapter = st.button("🔍 Generate Inquiry-Based Chapter", key="gen_evs35_chapter")
+                
+                with evs35_col2:
+                    generate_exercises = st.button("📝 Generate Assessment Exercises", key="gen_evs35_exercises")
             
             generate_skills = False  
             generate_art = False
@@ -7615,31 +8348,95 @@ with tab1:
                     generate_skills = False
                     generate_art = False
             
+        # Generate All Button: runs every content type offered above concurrently
+        if subject_type in ["Mathematics Primary (Classes 1-5)", "Science & E.V.S. (Classes 1-2)", "Science & E.V.S. (Classes 3-5)"]:
+            all_content_types = ["chapter", "exercises"]
+        else:
+            all_content_types = ["chapter", "exercises", "skills", "art"]
+        if pdf_bytes is not None or subject_type == "Artificial Intelligence (Composite Skill Lab)":
+            generate_all_types = st.button(f"⚡ Generate All {len(all_content_types)} Content Types Together", key="generate_all_types")
+        else:
+            generate_all_types = False
+        
         # Download All Button (outside columns)
         download_all = st.button("📥 Download Complete Chapter with All Elements", key="download_all")
         
+        # Word limits from session state, read once for every generation path below
+        word_limits = st.session_state.setdefault('word_limits', {})
+        
+        if generate_all_types:
+            pdf_filename = uploaded_file_st.name if uploaded_file_st else "AI_Content_Generation"
+            
+            content_labels = {"chapter": "Chapter Content", "exercises": "Exercises", "skills": "Skill Activities", "art": "Art-Integrated Learning"}
+            state_keys = {"chapter": "chapter_content", "exercises": "exercises", "skills": "skill_activities", "art": "art_learning"}
+            placeholders = {}
+            for content_type in all_content_types:
+                st.markdown(f"#### {content_labels[content_type]}")
+                placeholders[content_type] = st.empty()
+            
+            with st.spinner(f"🧠 Generating {len(all_content_types)} content types for {selected_grade}..."):
+                results = generate_all(
+                    all_content_types, 
+                    pdf_bytes, 
+                    pdf_filename, 
+                    selected_grade, 
+                    model_progression, 
+                    subject_type, 
+                    word_limits,
+                    use_openrouter_method=(pdf_method == "Direct PDF Upload (OpenRouter Recommended)"),
+                    pdf_method=pdf_method,
+                    placeholders=placeholders,
+                    use_chunked=(analysis_method == "Chunked (For Complex Documents)"),
+                    force_refresh=force_refresh
+                )
+            
+            for content_type, (content, message) in results.items():
+                if content:
+                    st.session_state[state_keys[content_type]] = content
+                    
+                    # CRITICAL: Save content with protection
+                    save_content_safely(state_keys[content_type], content, selected_grade)
+                    
+                    with placeholders[content_type].container():
+                        st.success(f"✅ {content_labels[content_type]} generated successfully! {message}")
+                        with st.expander(f"View {content_labels[content_type]}", expanded=False):
+                            st.markdown(content)
+                else:
+                    placeholders[content_type].error(f"❌ Failed to generate {content_labels[content_type]}: {message}")
+        
         # Handle button clicks and content generation
-        if generate_chapter:
-                # Get word limits from session state
-                word_limits = st.session_state.get('word_limits', {})
+        # Per-type generate buttons share one flow; chapter streaming keeps its own inline handling below
+        generate_flags = {"chapter": generate_chapter, "exercises": generate_exercises, "skills": generate_skills, "art": generate_art}
+        for content_type, state_key, content_label, content_emoji, ai_filename in GENERATED_CONTENT_TYPES:
+            if generate_flags[content_type]:
+                # For AI subject without PDF, pass a placeholder name
+                pdf_filename = uploaded_file_st.name if uploaded_file_st else ai_filename
+                download_filename = f"{state_key}_{docx_suffix}"
                 
-                with st.spinner(f"🧠 Generating Chapter Content for {selected_grade}..."):
-                    if use_streaming:
-                        # Initialize cancel event for streaming
-                        st.session_state.cancel_event = Event()
+                with st.spinner(f"🧠 Generating {content_label} for {selected_grade}..."):
+                    if use_streaming and content_type == "chapter":
+                        # Reuse the session's cancel event for streaming, reset for this generation; the
+                        # per-chunk loop checks the local binding instead of going through session_state
+                        cancel_event = st.session_state.setdefault("cancel_event", Event())
+                        cancel_event.clear()
                         
                         # Create cancel button and content container
                         cancel_col1, cancel_col2 = st.columns([5, 1])
                         with cancel_col2:
                             cancel_button = st.button("🛑 Cancel", key="cancel_chapter")
                             if cancel_button:
-                                st.session_state.cancel_event.set()
+                                cancel_event.set()
                         
                         # Create container for streaming content
                         content_container = st.container()
                         with content_container:
                             content_placeholder = st.empty()
-                            accumulated_content = ""
+                            content_parts = []
+                            content_length = 0
+                            save_state = {}
+                            last_render_time = 0.0
+                            stream_placeholder = None
+                            content_saved = False
                             
                             try:
                                 # Stream the content
@@ -7655,20 +8452,29 @@ with tab1:
                                     subject_type,
                                     word_limits,
                                     use_openrouter_method=(pdf_method == "Direct PDF Upload (OpenRouter Recommended)"),
-                                    pdf_method=pdf_method
+                                    pdf_method=pdf_method,
+                                    force_refresh=force_refresh
                                 ):
-                                    if st.session_state.cancel_event.is_set():
+                                    if cancel_event.is_set():
                                         st.warning("⚠️ Generation cancelled by user.")
                                         break
-                                    accumulated_content += chunk
+                                    content_parts.append(chunk)
+                                    content_length += len(chunk)
                                     
                                     # CRITICAL: Auto-save during streaming to prevent loss
-                                    auto_save_during_streaming("chapter_content", accumulated_content)
+                                    auto_save_during_streaming("chapter_content", content_parts, content_length, save_state)
                                     
-                                    # Update the placeholder with accumulated content (in a code block to preserve formatting)
-                                    with content_placeholder.container():
-                                        st.markdown("### Generated Chapter Content:")
-                                        st.markdown(accumulated_content + " ⏳")
+                                    # Update the placeholder with accumulated content (throttled; the final render follows the loop)
+                                    if time.monotonic() - last_render_time >= STREAM_RENDER_INTERVAL:
+                                        last_render_time = time.monotonic()
+                                        if stream_placeholder is None:
+                                            # The header is emitted once; later renders only replace the streamed text
+                                            with content_placeholder.container():
+                                                st.markdown("### Generated Chapter Content:")
+                                                stream_placeholder = st.empty()
+                                        stream_placeholder.markdown("".join(content_parts) + " ⏳")
+                                
+                                accumulated_content = "".join(content_parts)
                                 
                                 # Always save content if we have any, regardless of completion status
                                 if accumulated_content:
@@ -7676,28 +8482,26 @@ with tab1:
                                     
                                     # CRITICAL: Final save with all protection strategies
                                     save_content_safely("chapter_content", accumulated_content, selected_grade)
+                                    content_saved = True
                                     
                                     with content_placeholder.container():
-                                        if st.session_state.cancel_event.is_set():
+                                        if cancel_event.is_set():
                                             st.markdown("### ⚠️ Chapter Content (Cancelled - Partial):")
                                         else:
                                             st.markdown("### ✅ Chapter Content (Complete):")
                                         st.markdown(st.session_state.chapter_content)
                                     
-                                    if st.session_state.cancel_event.is_set():
+                                    if cancel_event.is_set():
                                         st.warning("⚠️ Chapter Content partially generated (cancelled by user) but saved!")
                                     else:
                                         st.success(f"✅ Chapter Content generated successfully!")
                                     
                                     # Download button (available even for partial content)
-                                    doc = create_word_document(st.session_state.chapter_content)
-                                    doc_io = io.BytesIO()
-                                    doc.save(doc_io)
-                                    doc_io.seek(0)
-                                    download_filename = f"chapter_content_{uploaded_file_st.name.replace('.pdf', '.docx')}" if uploaded_file_st else f"chapter_content_{selected_grade.replace(' ', '_')}.docx"
+                                    doc_bytes = _build_docx_bytes(st.session_state.chapter_content)
+                                    download_filename = f"chapter_content_{docx_suffix}"
                                     st.download_button(
                                         label="📥 Download Chapter Content as Word (.docx)",
-                                        data=doc_io,
+                                        data=doc_bytes,
                                         file_name=download_filename,
                                         mime="application/vnd.openxmlformats-officedocument.wordprocessingml.document",
                                         key="download_chapter_streaming"
@@ -7708,231 +8512,56 @@ with tab1:
                             except Exception as e:
                                 st.error(f"❌ Error during streaming: {e}")
                                 # Always save any partial content
+                                accumulated_content = "".join(content_parts)
                                 if accumulated_content:
                                     st.info("💾 Saving partial content despite error...")
                                     st.session_state.chapter_content = accumulated_content
                                     
                                     # CRITICAL: Save partial content with protection
                                     save_content_safely("chapter_content", accumulated_content, selected_grade)
+                                    content_saved = True
                                     
                                     with content_placeholder.container():
                                         st.markdown("### ⚠️ Chapter Content (Partial - Error Occurred):")
                                         st.markdown(st.session_state.chapter_content)
                                     
                                     # Download button for partial content
-                                    doc = create_word_document(st.session_state.chapter_content)
-                                    doc_io = io.BytesIO()
-                                    doc.save(doc_io)
-                                    doc_io.seek(0)
-                                    download_filename = f"partial_chapter_content_{uploaded_file_st.name.replace('.pdf', '.docx')}" if uploaded_file_st else f"partial_chapter_content_{selected_grade.replace(' ', '_')}.docx"
+                                    doc_bytes = _build_docx_bytes(st.session_state.chapter_content)
+                                    download_filename = f"partial_chapter_content_{docx_suffix}"
                                     st.download_button(
                                         label="📥 Download Partial Chapter Content as Word (.docx)",
-                                        data=doc_io,
+                                        data=doc_bytes,
                                         file_name=download_filename,
                                         mime="application/vnd.openxmlformats-officedocument.wordprocessingml.document",
                                         key="download_chapter_partial"
                                     )
-                    else:
-                        # Use non-streaming approach
-                        # For AI subject without PDF, pass None for pdf_bytes and a placeholder name
-                        pdf_filename = uploaded_file_st.name if uploaded_file_st else "AI_Chapter_Generation"
-                        
-                        content, message = generate_specific_content(
-                            "chapter", 
-                            pdf_bytes, 
-                            pdf_filename, 
-                            selected_grade, 
-                            model_progression, 
-                            subject_type, 
-                            word_limits,
-                            use_chunked=(analysis_method == "Chunked (For Complex Documents)"), 
-                            use_openrouter_method=(pdf_method == "Direct PDF Upload (OpenRouter Recommended)"),
-                            pdf_method=pdf_method
-                        )
-                        if content:
-                            st.session_state.chapter_content = content
-                            
-                            # CRITICAL: Save content with protection
-                            save_content_safely("chapter_content", content, selected_grade)
-                            
-                            st.success(f"✅ Chapter Content generated successfully! {message}")
-                            st.subheader("📖 Chapter Content:")
-                            with st.expander("View Chapter Content", expanded=True):
-                                st.markdown(st.session_state.chapter_content)
-                            
-                            # Download and Expand buttons
-                            dl_col, expand_col = st.columns(2)
-                            with dl_col:
-                                doc = create_word_document(st.session_state.chapter_content)
-                                doc_io = io.BytesIO()
-                                doc.save(doc_io)
-                                doc_io.seek(0)
-                                download_filename = f"chapter_content_{uploaded_file_st.name.replace('.pdf', '.docx')}" if uploaded_file_st else f"chapter_content_{selected_grade.replace(' ', '_')}.docx"
-                                st.download_button(
-                                    label="📥 Download Chapter Content as Word (.docx)",
-                                    data=doc_io,
-                                    file_name=download_filename,
-                                    mime="application/vnd.openxmlformats-officedocument.wordprocessingml.document",
-                                    key="download_chapter_standard"
-                                )
-                            with expand_col:
-                                if st.button("✨ Expand This Content", key="expand_new_chapter"):
-                                    st.session_state.show_new_chapter_expander = True
-                                    st.rerun()
-                        
-                        # Show expander for newly generated content
-                        if st.session_state.get('show_new_chapter_expander', False):
-                            hybrid_content_expander(
-                                st.session_state.chapter_content, 
-                                "chapter", 
-                                selected_grade, 
-                                subject_type.replace(" (Uses Model Chapter Progression)", "")
-                            )
-                            if st.button("❌ Close Expander", key="close_new_chapter_expander"):
-                                st.session_state.show_new_chapter_expander = False
-                                st.rerun()
-                        else:
-                            st.error(f"❌ Failed to generate Chapter Content: {message}")
-            
-        if generate_exercises:
-                # Get word limits from session state
-                word_limits = st.session_state.get('word_limits', {})
-                
-                with st.spinner(f"🧠 Generating Exercises for {selected_grade}..."):
-                    if use_streaming:
-                        # For AI subject without PDF, pass placeholder name
-                        pdf_filename = uploaded_file_st.name if uploaded_file_st else "AI_Exercises_Generation"
-                        content, message = handle_streaming_generation(
-                            "exercises", pdf_bytes, pdf_filename, selected_grade, 
-                            model_progression, subject_type, word_limits, "exercises", pdf_method
-                        )
-                        if content:
-                            st.session_state.exercises = content
-                            st.success(f"✅ Exercises generated successfully! {message}")
-                            
-                            # Download button
-                            doc = create_word_document(st.session_state.exercises)
-                            doc_io = io.BytesIO()
-                            doc.save(doc_io)
-                            doc_io.seek(0)
-                            # Generate filename based on whether PDF was uploaded
-                            if uploaded_file_st:
-                                download_filename = f"exercises_{uploaded_file_st.name.replace('.pdf', '.docx')}"
-                            else:
-                                download_filename = f"exercises_{selected_grade.replace(' ', '_')}.docx"
-                            
-                            st.download_button(
-                                label="📥 Download Exercises as Word (.docx)",
-                                data=doc_io,
-                                file_name=download_filename,
-                                mime="application/vnd.openxmlformats-officedocument.wordprocessingml.document",
-                                key="download_exercises_streaming"
-                            )
-                        else:
-                            st.error(f"❌ Failed to generate Exercises: {message}")
-                    else:
-                        # For AI subject without PDF, pass None for pdf_bytes and a placeholder name
-                        pdf_filename = uploaded_file_st.name if uploaded_file_st else "AI_Exercises_Generation"
-                        
-                        content, message = generate_specific_content(
-                            "exercises", 
-                            pdf_bytes, 
-                            pdf_filename, 
-                            selected_grade, 
-                            model_progression, 
-                            subject_type, 
-                            word_limits,
-                            use_chunked=(analysis_method == "Chunked (For Complex Documents)"), 
-                            use_openrouter_method=(pdf_method == "Direct PDF Upload (OpenRouter Recommended)"),
-                            pdf_method=pdf_method
-                        )
-                        if content:
-                            st.session_state.exercises = content
-                            
-                            # CRITICAL: Save content with protection
-                            save_content_safely("exercises", content, selected_grade)
-                            
-                            st.success(f"✅ Exercises generated successfully! {message}")
-                            st.subheader("📝 Exercises:")
-                            with st.expander("View Exercises", expanded=True):
-                                st.markdown(st.session_state.exercises)
-                            
-                            # Download and Expand buttons
-                            dl_col, expand_col = st.columns(2)
-                            with dl_col:
-                                doc = create_word_document(st.session_state.exercises)
-                                doc_io = io.BytesIO()
-                                doc.save(doc_io)
-                                doc_io.seek(0)
-                                download_filename = f"exercises_{uploaded_file_st.name.replace('.pdf', '.docx')}" if uploaded_file_st else f"exercises_{selected_grade.replace(' ', '_')}.docx"
-                                st.download_button(
-                                    label="📥 Download Exercises as Word (.docx)",
-                                    data=doc_io,
-                                    file_name=download_filename,
-                                    mime="application/vnd.openxmlformats-officedocument.wordprocessingml.document",
-                                    key="download_exercises_standard"
-                                )
-                            with expand_col:
-                                if st.button("✨ Expand This Content", key="expand_new_exercises"):
-                                    st.session_state.show_new_exercises_expander = True
-                                    st.rerun()
-                        
-                        # Show expander for newly generated exercises
-                        if st.session_state.get('show_new_exercises_expander', False):
-                            hybrid_content_expander(
-                                st.session_state.exercises, 
-                                "exercises", 
-                                selected_grade, 
-                                subject_type.replace(" (Uses Model Chapter Progression)", "")
-                            )
-                            if st.button("❌ Close Expander", key="close_new_exercises_expander"):
-                                st.session_state.show_new_exercises_expander = False
-                                st.rerun()
-                        else:
-                            st.error(f"❌ Failed to generate Exercises: {message}")
-            
-        if generate_skills:
-                # Get word limits from session state
-                word_limits = st.session_state.get('word_limits', {})
-                
-                with st.spinner(f"🧠 Generating Skill Activities for {selected_grade}..."):
-                    if use_streaming:
-                        # For AI subject without PDF, pass placeholder name
-                        pdf_filename = uploaded_file_st.name if uploaded_file_st else "AI_Skills_Generation"
+                            finally:
+                                # A rerun stops the script with an exception the handler above doesn't catch;
+                                # keep whatever streamed since the last periodic save
+                                if not content_saved and content_parts:
+                                    save_content_safely("chapter_content", "".join(content_parts), selected_grade, persist_to_browser=False)
+                    elif use_streaming:
                         content, message = handle_streaming_generation(
-                            "skills", pdf_bytes, pdf_filename, selected_grade, 
-                            model_progression, subject_type, word_limits, "skills", pdf_method
+                            content_type, pdf_bytes, pdf_filename, selected_grade, 
+                            model_progression, subject_type, word_limits, content_type, pdf_method, force_refresh
                         )
                         if content:
-                            st.session_state.skill_activities = content
-                            st.success(f"✅ Skill Activities generated successfully! {message}")
+                            st.session_state[state_key] = content
+                            st.success(f"✅ {content_label} generated successfully! {message}")
                             
                             # Download button
-                            doc = create_word_document(st.session_state.skill_activities)
-                            doc_io = io.BytesIO()
-                            doc.save(doc_io)
-                            doc_io.seek(0)
-                            # Generate filename based on whether PDF was uploaded
-                            if uploaded_file_st:
-                                download_filename = f"skill_activities_{uploaded_file_st.name.replace('.pdf', '.docx')}"
-                            else:
-                                download_filename = f"skill_activities_{selected_grade.replace(' ', '_')}.docx"
-                            
                             st.download_button(
-                                label="📥 Download Skill Activities as Word (.docx)",
-                                data=doc_io,
+                                label=f"📥 Download {content_label} as Word (.docx)",
+                                data=partial(_build_docx_bytes, content),
                                 file_name=download_filename,
                                 mime="application/vnd.openxmlformats-officedocument.wordprocessingml.document",
-                                key="download_skills_streaming"
+                                key=f"download_{content_type}_streaming"
                             )
                         else:
-                            st.error(f"❌ Failed to generate Skill Activities: {message}")
+                            st.error(f"❌ Failed to generate {content_label}: {message}")
                     else:
-                        # For AI subject without PDF, pass None for pdf_bytes and a placeholder name
-                        pdf_filename = uploaded_file_st.name if uploaded_file_st else "AI_Skills_Generation"
-                        
                         content, message = generate_specific_content(
-                            "skills", 
+                            content_type, 
                             pdf_bytes, 
                             pdf_filename, 
                             selected_grade, 
@@ -7941,187 +8570,64 @@ with tab1:
                             word_limits,
                             use_chunked=(analysis_method == "Chunked (For Complex Documents)"), 
                             use_openrouter_method=(pdf_method == "Direct PDF Upload (OpenRouter Recommended)"),
-                            pdf_method=pdf_method
+                            pdf_method=pdf_method,
+                            force_refresh=force_refresh
                         )
                         if content:
-                            st.session_state.skill_activities = content
+                            st.session_state[state_key] = content
                             
                             # CRITICAL: Save content with protection
-                            save_content_safely("skill_activities", content, selected_grade)
+                            save_content_safely(state_key, content, selected_grade)
                             
-                            st.success(f"✅ Skill Activities generated successfully! {message}")
-                            st.subheader("🛠️ Skill Activities:")
-                            with st.expander("View Skill Activities", expanded=True):
-                                st.markdown(st.session_state.skill_activities)
+                            st.success(f"✅ {content_label} generated successfully! {message}")
+                            st.subheader(f"{content_emoji} {content_label}:")
+                            with st.expander(f"View {content_label}", expanded=True):
+                                st.markdown(content)
                             
                             # Download and Expand buttons
                             dl_col, expand_col = st.columns(2)
                             with dl_col:
-                                doc = create_word_document(st.session_state.skill_activities)
-                                doc_io = io.BytesIO()
-                                doc.save(doc_io)
-                                doc_io.seek(0)
-                                download_filename = f"skill_activities_{uploaded_file_st.name.replace('.pdf', '.docx')}" if uploaded_file_st else f"skill_activities_{selected_grade.replace(' ', '_')}.docx"
                                 st.download_button(
-                                    label="📥 Download Skill Activities as Word (.docx)",
-                                    data=doc_io,
+                                    label=f"📥 Download {content_label} as Word (.docx)",
+                                    data=partial(_build_docx_bytes, content),
                                     file_name=download_filename,
                                     mime="application/vnd.openxmlformats-officedocument.wordprocessingml.document",
-                                    key="download_skills_standard"
+                                    key=f"download_{content_type}_standard"
                                 )
                             with expand_col:
-                                if st.button("✨ Expand This Content", key="expand_new_skills"):
-                                    st.session_state.show_new_skills_expander = True
+                                if st.button("✨ Expand This Content", key=f"expand_new_{content_type}"):
+                                    st.session_state[f"show_new_{content_type}_expander"] = True
                                     st.rerun()
-                        
-                        # Show expander for newly generated skills
-                        if st.session_state.get('show_new_skills_expander', False):
-                            hybrid_content_expander(
-                                st.session_state.skill_activities, 
-                                "skills", 
-                                selected_grade, 
-                                subject_type.replace(" (Uses Model Chapter Progression)", "")
-                            )
-                            if st.button("❌ Close Expander", key="close_new_skills_expander"):
-                                st.session_state.show_new_skills_expander = False
-                                st.rerun()
-                        else:
-                            st.error(f"❌ Failed to generate Skill Activities: {message}")
-            
-        if generate_art:
-                # Get word limits from session state
-                word_limits = st.session_state.get('word_limits', {})
-                
-                with st.spinner(f"🧠 Generating Art-Integrated Learning for {selected_grade}..."):
-                    if use_streaming:
-                        # For AI subject without PDF, pass placeholder name
-                        pdf_filename = uploaded_file_st.name if uploaded_file_st else "AI_Projects_Generation"
-                        content, message = handle_streaming_generation(
-                            "art", pdf_bytes, pdf_filename, selected_grade, 
-                            model_progression, subject_type, word_limits, "art", pdf_method
-                        )
-                        if content:
-                            st.session_state.art_learning = content
-                            st.success(f"✅ Art-Integrated Learning generated successfully! {message}")
-                            
-                            # Download button
-                            doc = create_word_document(st.session_state.art_learning)
-                            doc_io = io.BytesIO()
-                            doc.save(doc_io)
-                            doc_io.seek(0)
-                            # Generate filename based on whether PDF was uploaded
-                            if uploaded_file_st:
-                                download_filename = f"art_learning_{uploaded_file_st.name.replace('.pdf', '.docx')}"
-                            else:
-                                download_filename = f"art_learning_{selected_grade.replace(' ', '_')}.docx"
-                            
-                            st.download_button(
-                                label="📥 Download Art-Integrated Learning as Word (.docx)",
-                                data=doc_io,
-                                file_name=download_filename,
-                                mime="application/vnd.openxmlformats-officedocument.wordprocessingml.document",
-                                key="download_art_streaming"
-                            )
                         else:
-                            st.error(f"❌ Failed to generate Art-Integrated Learning: {message}")
-                    else:
-                        # For AI subject without PDF, pass None for pdf_bytes and a placeholder name  
-                        pdf_filename = uploaded_file_st.name if uploaded_file_st else "AI_Projects_Generation"
-                        
-                        content, message = generate_specific_content(
-                            "art", 
-                            pdf_bytes, 
-                            pdf_filename, 
-                            selected_grade, 
-                            model_progression, 
-                            subject_type, 
-                            word_limits,
-                            use_chunked=(analysis_method == "Chunked (For Complex Documents)"), 
-                            use_openrouter_method=(pdf_method == "Direct PDF Upload (OpenRouter Recommended)"),
-                            pdf_method=pdf_method
-                        )
-                        if content:
-                            st.session_state.art_learning = content
-                            
-                            # CRITICAL: Save content with protection
-                            save_content_safely("art_learning", content, selected_grade)
-                            
-                            st.success(f"✅ Art-Integrated Learning generated successfully! {message}")
-                            st.subheader("🎨 Art-Integrated Learning:")
-                            with st.expander("View Art-Integrated Learning", expanded=True):
-                                st.markdown(st.session_state.art_learning)
-                            
-                            # Download and Expand buttons
-                            dl_col, expand_col = st.columns(2)
-                            with dl_col:
-                                doc = create_word_document(st.session_state.art_learning)
-                                doc_io = io.BytesIO()
-                                doc.save(doc_io)
-                                doc_io.seek(0)
-                                download_filename = f"art_learning_{uploaded_file_st.name.replace('.pdf', '.docx')}" if uploaded_file_st else f"art_learning_{selected_grade.replace(' ', '_')}.docx"
-                                st.download_button(
-                                    label="📥 Download Art-Integrated Learning as Word (.docx)",
-                                    data=doc_io,
-                                    file_name=download_filename,
-                                    mime="application/vnd.openxmlformats-officedocument.wordprocessingml.document",
-                                    key="download_art_standard"
-                                )
-                            with expand_col:
-                                if st.button("✨ Expand This Content", key="expand_new_art"):
-                                    st.session_state.show_new_art_expander = True
-                                    st.rerun()
+                            st.error(f"❌ Failed to generate {content_label}: {message}")
                         
-                        # Show expander for newly generated art learning
-                        if st.session_state.get('show_new_art_expander', False):
-                            hybrid_content_expander(
-                                st.session_state.art_learning, 
-                                "art", 
-                                selected_grade, 
-                                subject_type.replace(" (Uses Model Chapter Progression)", "")
-                            )
-                            if st.button("❌ Close Expander", key="close_new_art_expander"):
-                                st.session_state.show_new_art_expander = False
-                                st.rerun()
-                        else:
-                            st.error(f"❌ Failed to generate Art-Integrated Learning: {message}")
+                        # Show expander for newly generated content
+                        content_expander_panel(state_key, content_type, selected_grade, clean_subject,
+                                               f"show_new_{content_type}_expander", f"close_new_{content_type}_expander")
             
         if download_all:
-                # Combine all generated content (if any)
-                all_content_parts = []
-                
-                if st.session_state.chapter_content:
-                    all_content_parts.append("# CHAPTER CONTENT\n\n" + st.session_state.chapter_content)
-                else:
-                    st.warning("Chapter Content has not been generated yet.")
-                
-                if st.session_state.exercises:
-                    all_content_parts.append("# EXERCISES\n\n" + st.session_state.exercises)
-                else:
-                    st.warning("Exercises have not been generated yet.")
-                
-                if st.session_state.skill_activities:
-                    all_content_parts.append("# SKILL ACTIVITIES\n\n" + st.session_state.skill_activities)
-                else:
-                    st.warning("Skill Activities have not been generated yet.")
-                
-                if st.session_state.art_learning:
-                    all_content_parts.append("# ART-INTEGRATED LEARNING\n\n" + st.session_state.art_learning)
-                else:
-                    st.warning("Art-Integrated Learning has not been generated yet.")
+                # Collect all generated content (if any) as (heading, content) sections
+                all_content_sections = []
+                for state_key, heading, missing_message in [
+                    ("chapter_content", "CHAPTER CONTENT", "Chapter Content has not been generated yet."),
+                    ("exercises", "EXERCISES", "Exercises have not been generated yet."),
+                    ("skill_activities", "SKILL ACTIVITIES", "Skill Activities have not been generated yet."),
+                    ("art_learning", "ART-INTEGRATED LEARNING", "Art-Integrated Learning has not been generated yet."),
+                ]:
+                    if st.session_state[state_key]:
+                        all_content_sections.append((heading, st.session_state[state_key]))
+                    else:
+                        st.warning(missing_message)
                 
-                if all_content_parts:
-                    combined_content = "\n\n" + "\n\n".join(all_content_parts)
-                    
-                    # Create Word document with all content
-                    doc = create_word_document(combined_content)
-                    doc_io = io.BytesIO()
-                    doc.save(doc_io)
-                    doc_io.seek(0)
+                if all_content_sections:
+                    # Create Word document with all content; sections are written one by one instead of
+                    # being joined into one combined Markdown string first
+                    doc_bytes = _build_combined_docx_bytes(tuple(all_content_sections))
                     
-                    download_filename = f"complete_chapter_{uploaded_file_st.name.replace('.pdf', '.docx')}" if uploaded_file_st else f"complete_chapter_{selected_grade.replace(' ', '_')}.docx"
+                    download_filename = f"complete_chapter_{docx_suffix}"
                     st.download_button(
                         label="📥 Download Complete Chapter with All Elements as Word (.docx)",
-                        data=doc_io,
+                        data=doc_bytes,
                         file_name=download_filename,
                         mime="application/vnd.openxmlformats-officedocument.wordprocessingml.document"
                     )
@@ -8130,7 +8636,9 @@ with tab1:
     else:
         st.error("Failed to load the Model Chapter Progression. The tool cannot proceed without it.")
 
-with tab2:
+@st.fragment
+def chat_panel():
+    """Chat tab, run as a fragment so chat messages and uploads rerun only this panel instead of the whole app"""
     st.header("💬 Content Chat with EeeBee")
     st.markdown("""
     Chat with EeeBee (powered by Claude) for content development assistance! Upload PDFs for context or ask questions directly.
@@ -8174,7 +8682,7 @@ with tab2:
         if st.button("🗑️ Clear Chat History", key="clear_chat"):
             st.session_state.chat_messages = []
             st.session_state.chat_uploaded_files = []
-            st.rerun()
+            st.rerun(scope="fragment")
     
     # PDF Upload for chat context
     st.subheader("📄 Upload Documents for Context")
@@ -8186,7 +8694,13 @@ with tab2:
     )
     
     if chat_uploaded_files:
-        st.session_state.chat_uploaded_files = chat_uploaded_files
+        # Each upload is read once (by file_id); the chat keeps (name, bytes) pairs rather than UploadedFile objects
+        read_uploads = st.session_state.get("_chat_upload_bytes", {})
+        st.session_state._chat_upload_bytes = {
+            file.file_id: read_uploads.get(file.file_id) or (file.name, file.getvalue())
+            for file in chat_uploaded_files
+        }
+        st.session_state.chat_uploaded_files = list(st.session_state._chat_upload_bytes.values())
         st.success(f"📄 {len(chat_uploaded_files)} PDF(s) uploaded successfully!")
         uploaded_files_info = ""
         for file in chat_uploaded_files:
@@ -8225,7 +8739,8 @@ with tab2:
             with st.chat_message("assistant"):
                 # Create placeholder for streaming response
                 response_placeholder = st.empty()
-                response_text = ""
+                response_parts = []
+                last_render_time = 0.0
                 
                 try:
                     # Generate streaming response
@@ -8236,10 +8751,14 @@ with tab2:
                         chat_grade,
                         chat_subject
                     ):
-                        response_text += chunk
-                        response_placeholder.markdown(response_text + "▊")  # Add cursor effect
+                        response_parts.append(chunk)
+                        # Repaint throttled like the generation streams; the final render follows the loop
+                        if time.monotonic() - last_render_time >= STREAM_RENDER_INTERVAL:
+                            last_render_time = time.monotonic()
+                            response_placeholder.markdown("".join(response_parts) + "▊")  # Add cursor effect
                     
                     # Remove cursor and show final response
+                    response_text = "".join(response_parts)
                     response_placeholder.markdown(response_text)
                     
                     # Add assistant response to chat history
@@ -8249,6 +8768,12 @@ with tab2:
                     error_message = f"I encountered an error: {str(e)}. Please try asking your question again."
                     response_placeholder.markdown(error_message)
                     st.session_state.chat_messages.append({"role": "assistant", "content": error_message})
+                
+                # Keep only the newest turns, so the history shown on every rerun stays bounded
+                del st.session_state.chat_messages[:-CHAT_HISTORY_MESSAGES]
+
+with tab2:
+    chat_panel()
 
 with tab3:
     st.header("🔍 PDF Checker")
@@ -8308,7 +8833,7 @@ with tab3:
             with st.spinner("Analyzing your PDF..."):
                 try:
                     # Extract text from PDF
-                    pdf_text = extract_text_from_pdf(uploaded_pdf_checker)
+                    pdf_text = extract_text_from_pdf(uploaded_pdf_checker.getvalue())
                     
                     if not pdf_text.strip():
                         st.warning("No text found in PDF. Attempting OCR...")
@@ -8340,12 +8865,7 @@ Please provide a detailed analysis with:
 Format your response in a clear, structured manner using markdown."""
 
                         # Call AI for analysis
-                        headers = {
-                            "Authorization": f"Bearer {OPENROUTER_API_KEY}",
-                            "HTTP-Referer": YOUR_SITE_URL,
-                            "X-Title": YOUR_SITE_NAME,
-                            "Content-Type": "application/json"
-                        }
+                        headers = OPENROUTER_REQUEST_HEADERS
                         
                         response = requests.post(
                             "https://openrouter.ai/api/v1/chat/completions",
@@ -8611,12 +9131,7 @@ Make it hands-on, interactive, and age-appropriate."""
                             "content": prompt
                         }]
                         
-                        headers = {
-                            "Authorization": f"Bearer {OPENROUTER_API_KEY}",
-                            "HTTP-Referer": YOUR_SITE_URL,
-                            "X-Title": YOUR_SITE_NAME,
-                            "Content-Type": "application/json"
-                        }
+                        headers = OPENROUTER_REQUEST_HEADERS
                         
                         response = requests.post(
                             "https://openrouter.ai/api/v1/chat/completions",
@@ -8671,10 +9186,7 @@ Make it hands-on, interactive, and age-appropriate."""
                             combined_content += "="*50 + "\n"
                         
                         # Create Word document
-                        doc = create_word_document(combined_content)
-                        doc_io = io.BytesIO()
-                        doc.save(doc_io)
-                        doc_io.seek(0)
+                        doc_bytes = _build_docx_bytes(combined_content)
                         
                         col1, col2 = st.columns(2)
                         with col1:
@@ -8688,7 +9200,7 @@ Make it hands-on, interactive, and age-appropriate."""
                         with col2:
                             st.download_button(
                                 label="📥 Download All Content (Word)",
-                                data=doc_io,
+                                data=doc_bytes,
                                 file_name=f"{concept_name}_remedial_content_{grade_remedial}.docx",
                                 mime="application/vnd.openxmlformats-officedocument.wordprocessingml.document",
                                 key="download_all_word"
@@ -8698,4 +9210,7 @@ Make it hands-on, interactive, and age-appropriate."""
                 st.error(f"Error generating content: {str(e)}")
 
 st.sidebar.markdown("---")
+if st.session_state.get("running_cost_tokens"):
+    usage_totals = st.session_state.running_cost_tokens
+    st.sidebar.caption(f"Streamed tokens this session: {usage_totals['prompt_tokens']:,} prompt / {usage_totals['completion_tokens']:,} completion")
 st.sidebar.info("This app uses the Claude API via OpenRouter for AI-powered content analysis and generation.")
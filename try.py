@@ -10,6 +10,8 @@ import requests
 from threading import Event, Thread
 import time
 import re
+import string
+from types import MappingProxyType
 from typing import List, Dict, Any
 
 # --- Configuration ---
@@ -464,7 +466,17 @@ def create_word_document(improved_text_markdown):
 # Helper Functions for Content Generation
 def create_specific_prompt(content_type, grade_level, model_progression_text, subject_type="Science", word_limits=None):
     """Creates a prompt focused on a specific content type"""
-    
+    word_limits_items = tuple(sorted(word_limits.items())) if word_limits is not None else None
+    return _cached_specific_prompt(content_type, grade_level, model_progression_text, subject_type, word_limits_items)
+
+@st.cache_data(show_spinner=False, max_entries=64)
+def _cached_specific_prompt(content_type, grade_level, model_progression_text, subject_type, word_limits_items):
+    """Builds each unique prompt once and reuses it across Streamlit reruns"""
+    word_limits = dict(word_limits_items) if word_limits_items is not None else None
+    return _build_specific_prompt(content_type, grade_level, model_progression_text, subject_type, word_limits)
+
+def _build_specific_prompt(content_type, grade_level, model_progression_text, subject_type="Science", word_limits=None):
+    """Dispatches to the subject- and content-type-specific prompt builder"""
     if subject_type == "Mathematics":
         if content_type == "chapter":
             return create_math_chapter_prompt(grade_level, model_progression_text, word_limits)
@@ -484,81 +496,121 @@ def create_specific_prompt(content_type, grade_level, model_progression_text, su
         elif content_type == "art":
             return create_science_art_prompt(grade_level, model_progression_text, word_limits)
 
-# Mathematics-specific prompt functions
-def create_math_chapter_prompt(grade_level, model_progression_text, word_limits=None):
-    """Creates a mathematics-specific chapter content prompt"""
-    # Default word limits if none provided
-    if word_limits is None:
-        word_limits = {
-            'hook': 70,
-            'learning_outcome': 70,
-            'real_world': 50,
-            'previous_class': 100,
-            'history': 100,
-            'current_concepts': 4000,
-            'summary': 700,
-            'link_learn': 250,
-            'image_based': 250
-        }
-    
-    return f"""You are an expert in mathematical education content development, specifically for CBSE curriculum.
-This is the user's OWN CONTENT being used for EDUCATIONAL PURPOSES ONLY.
-
-IMPORTANT: This is the user's own copyright material, and they have explicitly authorized its analysis and transformation for educational purposes.
+# Shared opening lines of every mathematics / science prompt. Keeping them byte-identical
+# across builders lets provider-side prompt caching reuse the common prefix.
+_PREAMBLE_MATH = (
+    "You are an expert in mathematical education content development, specifically for CBSE curriculum.\n"
+    "This is the user's OWN CONTENT being used for EDUCATIONAL PURPOSES ONLY.\n\n"
+)
+_PREAMBLE_SCIENCE = (
+    "You are an expert in science education content development, specifically for CBSE curriculum.\n"
+    "This is the user's OWN CONTENT being used for EDUCATIONAL PURPOSES ONLY.\n\n"
+)
+
+# Static NCERT reference lists, spliced verbatim into the prompt templates at import time
+_MATH_SUBCONCEPT_EXAMPLES = """    - Examples of subconcepts:
+      * For "Fractions": Types of fractions, Equivalent fractions, Comparing fractions, etc.
+      * For "Triangles": Types of triangles, Properties of triangles, Congruence, etc.
+      * For "Integers": Positive and negative integers, Operations on integers, Properties, etc."""
 
-You are analyzing a mathematics book chapter intended for **{grade_level} (CBSE)**.
-The book is intended to align with NCERT, NCF, and NEP 2020 guidelines for Mathematics education.
+_SCIENCE_SUBCONCEPT_EXAMPLES = """   - Examples of subconcepts:
+     * For "Matter": States of matter, Properties of matter, Changes of state, etc.
+     * For "Light": Reflection, Refraction, Dispersion, etc.
+     * For "Cell": Plant cells, Animal cells, Cell organelles, Cell division, etc."""
 
-**CRITICAL INSTRUCTION**: The PDF may contain MULTIPLE MAJOR SECTIONS (e.g., Section 1, Section 2, Section 3, etc.). You MUST include ALL sections present in the PDF. Do NOT stop after completing just one or two sections. Generate comprehensive content for EVERY section found in the document.
+_MATH_EXERCISE_TYPES = """1. **MCQ (Multiple Choice Questions)** - at least 12 questions with detailed solutions
+2. **Short Answer Mathematical Problems** - at least 8 questions  
+3. **Long Answer Mathematical Problems** - at least 5 questions
+4. **Assertion & Reason (Mathematical)** - at least 5 questions
+5. **True/False with Mathematical Justification** - at least 10 statements
+6. **Fill in the Blanks (Mathematical)** - at least 10 questions
+7. **Match the Following (Mathematical)** - at least 2 sets with 5 matches each
+8. **Mathematical Concept Mapping** - at least 1 comprehensive exercise
+9. **Mathematical Case Studies** - at least 2 scenarios
+10. **Open-ended Mathematical Problems** - at least 3 questions"""
 
-**Model Chapter Progression and Elements (Base Structure):**
+# Mathematics-specific prompt functions
+# Default word limits for the mathematics chapter prompt; caller-supplied limits override these
+_MATH_CHAPTER_DEFAULTS = MappingProxyType({
+    'hook': 70,
+    'learning_outcome': 70,
+    'real_world': 50,
+    'previous_class': 100,
+    'history': 100,
+    'current_concepts': 4000,
+    'summary': 700,
+    'link_learn': 250,
+    'image_based': 250,
+    'exercises': 800,
+    'skill_activity': 400,
+    'stem_activity': 400
+})
+
+# Opening shared by the mathematics and science chapter prompts; subject-specific wording
+# is filled in from _MATH_CHAPTER_VARS / _SCIENCE_CHAPTER_VARS.
+_CHAPTER_HEADER_TMPL = string.Template("""${preamble}IMPORTANT: This is the user's own copyright material, and they have explicitly authorized its analysis and transformation for educational purposes.
+
+You are analyzing a ${subject_noun} book chapter intended for **${grade_level} (CBSE)**.
+The book is intended to align with NCERT, NCF, and NEP 2020 guidelines for ${subject_title} education.
+${critical_instruction}
+**Model Chapter Progression and Elements${progression_label}:**
 ---
-{model_progression_text}
+${model_progression_text}
 ---
 
-**Target Audience:** {grade_level} (CBSE Mathematics Syllabus)
+**Target Audience:** ${grade_level} (CBSE ${subject_title} Syllabus)""")
+
+_MATH_CHAPTER_VARS = MappingProxyType({
+    'preamble': _PREAMBLE_MATH,
+    'subject_noun': 'mathematics',
+    'subject_title': 'Mathematics',
+    'critical_instruction': "\n**CRITICAL INSTRUCTION**: The PDF may contain MULTIPLE MAJOR SECTIONS (e.g., Section 1, Section 2, Section 3, etc.). You MUST include ALL sections present in the PDF. Do NOT stop after completing just one or two sections. Generate comprehensive content for EVERY section found in the document.\n",
+    'progression_label': ' (Base Structure)'
+})
 
-Your task is to generate COMPREHENSIVE MATHEMATICS CHAPTER CONTENT following the Model Chapter Progression structure enhanced with mathematics-specific elements.
+_MATH_CHAPTER_INTRO = """Your task is to generate COMPREHENSIVE MATHEMATICS CHAPTER CONTENT following the Model Chapter Progression structure enhanced with mathematics-specific elements.
 
 **IMPORTANT**: If the PDF contains multiple sections (e.g., "Section 2: Place Value", "Section 3: Operations and Estimation with Large Numbers"), you MUST generate complete content for EACH section. The structure below should be applied to EACH major section in the PDF.
 
-**REQUIRED SECTIONS (Generate ALL with substantial content for EACH major section in the PDF):**
+**REQUIRED SECTIONS (Generate ALL with substantial content for EACH major section in the PDF):**"""
 
-## I. Chapter Opener
+# Mathematics chapter prompt, split into independently renderable sections.
+# Templates are parsed once at import time; only the requested sections are rendered.
+_MATH_CHAPTER_SECTIONS = {
+    'opener': string.Template("""## I. Chapter Opener
 
 1. **Chapter Title** - Engaging and mathematically focused
 
-2. **Hook (with Image Prompt)** (Target: {word_limits.get('hook', 80)} words)
+2. **Hook (with Image Prompt)** (Target: ${hook} words)
    - Create an engaging mathematical opening that captures student interest
    - Use real-life mathematical scenarios, surprising mathematical facts, or thought-provoking mathematical questions
    - Connect to students' daily mathematical experiences
    - Include a detailed image prompt for a compelling mathematical visual
 
-3. **Real-World Connection** (Target: {word_limits.get('real_world', 100)} words)
+3. **Real-World Connection** (Target: ${real_world} words)
    - Provide multiple real-world applications of the mathematical concepts
    - Show how math is used in everyday life situations
    - Include examples from technology, engineering, finance, science, etc.
    - Connect to mathematical careers and future studies
 
-4. **Learning Outcomes** (Target: {word_limits.get('learning_outcome', 125)} words)
+4. **Learning Outcomes** (Target: ${learning_outcome} words)
    - List specific, measurable mathematical learning objectives
    - Use action verbs (define, explain, calculate, apply, analyze, solve, prove, etc.)
    - Align with Bloom's Taxonomy levels for mathematics
    - Connect to CBSE mathematics curriculum standards
 
-5. **Previous Class Link** (Target: {word_limits.get('previous_class', 100)} words)
+5. **Previous Class Link** (Target: ${previous_class} words)
    - Link to prior mathematical knowledge from previous classes
    - Explain how previous concepts connect to current learning
    - Provide a brief review of essential prerequisites
 
-6. **Chapter Map/Overview** (Target: {word_limits.get('summary', 100)} words)
+6. **Chapter Map/Overview** (Target: ${summary} words)
    - Visual layout of mathematical concepts (mind map or flowchart description)
    - Show mathematical progressions and connections
 
 7. **Meet the Character (EeeBee)** (Target: 50-100 words)
-   - Introduce EeeBee as a mathematical guide/helper throughout the chapter
-
-## II. Core Content Sections (REPEAT FOR EACH MAJOR SECTION IN THE PDF)
+   - Introduce EeeBee as a mathematical guide/helper throughout the chapter"""),
+    'core': string.Template("""## II. Core Content Sections (REPEAT FOR EACH MAJOR SECTION IN THE PDF)
 
 **NOTE: If the PDF has Section 1, Section 2, Section 3, etc., create complete content for EACH section following this structure:**
 
@@ -573,11 +625,11 @@ Your task is to generate COMPREHENSIVE MATHEMATICS CHAPTER CONTENT following the
    - Explain the timeline of mathematical developments
    - Explain the history of the chapter
 
-10. **Warm-up Questions** (Target: {word_limits.get('previous_class', 100)} words)
+10. **Warm-up Questions** (Target: ${previous_class} words)
     - Create 5-7 engaging warm-up questions that connect to prior mathematical knowledge
     - Include a mix of question types (mental math, real-world problems, pattern recognition)
 
-11. **Current Concepts** (Target: {word_limits.get('current_concepts', 4000)} words per section)
+11. **Current Concepts** (Target: ${current_concepts} words per section)
     
     For each major concept in EACH section, include ALL of the following:
     
@@ -591,10 +643,7 @@ Your task is to generate COMPREHENSIVE MATHEMATICS CHAPTER CONTENT following the
     - **IMPORTANT**: Identify and include ALL subconcepts present in NCERT books for this topic
     - Each main concept typically has 2-5 subconcepts in NCERT mathematics books
     - Subconcepts should be clearly labeled and integrated within the main concept
-    - Examples of subconcepts:
-      * For "Fractions": Types of fractions, Equivalent fractions, Comparing fractions, etc.
-      * For "Triangles": Types of triangles, Properties of triangles, Congruence, etc.
-      * For "Integers": Positive and negative integers, Operations on integers, Properties, etc.
+""" + _MATH_SUBCONCEPT_EXAMPLES + """
     - Each subconcept should include:
       * Definition and explanation 
       * Examples and illustrations
@@ -663,36 +712,34 @@ Your task is to generate COMPREHENSIVE MATHEMATICS CHAPTER CONTENT following the
     - Present thought-provoking mathematical questions or scenarios
     
     **M. Mental Mathematics** (Target: 170 words per concept)
-    - Provide mental mathematics strategies and techniques
-
-## III. Special Features (Apply to the ENTIRE chapter, not just one section)
+    - Provide mental mathematics strategies and techniques"""),
+    'special_features': string.Template("""## III. Special Features (Apply to the ENTIRE chapter, not just one section)
 
 12. **Common Mathematical Misconceptions** (Target: 250 words)
     - 2-3 misconceptions per mathematical concept
     - Correct early mathematical misunderstandings
 
-13. **21st Century Skills Focus** (Target: {word_limits.get('skill_activity', 350)} words)
+13. **21st Century Skills Focus** (Target: ${skill_activity} words)
     - Mathematical Design Challenge
     - Mathematical Debate
     - Collaborate & Create
 
-14. **Differentiation** (Target: {word_limits.get('exercises', 250)} words)
+14. **Differentiation** (Target: ${exercises} words)
     - Challenge sections for advanced mathematical learners
     - Support sections for mathematical revision
 
-15. **Technology Integration** (Target: {word_limits.get('stem_activity', 180)} words)
+15. **Technology Integration** (Target: ${stem_activity} words)
     - Mathematical software and tools
     - Digital mathematical simulations
 
 16. **Character Integration** (Throughout)
-    - EeeBee appears throughout to ask mathematical questions
+    - EeeBee appears throughout to ask mathematical questions"""),
+    'wrap_up': string.Template("""## IV. Chapter Wrap-Up (For the ENTIRE chapter)
 
-## IV. Chapter Wrap-Up (For the ENTIRE chapter)
-
-17. **Self-Assessment Checklist** (Target: {word_limits.get('exercises', 220)} words)
+17. **Self-Assessment Checklist** (Target: ${exercises} words)
     - Create a comprehensive self-assessment checklist
 
-18. **Chapter-wise Miscellaneous Exercise** (Target: {word_limits.get('exercises', 550)} words)
+18. **Chapter-wise Miscellaneous Exercise** (Target: ${exercises} words)
     - MCQs (5 questions)
     - Short/Long Answer (3 short, 2 long)
     - Open-ended Mathematical Problems (2 questions)
@@ -703,11 +750,12 @@ Your task is to generate COMPREHENSIVE MATHEMATICS CHAPTER CONTENT following the
     - Mathematical Puzzle (1 puzzle)
     - Thinking Based Activities
 
-19. **Apply Your Mathematical Knowledge** (Target: {word_limits.get('skill_activity', 280)} words)
+19. **Apply Your Mathematical Knowledge** (Target: ${skill_activity} words)
     - Real-world mathematical application tasks
-    - Project-based mathematical problems
+    - Project-based mathematical problems"""),
+}
 
-**CONTENT REQUIREMENTS:**
+_MATH_CHAPTER_FOOTER = """**CONTENT REQUIREMENTS:**
 * **CRITICAL**: Include ALL major sections from the PDF (e.g., if there are Sections 1, 2, and 3, generate complete content for ALL three)
 * **Mathematical Accuracy**: Ensure all mathematical content is accurate
 * **Clear Mathematical Language**: Use precise mathematical terminology
@@ -719,36 +767,38 @@ Your task is to generate COMPREHENSIVE MATHEMATICS CHAPTER CONTENT following the
 Provide ONLY the comprehensive mathematics chapter content in Markdown format. Remember to include EVERY section found in the PDF document.
 """
 
-def create_math_exercises_prompt(grade_level, model_progression_text, word_limits=None):
-    """Creates a mathematics-specific exercises prompt with dynamic word limits"""
-    if word_limits is None:
-        word_limits = {
-            'exercises': 800
-        }
-    return f"""You are an expert in mathematical education content development, specifically for CBSE curriculum.
-This is the user's OWN CONTENT being used for EDUCATIONAL PURPOSES ONLY.
+def create_math_chapter_prompt(grade_level, model_progression_text, word_limits=None, sections=None):
+    """Creates a mathematics-specific chapter content prompt.
 
-You are analyzing a mathematics book chapter intended for **{grade_level} (CBSE)**.
+    sections optionally restricts the output to a subset of
+    _MATH_CHAPTER_SECTIONS keys; all sections are included by default.
+    """
+    params = _MATH_CHAPTER_DEFAULTS | (word_limits or {})
+    params['grade_level'] = grade_level
+    params['model_progression_text'] = model_progression_text
+    parts = [_CHAPTER_HEADER_TMPL.substitute(_MATH_CHAPTER_VARS, **params), _MATH_CHAPTER_INTRO]
+    for key, section_tmpl in _MATH_CHAPTER_SECTIONS.items():
+        if sections is None or key in sections:
+            parts.append(section_tmpl.substitute(params))
+    parts.append(_MATH_CHAPTER_FOOTER)
+    return "\n\n".join(parts)
+
+_MATH_EXERCISES_DEFAULTS = MappingProxyType({
+    'exercises': 800
+})
+
+_MATH_EXERCISES_TMPL = string.Template(_PREAMBLE_MATH + """You are analyzing a mathematics book chapter intended for **${grade_level} (CBSE)**.
 
 **Model Chapter Progression and Elements:**
 ---
-{model_progression_text}
+${model_progression_text}
 ---
 
 Your task is to generate COMPREHENSIVE MATHEMATICS EXERCISES based on the chapter content in the PDF.
-**Target Total Word Count for All Exercises**: {word_limits.get('exercises', 800)} words
+**Target Total Word Count for All Exercises**: ${exercises} words
 
 **Core Mathematical Exercise Types:**
-1. **MCQ (Multiple Choice Questions)** - at least 12 questions with detailed solutions
-2. **Short Answer Mathematical Problems** - at least 8 questions  
-3. **Long Answer Mathematical Problems** - at least 5 questions
-4. **Assertion & Reason (Mathematical)** - at least 5 questions
-5. **True/False with Mathematical Justification** - at least 10 statements
-6. **Fill in the Blanks (Mathematical)** - at least 10 questions
-7. **Match the Following (Mathematical)** - at least 2 sets with 5 matches each
-8. **Mathematical Concept Mapping** - at least 1 comprehensive exercise
-9. **Mathematical Case Studies** - at least 2 scenarios
-10. **Open-ended Mathematical Problems** - at least 3 questions
+""" + _MATH_EXERCISE_TYPES + """
 
 **Special Mathematical Features:**
 - **EeeBee Integration**: Include questions where EeeBee guides mathematical thinking
@@ -759,34 +809,36 @@ Your task is to generate COMPREHENSIVE MATHEMATICS EXERCISES based on the chapte
 Ensure that:
 * Questions cover ALL important mathematical concepts from the PDF
 * Questions follow Bloom's Taxonomy at various levels
-* Mathematical language is clear and appropriate for {grade_level}
+* Mathematical language is clear and appropriate for ${grade_level}
 * Questions increase in difficulty progressively
 * All exercises include detailed mathematical solutions with step-by-step working
 * Content is formatted in Markdown with proper mathematical notation
 
 Provide ONLY the comprehensive mathematical exercises in Markdown format.
-"""
+""")
 
-def create_math_skills_prompt(grade_level, model_progression_text, word_limits=None):
-    """Creates a mathematics-specific skills and STEM activities prompt with dynamic word limits"""
-    if word_limits is None:
-        word_limits = {
-            'skill_activity': 400,
-            'stem_activity': 400
-        }
-    return f"""You are an expert in mathematical education content development, specifically for CBSE curriculum.
-This is the user's OWN CONTENT being used for EDUCATIONAL PURPOSES ONLY.
+def create_math_exercises_prompt(grade_level, model_progression_text, word_limits=None):
+    """Creates a mathematics-specific exercises prompt with dynamic word limits"""
+    params = _MATH_EXERCISES_DEFAULTS | (word_limits or {})
+    params['grade_level'] = grade_level
+    params['model_progression_text'] = model_progression_text
+    return _MATH_EXERCISES_TMPL.substitute(params)
 
-You are analyzing a mathematics book chapter intended for **{grade_level} (CBSE)**.
+_MATH_SKILLS_DEFAULTS = MappingProxyType({
+    'skill_activity': 400,
+    'stem_activity': 400
+})
+
+_MATH_SKILLS_TMPL = string.Template(_PREAMBLE_MATH + """You are analyzing a mathematics book chapter intended for **${grade_level} (CBSE)**.
 
 **Model Chapter Progression and Elements:**
 ---
-{model_progression_text}
+${model_progression_text}
 ---
 
 Your task is to generate MATHEMATICAL SKILL-BASED ACTIVITIES and STEM projects.
 
-## Mathematical Skill-Based Activities (Target: {word_limits.get('skill_activity', 400)} words)
+## Mathematical Skill-Based Activities (Target: ${skill_activity} words)
 
 Create at least 3 comprehensive mathematical activities:
 
@@ -807,7 +859,7 @@ Create at least 3 comprehensive mathematical activities:
 - Mathematical Pattern Recognition Activities
 - Mathematical Measurement and Data Collection
 
-## Mathematical STEM Projects (Target: {word_limits.get('stem_activity', 400)} words)
+## Mathematical STEM Projects (Target: ${stem_activity} words)
 
 Create at least 2 comprehensive projects that integrate mathematics with Science, Technology, and Engineering:
 
@@ -830,26 +882,28 @@ Create at least 2 comprehensive projects that integrate mathematics with Science
 Format the content in Markdown with proper mathematical notation.
 
 Provide ONLY the Mathematical Skill Activities and STEM Projects in Markdown format.
-"""
+""")
 
-def create_math_art_prompt(grade_level, model_progression_text, word_limits=None):
-    """Creates a mathematics-specific art integration prompt with dynamic word limits"""
-    if word_limits is None:
-        word_limits = {
-            'art_learning': 400
-        }
-    return f"""You are an expert in mathematical education content development, specifically for CBSE curriculum.
-This is the user's OWN CONTENT being used for EDUCATIONAL PURPOSES ONLY.
+def create_math_skills_prompt(grade_level, model_progression_text, word_limits=None):
+    """Creates a mathematics-specific skills and STEM activities prompt with dynamic word limits"""
+    params = _MATH_SKILLS_DEFAULTS | (word_limits or {})
+    params['grade_level'] = grade_level
+    params['model_progression_text'] = model_progression_text
+    return _MATH_SKILLS_TMPL.substitute(params)
+
+_MATH_ART_DEFAULTS = MappingProxyType({
+    'art_learning': 400
+})
 
-You are analyzing a mathematics book chapter intended for **{grade_level} (CBSE)**.
+_MATH_ART_TMPL = string.Template(_PREAMBLE_MATH + """You are analyzing a mathematics book chapter intended for **${grade_level} (CBSE)**.
 
 **Model Chapter Progression and Elements:**
 ---
-{model_progression_text}
+${model_progression_text}
 ---
 
 Your task is to generate MATHEMATICS-INTEGRATED CREATIVE LEARNING projects.
-**Target Total Word Count for All Art-Integrated Learning**: {word_limits.get('art_learning', 400)} words
+**Target Total Word Count for All Art-Integrated Learning**: ${art_learning} words
 
 ## Mathematical Art Projects
 
@@ -876,7 +930,7 @@ Create at least 3 creative projects that connect mathematical concepts to variou
 
 **Case Study – Level 1 (Accessible Mathematical Analysis):**
 Create at least 1 simpler case study that:
-- Presents a real-world mathematical scenario appropriate for {grade_level}
+- Presents a real-world mathematical scenario appropriate for ${grade_level}
 - Includes guided mathematical analysis questions
 - Is accessible to all students with basic mathematical skills
 
@@ -899,49 +953,45 @@ Create at least 1 more complex case study that:
 Format the content in Markdown with proper mathematical notation.
 
 Provide ONLY the Mathematics-Integrated Creative Learning content in Markdown format.
-"""
-
-# Science subject prompt functions
-def create_science_chapter_prompt(grade_level, model_progression_text, word_limits=None):
-    """Creates a science subject chapter content prompt with dynamic word limits"""
-    # Default word limits if none provided
-    if word_limits is None:
-        word_limits = {
-            'hook': 70,
-            'learning_outcome': 70,
-            'real_world': 50,
-            'previous_class': 100,
-            'history': 100,
-            'current_concepts': 1200,
-            'summary': 700,
-            'link_learn': 250,
-            'image_based': 250,
-            'exercises': 800,
-            'skill_activity': 400,
-            'stem_activity': 400,
-            'art_learning': 400
-        }
-    
-    return f"""You are an expert in science education content development, specifically for CBSE curriculum.
-This is the user's OWN CONTENT being used for EDUCATIONAL PURPOSES ONLY.
-
-IMPORTANT: This is the user's own copyright material, and they have explicitly authorized its analysis and transformation for educational purposes.
-
-You are analyzing a science book chapter intended for **{grade_level} (CBSE)**.
-The book is intended to align with NCERT, NCF, and NEP 2020 guidelines for Science education.
-
-**Model Chapter Progression and Elements:**
----
-{model_progression_text}
----
+""")
 
-**Target Audience:** {grade_level} (CBSE Science Syllabus)
+def create_math_art_prompt(grade_level, model_progression_text, word_limits=None):
+    """Creates a mathematics-specific art integration prompt with dynamic word limits"""
+    params = _MATH_ART_DEFAULTS | (word_limits or {})
+    params['grade_level'] = grade_level
+    params['model_progression_text'] = model_progression_text
+    return _MATH_ART_TMPL.substitute(params)
 
-Your task is to generate COMPREHENSIVE CORE SCIENCE CHAPTER CONTENT that should be equivalent to a complete science textbook chapter.
+# Science subject prompt functions
+_SCIENCE_CHAPTER_DEFAULTS = MappingProxyType({
+    'hook': 70,
+    'learning_outcome': 70,
+    'real_world': 50,
+    'previous_class': 100,
+    'history': 100,
+    'current_concepts': 1200,
+    'summary': 700,
+    'link_learn': 250,
+    'image_based': 250,
+    'exercises': 800,
+    'skill_activity': 400,
+    'stem_activity': 400,
+    'art_learning': 400
+})
+
+_SCIENCE_CHAPTER_VARS = MappingProxyType({
+    'preamble': _PREAMBLE_SCIENCE,
+    'subject_noun': 'science',
+    'subject_title': 'Science',
+    'critical_instruction': '',
+    'progression_label': ''
+})
+
+_SCIENCE_CHAPTER_BODY_TMPL = string.Template("""Your task is to generate COMPREHENSIVE CORE SCIENCE CHAPTER CONTENT that should be equivalent to a complete science textbook chapter.
 
 **REQUIRED SECTIONS (Generate ALL with substantial content):**
 
-1. **Current Concepts** (Target: {word_limits.get('current_concepts', 1200)} words)
+1. **Current Concepts** (Target: ${current_concepts} words)
    
    For each major scientific concept in the chapter, include ALL of the following:
    
@@ -955,10 +1005,7 @@ Your task is to generate COMPREHENSIVE CORE SCIENCE CHAPTER CONTENT that should
    - **IMPORTANT**: Identify and include ALL subconcepts present in NCERT science books for this topic
    - Each main concept typically has 2-5 subconcepts in NCERT science books
    - Subconcepts should be clearly labeled and integrated within the main concept
-   - Examples of subconcepts:
-     * For "Matter": States of matter, Properties of matter, Changes of state, etc.
-     * For "Light": Reflection, Refraction, Dispersion, etc.
-     * For "Cell": Plant cells, Animal cells, Cell organelles, Cell division, etc.
+""" + _SCIENCE_SUBCONCEPT_EXAMPLES + """
    - Each subconcept should include:
      * Definition and explanation 
      * Scientific examples and illustrations
@@ -1009,46 +1056,46 @@ Your task is to generate COMPREHENSIVE CORE SCIENCE CHAPTER CONTENT that should
    - Mark concepts which are exactly coming from the PDF and give some extra concepts for higher level understanding
    - Make sure there is no repetition of concepts
 
-2. **Hook (with Image Prompt)** (Target: {word_limits.get('hook', 80)} words)
+2. **Hook (with Image Prompt)** (Target: ${hook} words)
    - Create an engaging scientific opening that captures student interest
    - Use scientific storytelling, surprising scientific facts, or thought-provoking scientific questions
    - Connect to students' daily scientific experiences or current scientific events
    - Include a detailed image prompt for a compelling scientific visual
 
-3. **Learning Outcome** (Target: {word_limits.get('learning_outcome', 70)} words)
+3. **Learning Outcome** (Target: ${learning_outcome} words)
    - List specific, measurable scientific learning objectives
    - Use action verbs (analyze, evaluate, create, experiment, investigate, etc.)
    - Align with Bloom's Taxonomy levels for science education
    - Connect to CBSE science curriculum standards
 
-4. **Real World Connection** (Target: {word_limits.get('real_world', 50)} words)
+4. **Real World Connection** (Target: ${real_world} words)
    - Provide multiple real-world applications of the scientific concepts
    - Include current examples from technology, environment, health, space science, etc.
    - Explain how the scientific concepts impact daily life
    - Connect to scientific careers and future studies
 
-5. **Previous Class Concept** (Target: {word_limits.get('previous_class', 100)} words)
+5. **Previous Class Concept** (Target: ${previous_class} words)
    - Give the scientific concept name and the previous class it was studied in according to NCERT science textbooks
    - Link to prior scientific knowledge and foundations
 
-6. **History** (Target: {word_limits.get('history', 100)} words)
+6. **History** (Target: ${history} words)
    - Provide comprehensive historical background of scientific discoveries
    - Include key scientists, inventors, or scientific figures and their contributions
    - Explain the timeline of scientific developments and discoveries
    - Connect historical scientific context to modern understanding
 
-7. **Summary** (Target: {word_limits.get('summary', 700)} words)
+7. **Summary** (Target: ${summary} words)
    - Create detailed concept-wise scientific summaries (not just one overall summary)
    - Include key scientific points, formulas, and important scientific facts
    - Organize by individual scientific concepts covered in the chapter
    - Provide clear, concise explanations that reinforce scientific learning
 
-8. **Link and Learn Based Question** (Target: {word_limits.get('link_learn', 250)} words)
+8. **Link and Learn Based Question** (Target: ${link_learn} words)
    - Create 3-5 questions that connect different scientific concepts
    - Include questions that link to other science subjects or real-world scientific scenarios
    - Provide detailed explanations for the scientific connections
 
-9. **Image Based Question** (Target: {word_limits.get('image_based', 250)} words)
+9. **Image Based Question** (Target: ${image_based} words)
    - Create 3-5 questions based on scientific images/diagrams from the chapter
    - Include detailed scientific image descriptions if creating new image prompts
    - Ensure questions test scientific understanding, not just observation
@@ -1057,7 +1104,7 @@ Your task is to generate COMPREHENSIVE CORE SCIENCE CHAPTER CONTENT that should
 * **Scientific Accuracy**: Ensure all scientific content is accurate and up-to-date
 * **Detailed Scientific Explanations**: Each scientific concept should be explained thoroughly with multiple paragraphs
 * **Scientific Examples and Illustrations**: Include numerous scientific examples, case studies, and practical applications
-* **Age-Appropriate Scientific Language**: Use scientific vocabulary suitable for {grade_level} but don't oversimplify
+* **Age-Appropriate Scientific Language**: Use scientific vocabulary suitable for ${grade_level} but don't oversimplify
 * **Engaging Scientific Tone**: Write in an engaging, conversational style that maintains student interest in science
 * **Clear Scientific Structure**: Use proper headings, subheadings, and formatting for science content
 * **Visual Integration**: Include detailed image prompts for scientific diagrams, experiments, and illustrations
@@ -1081,26 +1128,31 @@ Your task is to generate COMPREHENSIVE CORE SCIENCE CHAPTER CONTENT that should
 Analyze the PDF document thoroughly and create improved scientific content that expands significantly on what's provided while maintaining all original concept names and terminology.
 
 Provide ONLY the comprehensive science chapter content in Markdown format. Do not include exercises, activities, or art projects.
-"""
+""")
 
-def create_science_exercises_prompt(grade_level, model_progression_text, word_limits=None):
-    """Creates a science subject exercises prompt with dynamic word limits"""
-    if word_limits is None:
-        word_limits = {
-            'exercises': 800
-        }
-    return f"""You are an expert in science education content development, specifically for CBSE curriculum.
-This is the user's OWN CONTENT being used for EDUCATIONAL PURPOSES ONLY.
+def create_science_chapter_prompt(grade_level, model_progression_text, word_limits=None):
+    """Creates a science subject chapter content prompt with dynamic word limits"""
+    params = _SCIENCE_CHAPTER_DEFAULTS | (word_limits or {})
+    params['grade_level'] = grade_level
+    params['model_progression_text'] = model_progression_text
+    return "\n\n".join([
+        _CHAPTER_HEADER_TMPL.substitute(_SCIENCE_CHAPTER_VARS, **params),
+        _SCIENCE_CHAPTER_BODY_TMPL.substitute(params),
+    ])
 
-You are analyzing a science book chapter intended for **{grade_level} (CBSE)**.
+_SCIENCE_EXERCISES_DEFAULTS = MappingProxyType({
+    'exercises': 800
+})
+
+_SCIENCE_EXERCISES_TMPL = string.Template(_PREAMBLE_SCIENCE + """You are analyzing a science book chapter intended for **${grade_level} (CBSE)**.
 
 **Model Chapter Progression and Elements:**
 ---
-{model_progression_text}
+${model_progression_text}
 ---
 
 Your task is to generate COMPREHENSIVE SCIENCE EXERCISES based on the chapter content in the PDF.
-**Target Total Word Count for All Exercises**: {word_limits.get('exercises', 800)} words
+**Target Total Word Count for All Exercises**: ${exercises} words
 
 **Core Science Exercise Types:**
 
@@ -1125,7 +1177,7 @@ Create the following science exercise types:
 Ensure that:
 * Questions cover ALL important scientific concepts from the PDF
 * Questions follow Bloom's Taxonomy at various levels (Remember, Understand, Apply, Analyze, Evaluate, Create)
-* Scientific language is clear and appropriate for {grade_level}
+* Scientific language is clear and appropriate for ${grade_level}
 * Questions increase in difficulty from basic scientific recall to higher-order scientific thinking
 * All exercises include correct answers or model scientific solutions
 * Content is formatted in Markdown with proper scientific notation
@@ -1135,28 +1187,30 @@ Ensure that:
 Do NOT directly copy questions from the PDF. Create new, original scientific questions based on the content.
 
 Provide ONLY the comprehensive science exercises in Markdown format.
-"""
+""")
 
-def create_science_skills_prompt(grade_level, model_progression_text, word_limits=None):
-    """Creates a science subject skills and STEM activities prompt with dynamic word limits"""
-    if word_limits is None:
-        word_limits = {
-            'skill_activity': 400,
-            'stem_activity': 400
-        }
-    return f"""You are an expert in science education content development, specifically for CBSE curriculum.
-This is the user's OWN CONTENT being used for EDUCATIONAL PURPOSES ONLY.
+def create_science_exercises_prompt(grade_level, model_progression_text, word_limits=None):
+    """Creates a science subject exercises prompt with dynamic word limits"""
+    params = _SCIENCE_EXERCISES_DEFAULTS | (word_limits or {})
+    params['grade_level'] = grade_level
+    params['model_progression_text'] = model_progression_text
+    return _SCIENCE_EXERCISES_TMPL.substitute(params)
 
-You are analyzing a science book chapter intended for **{grade_level} (CBSE)**.
+_SCIENCE_SKILLS_DEFAULTS = MappingProxyType({
+    'skill_activity': 400,
+    'stem_activity': 400
+})
+
+_SCIENCE_SKILLS_TMPL = string.Template(_PREAMBLE_SCIENCE + """You are analyzing a science book chapter intended for **${grade_level} (CBSE)**.
 
 **Model Chapter Progression and Elements:**
 ---
-{model_progression_text}
+${model_progression_text}
 ---
 
 Your task is to generate SCIENCE SKILL-BASED ACTIVITIES and STEM projects based on the chapter content in the PDF.
 
-## Science Skill-Based Activities (Target: {word_limits.get('skill_activity', 400)} words)
+## Science Skill-Based Activities (Target: ${skill_activity} words)
 
 Create at least 3 hands-on science activities that:
 * Reinforce the key scientific concepts from the chapter
@@ -1176,7 +1230,7 @@ Create at least 3 hands-on science activities that:
 7. **Scientific Reflection Questions**
 8. **Expected Scientific Outcomes and Learning**
 
-## Science STEM Projects (Target: {word_limits.get('stem_activity', 400)} words)
+## Science STEM Projects (Target: ${stem_activity} words)
 
 Create at least 2 comprehensive STEM projects that:
 * Integrate Science, Technology, Engineering and Mathematics
@@ -1216,26 +1270,28 @@ For each activity/project, include:
 Format the content in Markdown with proper scientific headings, lists, and organization.
 
 Provide ONLY the Science Skill Activities and STEM Projects in Markdown format.
-"""
+""")
 
-def create_science_art_prompt(grade_level, model_progression_text, word_limits=None):
-    """Creates a science subject art integration prompt with dynamic word limits"""
-    if word_limits is None:
-        word_limits = {
-            'art_learning': 400
-        }
-    return f"""You are an expert in science education content development, specifically for CBSE curriculum.
-This is the user's OWN CONTENT being used for EDUCATIONAL PURPOSES ONLY.
+def create_science_skills_prompt(grade_level, model_progression_text, word_limits=None):
+    """Creates a science subject skills and STEM activities prompt with dynamic word limits"""
+    params = _SCIENCE_SKILLS_DEFAULTS | (word_limits or {})
+    params['grade_level'] = grade_level
+    params['model_progression_text'] = model_progression_text
+    return _SCIENCE_SKILLS_TMPL.substitute(params)
 
-You are analyzing a science book chapter intended for **{grade_level} (CBSE)**.
+_SCIENCE_ART_DEFAULTS = MappingProxyType({
+    'art_learning': 400
+})
+
+_SCIENCE_ART_TMPL = string.Template(_PREAMBLE_SCIENCE + """You are analyzing a science book chapter intended for **${grade_level} (CBSE)**.
 
 **Model Chapter Progression and Elements:**
 ---
-{model_progression_text}
+${model_progression_text}
 ---
 
 Your task is to generate SCIENCE-INTEGRATED CREATIVE LEARNING projects based on the chapter content in the PDF.
-**Target Total Word Count for All Art-Integrated Learning**: {word_limits.get('art_learning', 400)} words
+**Target Total Word Count for All Art-Integrated Learning**: ${art_learning} words
 
 ## Science Art Projects
 
@@ -1262,7 +1318,7 @@ Create at least 3 creative projects that connect scientific concepts to various
 
 **Case Study – Level 1 (Accessible Scientific Analysis):**
 Create at least 1 simpler case study that:
-- Presents a real-world scientific scenario appropriate for {grade_level}
+- Presents a real-world scientific scenario appropriate for ${grade_level}
 - Includes guided scientific analysis questions
 - Is accessible to all students with basic scientific knowledge
 - Connects to current scientific events or discoveries
@@ -1303,7 +1359,37 @@ For each project/case study, include:
 Format the content in Markdown with proper scientific and artistic headings, lists, and organization.
 
 Provide ONLY the Science-Integrated Creative Learning content in Markdown format.
-"""
+""")
+
+def create_science_art_prompt(grade_level, model_progression_text, word_limits=None):
+    """Creates a science subject art integration prompt with dynamic word limits"""
+    params = _SCIENCE_ART_DEFAULTS | (word_limits or {})
+    params['grade_level'] = grade_level
+    params['model_progression_text'] = model_progression_text
+    return _SCIENCE_ART_TMPL.substitute(params)
+
+def _template_fields(tmpl):
+    """Returns the placeholder names referenced by a string.Template."""
+    return {m.group('named') or m.group('braced') for m in tmpl.pattern.finditer(tmpl.template)} - {None}
+
+# Every placeholder in a prompt template must be backed by a declared default, so a missing
+# word-limit key fails loudly at import instead of silently rendering an ad-hoc fallback.
+_PROMPT_CONTEXT_FIELDS = {'grade_level', 'model_progression_text'}
+_PROMPT_TEMPLATE_DEFAULTS = [(_CHAPTER_HEADER_TMPL, _MATH_CHAPTER_VARS), (_CHAPTER_HEADER_TMPL, _SCIENCE_CHAPTER_VARS)]
+_PROMPT_TEMPLATE_DEFAULTS += [(tmpl, _MATH_CHAPTER_DEFAULTS) for tmpl in _MATH_CHAPTER_SECTIONS.values()]
+_PROMPT_TEMPLATE_DEFAULTS += [
+    (_MATH_EXERCISES_TMPL, _MATH_EXERCISES_DEFAULTS),
+    (_MATH_SKILLS_TMPL, _MATH_SKILLS_DEFAULTS),
+    (_MATH_ART_TMPL, _MATH_ART_DEFAULTS),
+    (_SCIENCE_CHAPTER_BODY_TMPL, _SCIENCE_CHAPTER_DEFAULTS),
+    (_SCIENCE_EXERCISES_TMPL, _SCIENCE_EXERCISES_DEFAULTS),
+    (_SCIENCE_SKILLS_TMPL, _SCIENCE_SKILLS_DEFAULTS),
+    (_SCIENCE_ART_TMPL, _SCIENCE_ART_DEFAULTS),
+]
+for _tmpl, _defaults in _PROMPT_TEMPLATE_DEFAULTS:
+    _missing = _template_fields(_tmpl) - _PROMPT_CONTEXT_FIELDS - set(_defaults)
+    if _missing:
+        raise ValueError(f"Prompt template uses word limits without defaults: {sorted(_missing)}")
 
 def generate_specific_content(content_type, pdf_bytes, pdf_filename, grade_level, model_progression_text, subject_type="Science", word_limits=None, use_chunked=False, use_openrouter_method=False):
     """Generates specific content based on content type"""